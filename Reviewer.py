@@ -3,7 +3,9 @@ import os
 from dotenv import load_dotenv
 from openai import OpenAI
 import textwrap
-import time
+from llm_client import agenerate, call_limited, estimate_tokens
+from retry import retry_call
+from llm_cache import cached_call
 
 load_dotenv(override=True)
 openai_api_key = os.getenv('OPENAI_API_KEY')
@@ -11,7 +13,8 @@ openai_api_key = os.getenv('OPENAI_API_KEY')
 if not openai_api_key:
     raise EnvironmentError(" OPENAI_API_KEY not set in .env")
 
-openai = OpenAI(api_key=openai_api_key)
+# Retries are handled by retry_call; the SDK's own would stack with them
+openai = OpenAI(api_key=openai_api_key, max_retries=0)
 
 # latest_version_raw = get_latest_version("chapter1", "raw")
 # latest_version_rewritten = get_latest_version("chapter1", "rewritten")
@@ -31,7 +34,10 @@ openai = OpenAI(api_key=openai_api_key)
 # if not raw_data or not rewritten_data:
 #     raise ValueError("Failed to fetch both raw and rewritten versions.")
 
-def reviwer(raw_data,rewritten_data):
+REVIEWER_MODEL = "gpt-4o-mini"
+
+def build_reviewer_prompts(raw_data, rewritten_data):
+    """Return the (system, user) prompts for reviewing a rewritten chapter."""
     raw_text = raw_data["content"]
     rewritten_text = rewritten_data["content"]
     chapter_title = raw_data["metadata"].get("chapter_title", "Untitled")
@@ -103,20 +109,37 @@ def reviwer(raw_data,rewritten_data):
         
     """)
 
+    return REVIEWER_SYSTEM_PROMPT, REVIEWER_USER_PROMPT
 
-    # --- STEP 3: Call OpenAI ---
-    response = openai.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=[
-            {"role": "system", "content": REVIEWER_SYSTEM_PROMPT},
-            {"role": "user", "content": REVIEWER_USER_PROMPT}
-        ]
-    )
+def reviwer(raw_data,rewritten_data, use_cache: bool = True):
+    REVIEWER_SYSTEM_PROMPT, REVIEWER_USER_PROMPT = build_reviewer_prompts(raw_data, rewritten_data)
 
-    result = response.choices[0].message.content
+    # --- STEP 3: Call OpenAI ---
+    def generate():
+        response = retry_call(
+            "openai",
+            call_limited,
+            "openai",
+            estimate_tokens(REVIEWER_SYSTEM_PROMPT, REVIEWER_USER_PROMPT),
+            openai.chat.completions.create,
+            model=REVIEWER_MODEL,
+            messages=[
+                {"role": "system", "content": REVIEWER_SYSTEM_PROMPT},
+                {"role": "user", "content": REVIEWER_USER_PROMPT}
+            ]
+        )
+        return response.choices[0].message.content
+
+    result = cached_call("openai", REVIEWER_MODEL, REVIEWER_SYSTEM_PROMPT, REVIEWER_USER_PROMPT,
+                         generate, use_cache=use_cache)
 
     return result
 
+async def reviwer_async(raw_data, rewritten_data, provider: str = "openai", use_cache: bool = True):
+    """Async reviewer routed through the shared LLM client's concurrency limits."""
+    system_prompt, user_prompt = build_reviewer_prompts(raw_data, rewritten_data)
+    return await agenerate(provider, REVIEWER_MODEL, system_prompt, user_prompt, use_cache)
+
 
 # reviewer_feedback = reviwer(raw_data, rewritten_data)
 # print("AI Verification Result:\n")
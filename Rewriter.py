@@ -3,7 +3,10 @@ import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 import textwrap
-import time
+import asyncio
+from llm_client import agenerate, call_limited, estimate_tokens, stream_generate, open_gemini_stream
+from retry import retry_call
+from llm_cache import cached_call
 
 # Load environment variables
 # load_dotenv(override=True)
@@ -25,7 +28,10 @@ import time
 
 
 
-def rewriter(raw_data, special_instructions: str = "None"):
+REWRITER_MODEL = 'gemini-1.5-flash'
+
+def build_rewriter_prompts(raw_data, special_instructions: str = "None"):
+    """Return the (system, user) prompts for rewriting a chapter."""
     book_title = raw_data["metadata"].get("book_title", "Untitled")
     author = raw_data["metadata"].get("author", "Untitled")
     chapter_title = raw_data["metadata"].get("chapter_title", "Untitled")
@@ -64,35 +70,157 @@ def rewriter(raw_data, special_instructions: str = "None"):
         {special_instructions}
     """)
 
+    return REWRITER_SYSTEM_PROMPT, REWRITER_USER_PROMPT
+
+def build_rewritten_data(raw_data, text):
+    """Shape generated text like the chapter data the pipeline saves."""
+    screenshot_path = raw_data["metadata"].get("screenshot_path")
+    return {
+        "book_title": raw_data["metadata"].get("book_title", "Untitled"),
+        "author": raw_data["metadata"].get("author", "Untitled"),
+        "chapter_info": raw_data["metadata"].get("chapter_info", ""),
+        "chapter_title": f"Rewritten: {raw_data['metadata'].get('chapter_title', 'Untitled')}",
+        "content": text,
+        "source_url": raw_data["metadata"].get("source_url", ""),
+        **({"screenshot_path": screenshot_path} if screenshot_path else {})
+    }
+
+def rewriter(raw_data, special_instructions: str = "None", use_cache: bool = True):
+    REWRITER_SYSTEM_PROMPT, REWRITER_USER_PROMPT = build_rewriter_prompts(raw_data, special_instructions)
+
     model = genai.GenerativeModel(
-        model_name='gemini-1.5-flash',
+        model_name=REWRITER_MODEL,
         system_instruction=REWRITER_SYSTEM_PROMPT
     )
 
-    try:
-        response = model.generate_content(REWRITER_USER_PROMPT)
+    def generate():
+        response = retry_call("gemini", call_limited, "gemini",
+                              estimate_tokens(REWRITER_SYSTEM_PROMPT, REWRITER_USER_PROMPT),
+                              model.generate_content, REWRITER_USER_PROMPT)
         if not response.text:
             raise RuntimeError("Gemini failed to generate content")
-        
-        rewritten_data = {
-            "book_title": book_title,
-            "author": author,
-            "chapter_info": raw_data["metadata"].get("chapter_info", ""),
-            "chapter_title": f"Rewritten: {chapter_title}",
-            "content": response.text,
-            "source_url": raw_data["metadata"].get("source_url", "")
-        }
-        
-        return rewritten_data
+        return response.text
+
+    try:
+        text = cached_call("gemini", REWRITER_MODEL, REWRITER_SYSTEM_PROMPT, REWRITER_USER_PROMPT,
+                           generate, use_cache=use_cache)
+        return build_rewritten_data(raw_data, text)
 
     except Exception as e:
         print(f"Error generating revision: {str(e)}")
-        if "quota" in str(e).lower():
-            print("Waiting 60 seconds before retrying...")
-            time.sleep(60)
-            return rewriter(raw_data, special_instructions)
         raise
 
+def rewriter_stream(raw_data, special_instructions: str = "None", use_cache: bool = True):
+    """Yield the rewritten chapter text as it streams in; each item is the full text so far.
+
+    Pass the last item to build_rewritten_data to get the data to save.
+    """
+    system_prompt, user_prompt = build_rewriter_prompts(raw_data, special_instructions)
+    yield from stream_generate(
+        "gemini", REWRITER_MODEL, system_prompt, user_prompt,
+        lambda: open_gemini_stream(REWRITER_MODEL, system_prompt, user_prompt),
+        use_cache
+    )
+
+async def rewriter_async(raw_data, special_instructions: str = "None", provider: str = "gemini",
+                         use_cache: bool = True):
+    """Async rewriter routed through the shared LLM client's concurrency limits."""
+    system_prompt, user_prompt = build_rewriter_prompts(raw_data, special_instructions)
+    text = await agenerate(provider, REWRITER_MODEL, system_prompt, user_prompt, use_cache)
+    if not text:
+        raise RuntimeError(f"{provider} failed to generate content")
+    return build_rewritten_data(raw_data, text)
+
+# Chunked rewriting for long chapters: chunks are rewritten concurrently, each
+# with its own word-count target, so the ±8% rule holds for the whole chapter.
+DEFAULT_CHUNK_WORDS = 800
+
+def split_into_chunks(text: str, max_words: int = DEFAULT_CHUNK_WORDS):
+    """Group paragraphs (one per line, as the scraper joins them) into chunks of about max_words."""
+    chunks, current, current_words = [], [], 0
+    for paragraph in (p.strip() for p in text.split("\n")):
+        if not paragraph:
+            continue
+        words = len(paragraph.split())
+        if current and current_words + words > max_words:
+            chunks.append(current)
+            current, current_words = [], 0
+        current.append(paragraph)
+        current_words += words
+    if current:
+        chunks.append(current)
+    return chunks
+
+def build_rewriter_chunk_prompts(raw_data, chunks, index: int, special_instructions: str = "None",
+                                 overlap_paragraphs: int = 1):
+    """Return the (system, user) prompts for rewriting chunk `index` of a chapter.
+
+    Neighbouring paragraphs are included read-only so the rewrite stays
+    continuous across chunk boundaries.
+    """
+    chunk_text = "\n".join(chunks[index])
+    system_prompt, _ = build_rewriter_prompts(
+        {"metadata": raw_data["metadata"], "content": chunk_text}, special_instructions
+    )
+    before, after = "(start of chapter)", "(end of chapter)"
+    if overlap_paragraphs and index > 0:
+        before = "\n".join(chunks[index - 1][-overlap_paragraphs:])
+    if overlap_paragraphs and index + 1 < len(chunks):
+        after = "\n".join(chunks[index + 1][:overlap_paragraphs])
+
+    user_prompt = textwrap.dedent(f"""
+        Rewrite this excerpt of a chapter while following all guidelines above.
+        Rewrite ONLY the excerpt; the surrounding context is for continuity and must not be repeated.
+
+        --- CHAPTER METADATA ---
+        Title: {raw_data["metadata"].get("chapter_title", "Untitled")}
+        From Book: {raw_data["metadata"].get("book_title", "Untitled")}
+        Author: {raw_data["metadata"].get("author", "Untitled")}
+        Part: {index + 1} of {len(chunks)}
+        Excerpt Word Count: {len(chunk_text.split())}
+
+        --- PRECEDING CONTEXT (do not rewrite) ---
+        {before}
+
+        --- EXCERPT TO REWRITE ---
+        {chunk_text}
+
+        --- FOLLOWING CONTEXT (do not rewrite) ---
+        {after}
+
+        --- SPECIAL INSTRUCTIONS ---
+        {special_instructions}
+    """)
+    return system_prompt, user_prompt
+
+async def rewriter_chunked_async(raw_data, special_instructions: str = "None",
+                                 max_chunk_words: int = DEFAULT_CHUNK_WORDS, overlap_paragraphs: int = 1,
+                                 provider: str = "gemini", use_cache: bool = True):
+    """Rewrite a long chapter chunk by chunk, with all chunks in flight concurrently."""
+    chunks = split_into_chunks(raw_data["content"], max_chunk_words)
+    if len(chunks) <= 1:
+        return await rewriter_async(raw_data, special_instructions, provider, use_cache)
+
+    async def rewrite_chunk(index):
+        system_prompt, user_prompt = build_rewriter_chunk_prompts(
+            raw_data, chunks, index, special_instructions, overlap_paragraphs
+        )
+        text = await agenerate(provider, REWRITER_MODEL, system_prompt, user_prompt, use_cache)
+        if not text:
+            raise RuntimeError(f"{provider} failed to generate content for part {index + 1}")
+        return text.strip()
+
+    parts = await asyncio.gather(*(rewrite_chunk(i) for i in range(len(chunks))))
+    return build_rewritten_data(raw_data, "\n".join(parts))
+
+def rewriter_chunked(raw_data, special_instructions: str = "None",
+                     max_chunk_words: int = DEFAULT_CHUNK_WORDS, overlap_paragraphs: int = 1,
+                     use_cache: bool = True):
+    """Blocking wrapper around rewriter_chunked_async for sync callers."""
+    return asyncio.run(rewriter_chunked_async(
+        raw_data, special_instructions, max_chunk_words, overlap_paragraphs, use_cache=use_cache
+    ))
+
 # Call rewriter function with special instructions
 # rewritten_content = rewriter(raw_data, special_instructions="Emphasize the atmospheric descriptions of the setting")
 
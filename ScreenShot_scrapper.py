@@ -1,54 +1,187 @@
+import asyncio
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+import requests
+from requests.adapters import HTTPAdapter
+from chapter_parser import parse_chapter_html
+from save import save_chapter_auto_version, get_latest_version, fetch_chapter_by_version
+from browser_pool import get_browser_pool
 
-from playwright.sync_api import sync_playwright
-from bs4 import BeautifulSoup
-from save import save_chapter_auto_version
-
-def extract_chapter_info(url):
-    with sync_playwright() as p:
-        browser = p.webkit.launch(headless=False)
-        page = browser.new_page()
-        page.goto(url)
-        page.screenshot(path="screenshot.png")
-        content = page.content()
-        browser.close()
-
-    soup = BeautifulSoup(content, 'html.parser')
-
-    book_title_tag = soup.select_one('#ws-title a')
-    book_title = book_title_tag.text.strip() if book_title_tag else "N/A"
-
-    author_tag = soup.select_one('#ws-author')
-    author = author_tag.text.strip() if author_tag else "N/A"
-
-    chapter_info_tag = soup.select_one('#ws-title')
-    chapter_info = chapter_info_tag.text.strip().split('—')[-1].strip() if chapter_info_tag else "N/A"
-
-    chapter_title = "N/A"
-    title_div = soup.select_one('.wst-center')
-    if title_div:
-        lines = list(title_div.stripped_strings)
-        if len(lines) >= 3:
-            chapter_title = lines[2]
-
-    content_div = soup.select_one('.prp-pages-output')
-    if content_div:
-        for span in content_div.select(".ws-pagenum"):
-            span.decompose()
-        chapter_text = "\n".join(p.get_text(strip=True) for p in content_div.find_all('p') if p.get_text(strip=True))
-    else:
-        chapter_text = "N/A"
-
-    return {
-        "book_title": book_title,
-        "author": author,
-        "chapter_info": chapter_info,
-        "chapter_title": chapter_title,
-        "content": chapter_text,
-        "source_url": url
-    }
+logger = logging.getLogger(__name__)
+
+# "auto" fetches over plain HTTP and falls back to the browser when the
+# Wikisource selectors are missing; "http" and "browser" force one path.
+SCRAPER_MODE = os.getenv("SCRAPER_MODE", "auto")
+HTTP_TIMEOUT = float(os.getenv("SCRAPER_HTTP_TIMEOUT", "20"))
+SCRAPER_SCREENSHOTS = os.getenv("SCRAPER_SCREENSHOTS", "false").lower() in ("true", "1", "yes")
+SCREENSHOT_DIR = Path(os.getenv("SCREENSHOT_DIR", "./screenshots"))
+USER_AGENT = "Automated-Book-Publication-Workflow/1.0 (chapter scraper; python-requests)"
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_http_session():
+    """Shared keep-alive session; the connection pool is sized for concurrent scrapes."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            pool_size = int(os.getenv("SCRAPER_CONCURRENCY", "4")) * 2
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+            _session.headers.update({
+                "User-Agent": USER_AGENT,
+                "Accept": "text/html",
+                "Accept-Encoding": "gzip, deflate",
+            })
+        return _session
+
+def fetch_page(url, etag=None, last_modified=None):
+    """GET url over the shared HTTP session, conditionally when validators are given."""
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    response = get_http_session().get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response
+
+def fetch_html(url):
+    """Fetch server-rendered HTML over the shared HTTP session."""
+    return fetch_page(url).text
+
+def content_hash(text):
+    """Hash of the extracted chapter text, used to detect unchanged pages."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def has_chapter_markup(data):
+    """Whether the page had the Wikisource title and page-content selectors."""
+    return data["chapter_info"] != "N/A" and data["content"] != "N/A"
+
+def screenshot_path_for(data):
+    """Content-addressed screenshot path for a scraped chapter."""
+    digest = hashlib.sha256(f"{data['source_url']}\n{data['content']}".encode("utf-8")).hexdigest()
+    return str(SCREENSHOT_DIR / f"{digest[:32]}.png")
+
+def request_screenshot(data):
+    """Record the chapter's screenshot path and capture it in the background if it isn't on disk."""
+    path = screenshot_path_for(data)
+    if not os.path.exists(path):
+        SCREENSHOT_DIR.mkdir(parents=True, exist_ok=True)
+        get_browser_pool().capture_screenshot(data["source_url"], path)
+    return {**data, "screenshot_path": path}
+
+def _scrape(url, mode, previous=None):
+    """Scrape url; returns None if the server says it is unchanged since `previous`."""
+    if mode in ("auto", "http"):
+        try:
+            validators = (previous.get("etag"), previous.get("last_modified")) if previous else ()
+            response = fetch_page(url, *validators)
+            if response.status_code == 304:
+                return None
+            data = parse_chapter_html(response.text, url)
+            if mode == "http" or has_chapter_markup(data):
+                data["etag"] = response.headers.get("ETag", "")
+                data["last_modified"] = response.headers.get("Last-Modified", "")
+                return data
+            logger.info(f"Chapter selectors missing in HTTP response, using browser: {url}")
+        except requests.RequestException as e:
+            if mode == "http":
+                raise
+            logger.warning(f"HTTP fetch failed ({e}), using browser: {url}")
+
+    return parse_chapter_html(get_browser_pool().fetch(url), url)
+
+def extract_chapter_info(url, mode=None, screenshot=None):
+    """Scrape one chapter, over plain HTTP when possible and the browser pool otherwise.
+
+    With screenshot=True the page screenshot is captured in the background and
+    its path returned as "screenshot_path"; the text is not held up by it.
+    """
+    return _finish(_scrape(url, mode or SCRAPER_MODE), screenshot)
+
+def _finish(data, screenshot=None):
+    """Add the content hash, and the screenshot path if requested, to scraped chapter data."""
+    data["content_hash"] = content_hash(data["content"])
+    if SCRAPER_SCREENSHOTS if screenshot is None else screenshot:
+        data = request_screenshot(data)
+    return data
+
+def latest_raw_version(base_id):
+    """Latest stored raw version of base_id as flat chapter data, or None."""
+    version = get_latest_version(base_id, "raw")
+    if not version:
+        return None
+    stored = fetch_chapter_by_version(f"{base_id}_ver{version}", "raw")
+    if not stored:
+        return None
+    return {**stored["metadata"], "content": stored["content"]}
+
+def _unchanged(previous, screenshot):
+    """Result for an unchanged page; a requested screenshot is still captured if its file is missing."""
+    if SCRAPER_SCREENSHOTS if screenshot is None else screenshot:
+        previous = request_screenshot(previous)
+    return {"data": previous, "changed": False, "saved": False, "versioned_id": previous["versioned_id"]}
+
+def scrape_raw_if_changed(url, base_id, mode=None, screenshot=None):
+    """Scrape url and save it as a new raw version of base_id only if the page changed.
+
+    Sends the stored ETag/Last-Modified as a conditional request and, when the
+    page is re-downloaded anyway, compares content hashes. Returns
+    {"data", "changed", "saved", "versioned_id"}; when unchanged, "data" and
+    "versioned_id" are the stored raw version's, and a requested screenshot is
+    captured only if it is not on disk yet.
+    """
+    previous = latest_raw_version(base_id)
+    if previous and previous.get("source_url") != url:
+        previous = None  # base_id was reused for another page; nothing to compare against
+    data = _scrape(url, mode or SCRAPER_MODE, previous)
+    if data is None:
+        logger.info(f"{url} not modified since {previous['versioned_id']}")
+        return _unchanged(previous, screenshot)
+
+    if not data.get("content") or data["content"] == "N/A":
+        raise ValueError(f"Failed to extract chapter content from {url}")
+    data["content_hash"] = content_hash(data["content"])
+    if previous and data["content_hash"] == (previous.get("content_hash") or content_hash(previous["content"])):
+        logger.info(f"{url} content unchanged since {previous['versioned_id']}")
+        return _unchanged(previous, screenshot)
+
+    if SCRAPER_SCREENSHOTS if screenshot is None else screenshot:
+        data = request_screenshot(data)
+    versioned_id = save_chapter_auto_version({**data, "reviewer_feedback": ""}, base_id=base_id, stage="raw")
+    return {"data": data, "changed": True, "saved": versioned_id is not None, "versioned_id": versioned_id}
+
+async def extract_chapters_async(urls, mode=None, screenshot=None):
+    """Scrape many chapters concurrently; failed URLs come back as exceptions in place."""
+    mode = mode or SCRAPER_MODE
+    if mode == "browser":
+        pages = await get_browser_pool().fetch_many(urls)
+        return [
+            page if isinstance(page, Exception) else _finish(parse_chapter_html(page, url), screenshot)
+            for url, page in zip(urls, pages)
+        ]
+
+    loop = asyncio.get_running_loop()
+    semaphore = asyncio.Semaphore(int(os.getenv("SCRAPER_CONCURRENCY", "4")) * 2)
+
+    async def scrape(url):
+        async with semaphore:
+            return await loop.run_in_executor(None, extract_chapter_info, url, mode, screenshot)
+
+    return await asyncio.gather(*(scrape(url) for url in urls), return_exceptions=True)
+
+def extract_chapters(urls, mode=None, screenshot=None):
+    """Blocking wrapper around extract_chapters_async."""
+    return asyncio.run(extract_chapters_async(urls, mode, screenshot))
 
 
 if __name__ == "__main__":
     url = "https://en.wikisource.org/wiki/The_Gates_of_Morning/Book_1/Chapter_1"
-    data = extract_chapter_info(url)
+    data = extract_chapter_info(url, screenshot=True)
     save_chapter_auto_version(data, base_id="chapter1",stage= "raw")
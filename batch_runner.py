@@ -0,0 +1,199 @@
+"""Headless batch runner: scrape -> rewrite -> review -> edit -> final for many chapters.
+
+Usage:
+    python batch_runner.py urls.txt --workers 4
+    python batch_runner.py https://en.wikisource.org/wiki/Book/Chapter_1 ...
+
+Each chapter gets a base_id derived from its URL. Work resumes from the
+latest stage stored in ChromaDB, so re-running after a crash only does
+the stages that are still missing.
+"""
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from ScreenShot_scrapper import scrape_raw_if_changed
+from crawler import base_id_from_url
+from save import (
+    save_chapter_auto_version, get_latest_across_stages, get_stage_versions
+)
+from Rewriter import rewriter, rewriter_chunked
+from Reviewer import reviwer
+from editor import editor, editor_chunked
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Pipeline stages in order; human edits count as the stage they replace
+STAGE_ORDER = ["raw", "rewritten", "reviewed", "edited", "final"]
+STAGE_ALIASES = {
+    "human_rewritten": "rewritten",
+    "human_reviewed": "reviewed",
+    "human_edited": "edited",
+}
+
+
+def current_stage(base_id: str) -> Optional[str]:
+    """Pipeline stage of the most recent version stored for base_id."""
+    versions = get_stage_versions(base_id)
+    if not versions:
+        return None
+    stage = max(versions, key=versions.get)
+    return STAGE_ALIASES.get(stage, stage)
+
+
+def _fetch_latest(base_id: str, stage: str) -> dict:
+    """Fetch the latest version of a stage, including its human-edited variant."""
+    stages = [stage] + [alias for alias, target in STAGE_ALIASES.items() if target == stage]
+    data = get_latest_across_stages(base_id, stages)
+    if not data:
+        raise ValueError(f"No {stage} version stored for {base_id}")
+    return data
+
+
+def _save(data: dict, base_id: str, stage: str):
+    if not save_chapter_auto_version(data, base_id=base_id, stage=stage):
+        raise RuntimeError(f"Failed to save {stage} version of {base_id}")
+
+
+def run_stage(stage: str, url: str, base_id: str, special_instructions: str = "None",
+              use_cache: bool = True, chunk_words: int = 0, screenshots: bool = False):
+    """Produce and store one pipeline stage for a chapter."""
+    if stage == "raw":
+        outcome = scrape_raw_if_changed(url, base_id, screenshot=screenshots)
+        if outcome["changed"] and not outcome["saved"]:
+            raise RuntimeError(f"Failed to save raw version of {base_id}")
+        return
+
+    raw_data = _fetch_latest(base_id, "raw")
+
+    if stage == "rewritten":
+        if chunk_words and len(raw_data["content"].split()) > chunk_words:
+            rewritten = rewriter_chunked(raw_data, special_instructions, chunk_words, use_cache=use_cache)
+        else:
+            rewritten = rewriter(raw_data, special_instructions, use_cache)
+        _save(rewritten, base_id, "rewritten")
+
+    elif stage == "reviewed":
+        rewritten_data = _fetch_latest(base_id, "rewritten")
+        feedback = reviwer(raw_data, rewritten_data, use_cache)
+        _save({
+            **rewritten_data["metadata"],
+            "content": rewritten_data["content"],
+            "reviewer_feedback": feedback
+        }, base_id, "reviewed")
+
+    elif stage == "edited":
+        reviewed_data = _fetch_latest(base_id, "reviewed")
+        if chunk_words and len(reviewed_data["content"].split()) > chunk_words:
+            edited_content = editor_chunked(raw_data, reviewed_data, chunk_words, use_cache=use_cache)
+        else:
+            edited_content = editor(raw_data, reviewed_data, use_cache)
+        _save({
+            **reviewed_data["metadata"],
+            "content": edited_content,
+            "reviewer_feedback": reviewed_data["metadata"].get("reviewer_feedback", "")
+        }, base_id, "edited")
+
+    elif stage == "final":
+        edited_data = _fetch_latest(base_id, "edited")
+        _save({**edited_data["metadata"], "content": edited_data["content"]}, base_id, "final")
+
+    else:
+        raise ValueError(f"Unknown stage: {stage}")
+
+
+def process_chapter(url: str, base_id: str = None, until: str = "final",
+                    special_instructions: str = "None", use_cache: bool = True,
+                    chunk_words: int = 0, screenshots: bool = False, refresh: bool = False) -> Dict:
+    """Run the remaining pipeline stages for one chapter, resuming where it stopped.
+
+    With refresh=True an already-scraped chapter is re-checked at the source;
+    if it changed, a new raw version is saved and the later stages run again.
+    """
+    base_id = base_id or base_id_from_url(url)
+    summary = {"url": url, "base_id": base_id, "stages_run": [], "error": ""}
+    try:
+        stage = current_stage(base_id)
+        if refresh and stage:
+            logger.info(f"[{base_id}] checking source for changes")
+            outcome = scrape_raw_if_changed(url, base_id, screenshot=screenshots)
+            if outcome["changed"]:
+                if not outcome["saved"]:
+                    raise RuntimeError(f"Failed to save raw version of {base_id}")
+                summary["stages_run"].append("raw")
+                stage = "raw"
+        start = STAGE_ORDER.index(stage) + 1 if stage else 0
+        for next_stage in STAGE_ORDER[start:STAGE_ORDER.index(until) + 1]:
+            logger.info(f"[{base_id}] running stage: {next_stage}")
+            run_stage(next_stage, url, base_id, special_instructions, use_cache, chunk_words, screenshots)
+            summary["stages_run"].append(next_stage)
+        summary["stage"] = current_stage(base_id)
+    except Exception as e:
+        logger.error(f"[{base_id}] pipeline stopped: {e}")
+        summary["error"] = str(e)
+        summary["stage"] = current_stage(base_id)
+    return summary
+
+
+def run_batch(urls: List[str], workers: int = 4, until: str = "final",
+              special_instructions: str = "None", use_cache: bool = True,
+              chunk_words: int = 0, screenshots: bool = False, refresh: bool = False) -> List[Dict]:
+    """Process many chapters concurrently with a bounded worker pool."""
+    seen = set()
+    unique_urls = [u for u in urls if not (u in seen or seen.add(u))]
+
+    results = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(process_chapter, url, None, until, special_instructions, use_cache,
+                        chunk_words, screenshots, refresh): url
+            for url in unique_urls
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            status = "❌ " + result["error"] if result["error"] else "✅"
+            logger.info(f"{status} {result['base_id']} -> {result['stage']}")
+            results.append(result)
+    return results
+
+
+def _read_urls(sources: List[str]) -> List[str]:
+    urls = []
+    for source in sources:
+        if source.startswith(("http://", "https://")):
+            urls.append(source)
+        else:
+            lines = Path(source).read_text(encoding="utf-8").splitlines()
+            urls.extend(line.strip() for line in lines if line.strip() and not line.startswith("#"))
+    return urls
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the chapter pipeline over many URLs")
+    parser.add_argument("sources", nargs="+", help="Chapter URLs or files with one URL per line")
+    parser.add_argument("--workers", type=int, default=4, help="Chapters processed in parallel")
+    parser.add_argument("--until", choices=STAGE_ORDER, default="final", help="Last stage to run")
+    parser.add_argument("--special-instructions", default="None", help="Instructions for the rewriter")
+    parser.add_argument("--no-cache", action="store_true", help="Bypass the LLM response cache")
+    parser.add_argument("--chunk-words", type=int, default=0,
+                        help="Rewrite and edit chapters longer than this many words in parallel chunks")
+    parser.add_argument("--screenshots", action="store_true",
+                        help="Capture page screenshots in the background while scraping")
+    parser.add_argument("--refresh", action="store_true",
+                        help="Re-check already scraped chapters and rerun their stages if the source changed")
+    args = parser.parse_args(argv)
+
+    results = run_batch(_read_urls(args.sources), args.workers, args.until,
+                        args.special_instructions, not args.no_cache, args.chunk_words, args.screenshots, args.refresh)
+    failed = [r for r in results if r["error"]]
+    print(f"Processed {len(results)} chapters, {len(failed)} failed")
+    for r in failed:
+        print(f"  {r['base_id']}: {r['error']}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
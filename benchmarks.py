@@ -0,0 +1,536 @@
+"""Micro-benchmarks for the storage and pipeline layers.
+
+Run one benchmark by name, e.g.:
+
+    python benchmarks.py version_index
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+STAGES = ["raw", "rewritten", "reviewed", "edited", "human_edited", "final"]
+
+
+def _timed(func, repeat: int) -> list:
+    """Call func `repeat` times and return per-call latencies in microseconds."""
+    samples = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        func(i)
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def _percentile(samples: list, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_version_index(sizes=(10, 100, 1_000, 10_000, 100_000), lookups: int = 2_000):
+    """Latest/next version lookup latency as the number of stored versions grows."""
+    from version_index import VersionIndex
+
+    print(f"{'versions':>10} {'latest p50 us':>14} {'next p50 us':>12} {'next p95 us':>12}")
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            index = VersionIndex(Path(tmp) / "version_index.sqlite3")
+            chapters = max(1, size // len(STAGES))
+            index.rebuild(
+                {
+                    "versioned_id": f"chapter{n % chapters}_ver{n}",
+                    "version": n,
+                    "stage": STAGES[n % len(STAGES)],
+                }
+                for n in range(1, size + 1)
+            )
+            latest = _timed(lambda i: index.latest(f"chapter{i % chapters}", "raw"), lookups)
+            nxt = _timed(lambda i: index.next_version(f"chapter{i % chapters}"), lookups)
+            print(f"{size:>10} {statistics.median(latest):>14.1f} "
+                  f"{statistics.median(nxt):>12.1f} {_percentile(nxt, 95):>12.1f}")
+
+
+def _save_versions(package_dir: str, store_dir: str, threads: int, saves: int, base_ids: list, queue):
+    """Child process: save versions from many threads through save_chapter_auto_version."""
+    import sys
+    from concurrent.futures import ThreadPoolExecutor
+
+    sys.path.insert(0, package_dir)
+    os.chdir(store_dir)  # save.py opens ./chroma_store on import
+    import save
+
+    def worker(thread: int):
+        saved, failed = [], 0
+        for n in range(saves):
+            for base_id in base_ids:
+                data = {
+                    "content": f"{base_id} draft {n} from thread {thread}.\nA second paragraph.",
+                    "book_title": "Stress Test", "author": "benchmarks", "chapter_info": base_id,
+                    "chapter_title": base_id, "source_url": "",
+                }
+                versioned_id = save.save_chapter_auto_version(data, base_id, STAGES[n % len(STAGES)])
+                if versioned_id:
+                    saved.append(versioned_id)
+                else:
+                    failed += 1
+        return saved, failed
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        reports = list(pool.map(worker, range(threads)))
+    queue.put({
+        "saved": [versioned_id for saved, _ in reports for versioned_id in saved],
+        "failed": sum(failed for _, failed in reports),
+        "elapsed": time.perf_counter() - start,
+        "ids": save.collection.get(include=[])["ids"],
+        "collection_count": save.collection.count(),
+        "indexed_count": save.version_index.document_count(),
+    })
+
+
+def stress_version_allocation(threads: int = 8, saves: int = 25, base_ids=("chapter1", "chapter2"),
+                              timeout: float = 600):
+    """Concurrent threads saving the same base_ids through the real save path.
+
+    A chroma_store supports one writer process (Chroma's PersistentClient is
+    not multi-process safe), so the threads share one process, which runs
+    against a temporary store. Afterwards each base_id must hold versions
+    1..N with no gaps or duplicates, and the version index must count
+    exactly the documents in the collection.
+    """
+    import multiprocessing as mp
+    from queue import Empty
+
+    from version_index import split_versioned_id
+
+    package_dir = str(Path(__file__).resolve().parent)
+    with tempfile.TemporaryDirectory() as tmp:
+        queue = mp.Queue()
+        worker = mp.Process(target=_save_versions,
+                            args=(package_dir, tmp, threads, saves, list(base_ids), queue))
+        worker.start()
+        deadline = time.monotonic() + timeout
+        report = None
+        while report is None:
+            try:
+                report = queue.get(timeout=1)
+            except Empty:
+                if worker.is_alive() and time.monotonic() < deadline:
+                    continue
+                if worker.is_alive():
+                    worker.terminate()
+                    worker.join()
+                    raise SystemExit(f"save worker did not report within {timeout:.0f}s")
+                raise SystemExit(f"save worker exited with code {worker.exitcode} before reporting")
+        worker.join(timeout=60)
+        if worker.exitcode != 0:
+            raise SystemExit(f"save worker exited with code {worker.exitcode}")
+
+    ids = report["ids"]
+    ok = report["failed"] == 0 and report["indexed_count"] == report["collection_count"]
+    for base_id in base_ids:
+        saved = [v for v in report["saved"] if split_versioned_id(v) == base_id]
+        versions = sorted(int(doc_id.rsplit("_ver", 1)[1]) for doc_id in ids if split_versioned_id(doc_id) == base_id)
+        unique = len(versions) == len(set(versions)) and len(saved) == len(set(saved))
+        gap_free = versions == list(range(1, len(saved) + 1))
+        ok = ok and unique and gap_free
+        print(f"{base_id}: {len(saved)} saves reported, {len(versions)} stored, unique={unique}, gap_free={gap_free}")
+    print(f"{len(ids)} documents from {threads} threads in {report['elapsed']:.2f}s ({report['failed']} failed saves)")
+    print(f"version index counts {report['indexed_count']} documents, collection has {report['collection_count']}")
+    if not ok:
+        raise SystemExit("version allocation is not safe under concurrency")
+
+
+def bench_scrape_modes(pages: int = 200, modes=("http", "browser")):
+    """Chapter pages scraped per second over plain HTTP versus the headless browser."""
+    from fixture_server import serve_fixtures
+    from ScreenShot_scrapper import extract_chapters
+
+    chapters = ["Book_1/Chapter_1", "Book_1/Chapter_2", "Book_1/Chapter_3", "Book_2/Chapter_1"]
+    with serve_fixtures() as base_url:
+        urls = [f"{base_url}/wiki/The_Gates_of_Morning/{chapters[i % len(chapters)]}" for i in range(pages)]
+        for mode in modes:
+            extract_chapters(urls[:len(chapters)], mode=mode)  # warm up connections / browser
+            start = time.perf_counter()
+            results = extract_chapters(urls, mode=mode)
+            elapsed = time.perf_counter() - start
+            failed = sum(isinstance(r, Exception) for r in results)
+            print(f"{mode:>8}: {pages / elapsed:8.1f} pages/s  ({pages} pages in {elapsed:.2f}s, {failed} failed)")
+
+
+# Chapter bodies that html.parser, lxml and lexbor repair differently
+MALFORMED_CHAPTERS = {
+    "unclosed <p>": "<p>one<p>two<b>x</b>three",
+    "<p> inside <b>": "<b><p>one</p></b><p>two</p>",
+    "<script> inside <p>": "<p>a<script>var x=1;</script>b</p>",
+    "<style> inside <p>": "<p>a<style>p { color: red }</style>b</p>",
+}
+
+
+def bench_parse_backends(rounds: int = 200, long_chapter_factor: int = 40, corpus_dir: str = None):
+    """Chapter extraction time per parser backend, failing unless every backend matches html.parser.
+
+    The corpus is the saved fixture pages, a long chapter synthesized by
+    repeating a fixture's paragraphs, the fixture with malformed chapter bodies,
+    and every *.html page under `corpus_dir` (default PARSER_CORPUS), e.g.
+    chapters saved from Wikisource with ``curl -o``.
+    """
+    from chapter_parser import available_backends, parse_chapter_html
+    from fixture_server import FIXTURES_DIR
+
+    pages = {
+        str(path.relative_to(FIXTURES_DIR)): path.read_text(encoding="utf-8")
+        for path in sorted(FIXTURES_DIR.rglob("*.html"))
+    }
+    sample = pages["wiki/The_Gates_of_Morning/Book_1/Chapter_1.html"]
+    start, end = sample.index('<div class="prp-pages-output"'), sample.index("<!-- NewPP")
+    body_start = sample.index(">", start) + 1
+    body_end = sample.rindex("</div>", body_start, end)
+    pages["(long chapter)"] = (sample[:body_start] + sample[body_start:body_end] * long_chapter_factor
+                               + sample[body_end:])
+    for name, body in MALFORMED_CHAPTERS.items():
+        pages[f"({name})"] = sample[:body_start] + body + sample[body_end:]
+    corpus_dir = corpus_dir or os.getenv("PARSER_CORPUS")
+    if corpus_dir:
+        corpus = Path(corpus_dir)
+        saved = sorted(corpus.rglob("*.html"))
+        if not saved:
+            raise SystemExit(f"No *.html pages under {corpus}")
+        pages.update((str(path.relative_to(corpus)), path.read_text(encoding="utf-8")) for path in saved)
+    print(f"Corpus: {len(pages)} pages")
+
+    backends = available_backends()
+    expected = {name: parse_chapter_html(html, name, backend="html.parser") for name, html in pages.items()}
+    failures = []
+    for backend in backends:
+        mismatched = [name for name, html in pages.items()
+                      if parse_chapter_html(html, name, backend=backend) != expected[name]]
+        samples = {
+            name: _timed(lambda _, html=html, name=name: parse_chapter_html(html, name, backend=backend), rounds)
+            for name, html in pages.items()
+        }
+        short = [us for name, times in samples.items() if name != "(long chapter)" for us in times]
+        print(f"{backend:>12}: pages p50 {_percentile(short, 50) / 1000:7.3f} ms  "
+              f"long chapter p50 {_percentile(samples['(long chapter)'], 50) / 1000:7.3f} ms  "
+              f"identical={not mismatched}")
+        for name in mismatched:
+            print(f"{'':>14}differs on {name}")
+        failures.extend(f"{backend} on {name}" for name in mismatched)
+    missing = [name for name in ("selectolax", "lxml") if name not in backends]
+    if missing:
+        print(f"Not installed: {', '.join(missing)}")
+    if failures:
+        raise SystemExit(f"{len(failures)} parse mismatches against html.parser: {'; '.join(failures)}")
+
+
+def bench_semantic_search(sizes=(10_000, 100_000), queries: int = 200, dim: int = 384):
+    """Vector query latency (p50/p95), unfiltered and with metadata filters.
+
+    Uses random unit vectors of MiniLM's dimension so building 100k versions
+    does not require embedding 100k chapters; the cost of embedding the query
+    text itself is reported separately.
+    """
+    import chromadb
+    import numpy as np
+    from semantic_search import SemanticSearch, build_where, local_embedding_function
+
+    rng = np.random.default_rng(0)
+
+    def unit_vectors(n):
+        vectors = rng.standard_normal((n, dim)).astype(np.float32)
+        return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+    try:
+        embed = local_embedding_function()
+        embed(["warm up"])
+        samples = _timed(lambda i: embed([f"the canoes came with the tide {i}"]), 50)
+        print(f"query embedding (MiniLM, CPU): p50 {_percentile(samples, 50) / 1000:.2f} ms  "
+              f"p95 {_percentile(samples, 95) / 1000:.2f} ms")
+    except Exception as e:
+        print(f"query embedding skipped: {e}")
+
+    filters = {
+        "unfiltered": None,
+        "stage": build_where(stage="final"),
+        "stage+book+versions": build_where(stage=["edited", "final"], book="Book 3", min_version=2, max_version=5),
+    }
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            client = chromadb.PersistentClient(path=tmp)
+            collection = client.create_collection("bench", embedding_function=None)
+            batch = client.get_max_batch_size() if hasattr(client, "get_max_batch_size") else 5000
+            start = time.perf_counter()
+            for offset in range(0, size, batch):
+                count = min(batch, size - offset)
+                collection.add(
+                    ids=[f"chapter{(offset + i) // 8}_ver{(offset + i) % 8 + 1}" for i in range(count)],
+                    embeddings=unit_vectors(count).tolist(),
+                    documents=["chapter text"] * count,
+                    metadatas=[{"stage": STAGES[(offset + i) % len(STAGES)], "version": (offset + i) % 8 + 1,
+                                "book_title": f"Book {(offset + i) % 10}"} for i in range(count)],
+                )
+            print(f"{size:>7} versions: built in {time.perf_counter() - start:.1f}s")
+
+            search = SemanticSearch(collection)
+            query_vectors = unit_vectors(queries)
+            for name, where in filters.items():
+                samples = _timed(lambda i: search.search(query_embedding=query_vectors[i], where=where), queries)
+                print(f"{'':>9}{name:<20} p50 {_percentile(samples, 50) / 1000:7.2f} ms  "
+                      f"p95 {_percentile(samples, 95) / 1000:7.2f} ms")
+
+
+def bench_embedding_ingest(versions: int = 40, paragraphs: int = 60, edit_rate: float = 0.1):
+    """Versions embedded per second: whole-document embedding vs the paragraph-cached pipeline.
+
+    Simulates successive versions of one chapter where each version edits
+    about `edit_rate` of the paragraphs, as rewrite/review/edit passes do.
+    """
+    import random
+    from embedding_pipeline import EmbeddingCache, EmbeddingPipeline
+    from semantic_search import local_embedding_function
+
+    rng = random.Random(0)
+    words = "lagoon reef canoe tide island spear morning water coral birds cliffs sand".split()
+
+    def paragraph():
+        return " ".join(rng.choice(words) for _ in range(rng.randint(30, 90))).capitalize() + "."
+
+    current = [paragraph() for _ in range(paragraphs)]
+    documents = []
+    for _ in range(versions):
+        current = [paragraph() if rng.random() < edit_rate else p for p in current]
+        documents.append("\n".join(current))
+
+    embed = local_embedding_function()
+    embed(["warm up"])
+    start = time.perf_counter()
+    for document in documents:
+        embed([document])
+    whole = time.perf_counter() - start
+    print(f"whole-document: {versions / whole:7.1f} versions/s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = EmbeddingPipeline(embed, cache=EmbeddingCache(Path(tmp) / "embeddings.sqlite3"))
+        start = time.perf_counter()
+        for document in documents:
+            pipeline.embed_documents([document])
+        one_by_one = time.perf_counter() - start
+        stats = pipeline.get_stats()
+        print(f"pipeline (per save): {versions / one_by_one:7.1f} versions/s  "
+              f"{stats['paragraphs_per_second']:.0f} paragraphs/s  "
+              f"cache hit rate {stats['cache_hit_rate']:.0%}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pipeline = EmbeddingPipeline(embed, cache=EmbeddingCache(Path(tmp) / "embeddings.sqlite3"))
+        start = time.perf_counter()
+        pipeline.embed_documents(documents)
+        batched = time.perf_counter() - start
+        print(f"pipeline (one batch): {versions / batched:7.1f} versions/s")
+
+
+def _synthetic_books(books: int, chapters: int, versions: int, words: int, seed: int = 0):
+    """Synthetic corpus: per-book character names in Zipf-distributed filler text.
+
+    Returns [(doc_id, text, metadata)], with versions of a chapter differing in ~10% of words.
+    """
+    import random
+
+    rng = random.Random(seed)
+    syllables = ["ka", "ta", "fa", "le", "tai", "oi", "ma", "ru", "ko", "ne", "sa", "vi", "lo", "mu"]
+    vocabulary = [f"w{i}" for i in range(5000)]
+    weights = [1.0 / (rank + 1) for rank in range(len(vocabulary))]
+    corpus = []
+    for book in range(books):
+        names = ["".join(rng.choices(syllables, k=3)).capitalize() for _ in range(6)]
+        for chapter in range(chapters):
+            text = rng.choices(vocabulary, weights, k=words)
+            for i in rng.sample(range(words), words // 15):
+                text[i] = rng.choice(names)
+            for version in range(1, versions + 1):
+                if version > 1:
+                    for i in rng.sample(range(words), words // 10):
+                        text[i] = rng.choices(vocabulary, weights)[0]
+                doc_id = f"book{book}_chapter{chapter}_ver{version}"
+                metadata = {"stage": STAGES[(version - 1) % len(STAGES)], "version": version,
+                            "book_title": f"Book {book}"}
+                corpus.append((doc_id, " ".join(text), metadata))
+    return corpus
+
+
+def bench_hybrid_search(sizes=(1_000, 10_000, 100_000), queries: int = 200, words: int = 200, hybrid_docs: int = 500):
+    """BM25 query latency and recall@10 on a synthetic many-book corpus, plus vector vs hybrid recall.
+
+    Queries are 3-word phrases or character name + word taken from one
+    version of a chapter; a hit is any version of that chapter in the top 10.
+    """
+    import random
+    from bm25_index import BM25Index
+
+    def make_queries(corpus, rng):
+        made = []
+        for _ in range(queries):
+            doc_id, text, _ = rng.choice(corpus)
+            tokens = text.split()
+            i = rng.randrange(len(tokens) - 3)
+            phrase = " ".join(tokens[i:i + 3])
+            name = next((t for t in tokens if t[0].isupper()), tokens[0])
+            query = f'"{phrase}"' if rng.random() < 0.5 else f"{name} {rng.choice(tokens)}"
+            made.append((query, doc_id.rsplit("_ver", 1)[0]))
+        return made
+
+    def recall(search, made):
+        found = sum(any(hit["id"].startswith(chapter + "_ver") for hit in search(query)) for query, chapter in made)
+        return found / len(made)
+
+    for size in sizes:
+        versions = 5
+        chapters = 20
+        corpus = _synthetic_books(max(1, size // (chapters * versions)), chapters, versions, words)
+        rng = random.Random(1)
+        with tempfile.TemporaryDirectory() as tmp:
+            index = BM25Index(Path(tmp) / "bm25.sqlite3")
+            start = time.perf_counter()
+            index.add_many(corpus)
+            built = time.perf_counter() - start
+            made = make_queries(corpus, rng)
+            samples = _timed(lambda i: index.search(made[i % len(made)][0], 10), queries)
+            print(f"{len(corpus):>7} versions: indexed in {built:.1f}s  "
+                  f"p50 {_percentile(samples, 50) / 1000:6.2f} ms  p95 {_percentile(samples, 95) / 1000:6.2f} ms  "
+                  f"recall@10 {recall(lambda q: index.search(q, 10), made):.2f}")
+
+    try:
+        import chromadb
+        from semantic_search import HybridSearch, local_embedding_function
+    except ImportError as e:
+        print(f"vector/hybrid recall skipped: {e}")
+        return
+
+    corpus = _synthetic_books(max(1, hybrid_docs // 100), 20, 5, words)
+    made = make_queries(corpus, random.Random(2))
+    with tempfile.TemporaryDirectory() as tmp:
+        client = chromadb.PersistentClient(path=tmp)
+        collection = client.create_collection("bench", embedding_function=local_embedding_function())
+        index = BM25Index(Path(tmp) / "bm25.sqlite3")
+        for start in range(0, len(corpus), 100):
+            batch = corpus[start:start + 100]
+            collection.add(ids=[d for d, _, _ in batch], documents=[t for _, t, _ in batch],
+                           metadatas=[m for _, _, m in batch])
+        index.add_many(corpus)
+        hybrid = HybridSearch(collection, index)
+        vector_recall = recall(lambda q: super(HybridSearch, hybrid).search(q, 10), made)
+        samples = _timed(lambda i: hybrid.search(made[i % len(made)][0], 10), queries)
+        print(f"{len(corpus):>7} versions: vector recall@10 {vector_recall:.2f}  "
+              f"hybrid recall@10 {recall(lambda q: hybrid.search(q, 10), made):.2f}  "
+              f"hybrid p50 {_percentile(samples, 50) / 1000:.1f} ms  p95 {_percentile(samples, 95) / 1000:.1f} ms")
+
+
+def bench_search_ranker(candidates=20, iterations=2000):
+    """Re-ranking and feedback latency of the LinUCB search ranker on top-k candidates."""
+    import random
+    from search_ranker import LinUCBRanker
+
+    rng = random.Random(0)
+    stages = ["raw", "rewritten", "reviewed", "edited", "final"]
+    results = [
+        {
+            "id": f"book_c{i}_ver{i}",
+            "metadata": {"stage": rng.choice(stages), "version": rng.randint(1, 20)},
+            "relevance_score": rng.random(),
+            "vector_score": rng.random(),
+            "bm25_score": rng.random() * 10,
+        }
+        for i in range(candidates)
+    ]
+    with tempfile.TemporaryDirectory() as tmp:
+        ranker = LinUCBRanker(Path(tmp) / "ranker.npz")
+        rank_samples = _timed(lambda i: ranker.rank("the old lighthouse", results), iterations)
+        feedback_samples = _timed(lambda i: ranker.feedback(i % 2 == 0, 1 + i % 5, result_rank=i % candidates),
+                                  iterations)
+    print(f"rank {candidates} candidates: p50 {_percentile(rank_samples, 50):.0f} us  "
+          f"p95 {_percentile(rank_samples, 95):.0f} us")
+    print(f"feedback update: p50 {_percentile(feedback_samples, 50):.0f} us  "
+          f"p95 {_percentile(feedback_samples, 95):.0f} us")
+
+
+def bench_delta_store(chapters: int = 50, paragraphs: int = 40, snapshot_every: int = 8):
+    """Compression and read latency of the delta version store on a realistic stage history.
+
+    Each chapter goes raw -> rewritten -> reviewed (copy) -> edited -> human_edited
+    -> reviewed (copy) -> edited -> final (copy). A rewrite changes every paragraph,
+    an AI edit about a fifth of them, and a human edit two.
+    """
+    import random
+    import zlib
+    from delta_store import DeltaStore
+
+    rng = random.Random(0)
+    vocabulary = [f"w{i}" for i in range(3000)]
+
+    def paragraph():
+        return " ".join(rng.choices(vocabulary, k=rng.randint(40, 90)))
+
+    def revise(lines, share):
+        changed = rng.sample(range(len(lines)), max(1, int(len(lines) * share)))
+        lines = list(lines)
+        for i in changed:
+            words = lines[i].split()
+            for j in rng.sample(range(len(words)), len(words) // 3):
+                words[j] = rng.choice(vocabulary)
+            lines[i] = " ".join(words)
+        return lines
+
+    history = []
+    for chapter in range(chapters):
+        raw = [paragraph() for _ in range(paragraphs)]
+        rewritten = revise(raw, 1.0)
+        edited = revise(rewritten, 0.2)
+        human_edited = revise(edited, 2 / paragraphs)
+        edited_again = revise(human_edited, 0.2)
+        stages = [raw, rewritten, rewritten, edited, human_edited, human_edited, edited_again, edited_again]
+        history.extend((f"chapter{chapter}_ver{v}", v, "\n".join(lines)) for v, lines in enumerate(stages, 1))
+
+    raw_bytes = sum(len(text.encode("utf-8")) for _, _, text in history)
+    zlib_bytes = sum(len(zlib.compress(text.encode("utf-8"), 9)) for _, _, text in history)
+    with tempfile.TemporaryDirectory() as tmp:
+        store = DeltaStore(Path(tmp) / "delta.sqlite3", snapshot_every)
+        start = time.perf_counter()
+        for i in range(0, len(history), 8):
+            store.put_many(history[i:i + 8])
+        elapsed = time.perf_counter() - start
+        stats = store.get_stats()
+        assert all(store.get(versioned_id) == text for versioned_id, _, text in history[:16])
+        samples = _timed(lambda i: store.get(history[i % len(history)][0]), len(history))
+        ids = [versioned_id for versioned_id, _, _ in history]
+        start = time.perf_counter()
+        assert len(store.get_many(ids)) == len(ids)
+        batch_elapsed = time.perf_counter() - start
+
+    print(f"{len(history)} versions, {raw_bytes / 1024:.0f} KB of text, written in {elapsed:.1f}s")
+    print(f"  zlib per version: {zlib_bytes / 1024:6.0f} KB ({raw_bytes / zlib_bytes:.1f}x)")
+    print(f"  delta store:      {stats['stored_bytes'] / 1024:6.0f} KB ({stats['compression_ratio']:.1f}x, "
+          f"{stats['snapshots']} snapshots, {stats['deltas']} deltas)")
+    print(f"  reconstruct: p50 {_percentile(samples, 50):.0f} us  p95 {_percentile(samples, 95):.0f} us, "
+          f"all {len(ids)} in one get_many: {batch_elapsed * 1e3:.0f} ms")
+    print("  (text only: embeddings and metadata stay in Chroma either way)")
+
+
+BENCHMARKS = {
+    "version_index": bench_version_index,
+    "version_allocation": stress_version_allocation,
+    "scrape_modes": bench_scrape_modes,
+    "parse_backends": bench_parse_backends,
+    "semantic_search": bench_semantic_search,
+    "embedding_ingest": bench_embedding_ingest,
+    "hybrid_search": bench_hybrid_search,
+    "search_ranker": bench_search_ranker,
+    "delta_store": bench_delta_store,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run pipeline micro-benchmarks")
+    parser.add_argument("name", choices=sorted(BENCHMARKS))
+    args = parser.parse_args()
+    BENCHMARKS[args.name]()
@@ -0,0 +1,202 @@
+"""Local BM25 inverted index over stored chapter versions.
+
+Embeddings rank character names and exact wording poorly, so every saved
+version is also indexed lexically in SQLite. Terms are lowercased word
+tokens, plus adjacent-word bigrams so that quoted phrases ("Le Taioi")
+can be matched exactly. Filters use the same Chroma ``where`` shape as
+vector search (stage, book_title, version, with $and/$in/$gte/$lte).
+"""
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BM25_INDEX_PATH = Path("./chroma_store") / "bm25_index.sqlite3"
+FILTER_COLUMNS = {"stage", "book_title", "version"}
+_OPERATORS = {"$eq": "=", "$ne": "!=", "$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+
+def index_terms(text: str) -> Counter:
+    """Term frequencies of a document: unigrams plus adjacent-word bigrams."""
+    tokens = tokenize(text)
+    terms = Counter(tokens)
+    terms.update(f"{a} {b}" for a, b in zip(tokens, tokens[1:]))
+    return terms
+
+
+def parse_query(query: str) -> Tuple[List[str], List[str]]:
+    """Scoring terms and required phrase bigrams of a query; "quoted phrases" must match exactly."""
+    required = []
+    for phrase in re.findall(r'"([^"]+)"', query):
+        tokens = tokenize(phrase)
+        required.extend(tokens if len(tokens) == 1 else [f"{a} {b}" for a, b in zip(tokens, tokens[1:])])
+    tokens = tokenize(query)
+    terms = list(dict.fromkeys(tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]))
+    return terms, list(dict.fromkeys(required))
+
+
+def where_to_sql(where: Optional[Dict]) -> Tuple[str, list]:
+    """Translate a Chroma metadata filter on the indexed columns into an SQL condition."""
+    if not where:
+        return "1", []
+    clauses, params = [], []
+    for key, condition in where.items():
+        if key == "$and":
+            parts = [where_to_sql(sub) for sub in condition]
+            clauses.append("(" + " AND ".join(sql for sql, _ in parts) + ")")
+            params.extend(p for _, sub_params in parts for p in sub_params)
+        elif key == "$or":
+            parts = [where_to_sql(sub) for sub in condition]
+            clauses.append("(" + " OR ".join(sql for sql, _ in parts) + ")")
+            params.extend(p for _, sub_params in parts for p in sub_params)
+        elif key not in FILTER_COLUMNS:
+            raise ValueError(f"Cannot filter the lexical index on {key}")
+        elif not isinstance(condition, dict):
+            clauses.append(f"d.{key} = ?")
+            params.append(condition)
+        else:
+            for op, value in condition.items():
+                if op in ("$in", "$nin"):
+                    placeholders = ",".join("?" * len(value))
+                    clauses.append(f"d.{key} {'IN' if op == '$in' else 'NOT IN'} ({placeholders})")
+                    params.extend(value)
+                else:
+                    clauses.append(f"d.{key} {_OPERATORS[op]} ?")
+                    params.append(value)
+    return " AND ".join(clauses), params
+
+
+class BM25Index:
+    """SQLite-backed inverted index with BM25 scoring."""
+
+    def __init__(self, path: Path = BM25_INDEX_PATH, k1: float = 1.2, b: float = 0.75,
+                 max_df_ratio: float = 0.5):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        # Terms in more than this share of documents are skipped when scoring
+        self.max_df_ratio = max_df_ratio
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " doc_id TEXT PRIMARY KEY,"
+                " length INTEGER NOT NULL,"
+                " stage TEXT, book_title TEXT, version INTEGER"
+                ")"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT NOT NULL,"
+                " doc_id TEXT NOT NULL,"
+                " tf INTEGER NOT NULL,"
+                " PRIMARY KEY (term, doc_id)"
+                ") WITHOUT ROWID"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def add_many(self, documents: Iterable[Tuple[str, str, Dict]]):
+        """Index (doc_id, text, metadata) triples, replacing any earlier entry for the same id."""
+        conn = self._connect()
+        with conn:
+            for doc_id, text, metadata in documents:
+                terms = index_terms(text)
+                conn.execute("DELETE FROM postings WHERE doc_id = ?", (doc_id,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO docs (doc_id, length, stage, book_title, version) VALUES (?, ?, ?, ?, ?)",
+                    (doc_id, len(tokenize(text)), metadata.get("stage"), metadata.get("book_title"),
+                     metadata.get("version"))
+                )
+                conn.executemany(
+                    "INSERT INTO postings (term, doc_id, tf) VALUES (?, ?, ?)",
+                    ((term, doc_id, tf) for term, tf in terms.items())
+                )
+
+    def document_count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def sync(self, chapters, batch_size: int = 500):
+        """Index any versions of the chapters collection missing from the lexical index."""
+        if self.document_count() == chapters.count():
+            return
+        indexed = {row[0] for row in self._connect().execute("SELECT doc_id FROM docs")}
+        missing = [doc_id for doc_id in chapters.get(include=[])["ids"] if doc_id not in indexed]
+        logger.info(f"Indexing {len(missing)} chapter versions for lexical search")
+        for start in range(0, len(missing), batch_size):
+            batch = chapters.get(ids=missing[start:start + batch_size], include=["documents", "metadatas"])
+            self.add_many(zip(batch["ids"], batch["documents"], batch["metadatas"]))
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """Top documents by BM25 score as {"id", "bm25_score"}, best first."""
+        terms, required = parse_query(query)
+        if not terms:
+            return []
+        conn = self._connect()
+        doc_count, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+        if not doc_count:
+            return []
+        avg_length = total_length / doc_count
+        condition, params = where_to_sql(where)
+
+        placeholders = ",".join("?" * len(terms))
+        df = dict(conn.execute(
+            f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term", terms
+        ))
+        if any(term not in df for term in required):
+            return []
+        weighted = [term for term in terms if term in df]
+        if required:
+            # Only documents containing every quoted phrase can match, so score the
+            # postings of the rarest one by key lookups instead of scanning each term
+            rarest = min(required, key=df.get)
+            source = ("(SELECT doc_id FROM postings WHERE term = ?) c CROSS JOIN q"
+                      " CROSS JOIN postings p ON p.term = q.term AND p.doc_id = c.doc_id")
+            source_params = [rarest]
+        else:
+            # Very common terms add almost nothing to the score (idf < log 2 above half
+            # the documents) but cost a posting per document, so they only count when
+            # the query has nothing rarer
+            weighted = [term for term in weighted if df[term] <= self.max_df_ratio * doc_count] or weighted
+            source = "q CROSS JOIN postings p ON p.term = q.term"
+            source_params = []
+        if not weighted:
+            return []
+        weights = [(term, math.log(1 + (doc_count - df[term] + 0.5) / (df[term] + 0.5)), term in required)
+                   for term in weighted]
+
+        # Sum each document's per-term BM25 contributions inside SQLite instead of
+        # streaming every posting through Python
+        query_terms = ",".join(["(?, ?, ?)"] * len(weights))
+        rows = conn.execute(
+            f"WITH q(term, idf, required) AS (VALUES {query_terms})"
+            f" SELECT p.doc_id, SUM(q.idf * p.tf * ? / (p.tf + ? + ? * d.length)) AS score"
+            f" FROM {source} JOIN docs d ON d.doc_id = p.doc_id"
+            f" WHERE {condition}"
+            f" GROUP BY p.doc_id HAVING SUM(q.required) = ?"
+            f" ORDER BY score DESC LIMIT ?",
+            (*(value for weight in weights for value in weight),
+             self.k1 + 1, self.k1 * (1 - self.b), self.k1 * self.b / avg_length,
+             *source_params, *params, len(required), n_results)
+        )
+        ranked = rows.fetchall()
+        return [{"id": doc_id, "bm25_score": score} for doc_id, score in ranked]
@@ -0,0 +1,164 @@
+"""Long-lived Playwright browser shared by all scrapes.
+
+Launching a browser costs seconds, so one headless browser is started on
+first use and kept running in a background event-loop thread. Pages are
+reused across scrapes, and at most `max_pages` navigations run at once.
+Sync callers in any thread use ``fetch``. Async callers use ``fetch_async``
+or ``fetch_many``, which work from any event loop. ``capture_screenshot``
+schedules a screenshot in the background; ``close`` waits for pending ones.
+
+Configure with SCRAPER_BROWSER (webkit/chromium/firefox), SCRAPER_HEADLESS
+(default true) and SCRAPER_CONCURRENCY (default 4).
+"""
+import asyncio
+import atexit
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class BrowserPool:
+    """One browser, a bounded set of reusable pages, running on its own event loop."""
+
+    def __init__(self, browser_type: str = "webkit", headless: bool = True, max_pages: int = 4,
+                 navigation_timeout: float = 30.0):
+        self.browser_type = browser_type
+        self.headless = headless
+        self.max_pages = max_pages
+        self.navigation_timeout = navigation_timeout
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+        self._starting: Optional[asyncio.Future] = None
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._idle_pages: Optional[asyncio.Queue] = None
+        self._page_count = 0
+        self._pending_screenshots = set()
+
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _ensure_started(self):
+        # Runs on the pool loop only; concurrent first callers share one start,
+        # and a failed start is retried on the next call
+        if self._starting is None or (self._starting.done() and self._starting.exception()):
+            self._starting = asyncio.ensure_future(self._start())
+        await self._starting
+
+    async def _start(self):
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        launcher = getattr(self._playwright, self.browser_type)
+        self._browser = await launcher.launch(headless=self.headless)
+        self._context = await self._browser.new_context()
+        self._idle_pages = asyncio.Queue()
+        logger.info(f"Started {self.browser_type} browser pool (headless={self.headless}, pages={self.max_pages})")
+
+    async def _new_page(self):
+        page = await self._context.new_page()
+        page.set_default_navigation_timeout(self.navigation_timeout * 1000)
+        return page
+
+    async def _acquire_page(self):
+        await self._ensure_started()
+        if self._idle_pages.empty() and self._page_count < self.max_pages:
+            self._page_count += 1
+            return await self._new_page()
+        return await self._idle_pages.get()
+
+    async def _release_page(self, page):
+        if page.is_closed():
+            page = await self._new_page()
+        await self._idle_pages.put(page)
+
+    async def _fetch(self, url: str) -> str:
+        page = await self._acquire_page()
+        try:
+            await page.goto(url, wait_until="domcontentloaded")
+            return await page.content()
+        except Exception:
+            # A page that failed mid-navigation may be in a bad state; don't reuse it
+            await page.close()
+            raise
+        finally:
+            await self._release_page(page)
+
+    async def _screenshot(self, url: str, path: str):
+        page = await self._acquire_page()
+        # Write to a temp name first so readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        try:
+            await page.goto(url, wait_until="load")
+            await page.screenshot(path=tmp_path, full_page=True)
+            os.replace(tmp_path, path)
+            logger.info(f"Saved screenshot of {url} to {path}")
+        except Exception as e:
+            logger.error(f"Screenshot of {url} failed: {e}")
+            await page.close()
+        finally:
+            # Left behind only when the capture failed
+            Path(tmp_path).unlink(missing_ok=True)
+            await self._release_page(page)
+
+    async def _schedule_screenshot(self, url: str, path: str):
+        task = asyncio.ensure_future(self._screenshot(url, path))
+        self._pending_screenshots.add(task)
+        task.add_done_callback(self._pending_screenshots.discard)
+
+    def fetch(self, url: str) -> str:
+        """Blocking: return the rendered HTML of url."""
+        return self._submit(self._fetch(url)).result()
+
+    async def fetch_async(self, url: str) -> str:
+        """Awaitable from any event loop: return the rendered HTML of url."""
+        return await asyncio.wrap_future(self._submit(self._fetch(url)))
+
+    async def fetch_many(self, urls: List[str]) -> List:
+        """Fetch many URLs concurrently; failed URLs yield their exception in place."""
+        return await asyncio.gather(*(self.fetch_async(url) for url in urls), return_exceptions=True)
+
+    def capture_screenshot(self, url: str, path: str):
+        """Screenshot url to path in the background without waiting for it."""
+        self._submit(self._schedule_screenshot(url, path))
+
+    async def _close(self):
+        if self._pending_screenshots:
+            await asyncio.gather(*self._pending_screenshots, return_exceptions=True)
+        if self._browser is not None:
+            await self._context.close()
+            await self._browser.close()
+            await self._playwright.stop()
+            self._browser = None
+            self._starting = None
+
+    def close(self):
+        """Shut the browser down and stop the pool's event loop."""
+        try:
+            self._submit(self._close()).result(timeout=120)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_pool: Optional[BrowserPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool() -> BrowserPool:
+    """Process-wide browser pool, created on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool(
+                browser_type=os.getenv("SCRAPER_BROWSER", "webkit"),
+                headless=os.getenv("SCRAPER_HEADLESS", "true").lower() not in ("false", "0", "no"),
+                max_pages=int(os.getenv("SCRAPER_CONCURRENCY", "4")),
+            )
+            atexit.register(_pool.close)
+        return _pool
@@ -0,0 +1,169 @@
+"""Chapter extraction from Wikisource HTML with pluggable parser backends.
+
+- "html.parser": BeautifulSoup with the stdlib parser (pure Python, the default)
+- "lxml": BeautifulSoup with the lxml tree builder (C parser, same traversal)
+- "selectolax": selectolax/lexbor with its own traversal (fastest)
+
+The backends agree on well-formed Wikisource pages but repair malformed HTML
+differently (an unclosed or misnested <p> ends up with different text), so
+html.parser stays the default. Set SCRAPER_PARSER to "lxml", "selectolax" or
+"auto" (fastest installed) to opt in to a faster one.
+``python benchmarks.py parse_backends`` compares their speed and fails if any
+backend's output differs from html.parser on its corpus.
+"""
+import importlib
+import os
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple
+
+PARSER_BACKEND = os.getenv("SCRAPER_PARSER", "html.parser")
+
+# Fastest first; "auto" resolves to the first installed one
+BACKEND_PREFERENCE = ["selectolax", "lxml", "html.parser"]
+# Modules each backend imports at parse time; older selectolax releases lack lexbor
+BACKEND_MODULES = {
+    "selectolax": ("selectolax.lexbor",),
+    "lxml": ("bs4", "lxml.etree"),
+    "html.parser": ("bs4",),
+}
+
+
+def _chapter_info(title_text: str) -> str:
+    return title_text.strip().split('—')[-1].strip()
+
+
+def _parse_soup(content, url, features):
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(content, features)
+
+    book_title_tag = soup.select_one('#ws-title a')
+    book_title = book_title_tag.text.strip() if book_title_tag else "N/A"
+
+    author_tag = soup.select_one('#ws-author')
+    author = author_tag.text.strip() if author_tag else "N/A"
+
+    chapter_info_tag = soup.select_one('#ws-title')
+    chapter_info = _chapter_info(chapter_info_tag.text) if chapter_info_tag else "N/A"
+
+    chapter_title = "N/A"
+    title_div = soup.select_one('.wst-center')
+    if title_div:
+        lines = list(title_div.stripped_strings)
+        if len(lines) >= 3:
+            chapter_title = lines[2]
+
+    content_div = soup.select_one('.prp-pages-output')
+    if content_div:
+        for span in content_div.select(".ws-pagenum"):
+            span.decompose()
+        chapter_text = "\n".join(p.get_text(strip=True) for p in content_div.find_all('p') if p.get_text(strip=True))
+    else:
+        chapter_text = "N/A"
+
+    return {
+        "book_title": book_title,
+        "author": author,
+        "chapter_info": chapter_info,
+        "chapter_title": chapter_title,
+        "content": chapter_text,
+        "source_url": url
+    }
+
+
+def _parse_html_parser(content, url):
+    return _parse_soup(content, url, 'html.parser')
+
+
+def _parse_lxml(content, url):
+    return _parse_soup(content, url, 'lxml')
+
+
+def _stripped_strings(node) -> List[str]:
+    """selectolax equivalent of BeautifulSoup's Tag.stripped_strings."""
+    strings = []
+    for child in node.traverse(include_text=True):
+        if child.tag == "-text":
+            text = child.text_content.strip()
+            if text:
+                strings.append(text)
+    return strings
+
+
+def _parse_selectolax(content, url):
+    from selectolax.lexbor import LexborHTMLParser
+
+    tree = LexborHTMLParser(content)
+    # BeautifulSoup's get_text/stripped_strings skip script and style text
+    for node in tree.css("script, style"):
+        node.decompose()
+
+    book_title_tag = tree.css_first('#ws-title a')
+    book_title = book_title_tag.text().strip() if book_title_tag else "N/A"
+
+    author_tag = tree.css_first('#ws-author')
+    author = author_tag.text().strip() if author_tag else "N/A"
+
+    chapter_info_tag = tree.css_first('#ws-title')
+    chapter_info = _chapter_info(chapter_info_tag.text()) if chapter_info_tag else "N/A"
+
+    chapter_title = "N/A"
+    title_div = tree.css_first('.wst-center')
+    if title_div:
+        lines = _stripped_strings(title_div)
+        if len(lines) >= 3:
+            chapter_title = lines[2]
+
+    content_div = tree.css_first('.prp-pages-output')
+    if content_div:
+        for span in content_div.css(".ws-pagenum"):
+            span.decompose()
+        paragraphs = (p.text(strip=True) for p in content_div.css('p'))
+        chapter_text = "\n".join(text for text in paragraphs if text)
+    else:
+        chapter_text = "N/A"
+
+    return {
+        "book_title": book_title,
+        "author": author,
+        "chapter_info": chapter_info,
+        "chapter_title": chapter_title,
+        "content": chapter_text,
+        "source_url": url
+    }
+
+
+PARSER_BACKENDS: Dict[str, Callable] = {
+    "html.parser": _parse_html_parser,
+    "lxml": _parse_lxml,
+    "selectolax": _parse_selectolax,
+}
+
+
+def _importable(module: str) -> bool:
+    try:
+        importlib.import_module(module)
+        return True
+    except ImportError:
+        return False
+
+
+@lru_cache(maxsize=None)
+def available_backends() -> Tuple[str, ...]:
+    """Parser backends whose modules actually import, fastest first."""
+    return tuple(name for name in BACKEND_PREFERENCE if all(map(_importable, BACKEND_MODULES[name])))
+
+
+def resolve_backend(backend: str = None) -> str:
+    """Concrete backend name for `backend`, resolving "auto" to the fastest installed one."""
+    backend = backend or PARSER_BACKEND
+    if backend == "auto":
+        return available_backends()[0]
+    if backend not in PARSER_BACKENDS:
+        raise ValueError(f"Unknown parser backend: {backend}")
+    return backend
+
+
+def parse_chapter_html(content, url, backend: str = None):
+    """Extract chapter title, author and text from a Wikisource chapter page."""
+    return PARSER_BACKENDS[resolve_backend(backend)](content, url)
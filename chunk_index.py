@@ -0,0 +1,182 @@
+"""Paragraph-level passage index over stored chapter versions.
+
+Every saved version is also stored paragraph by paragraph in a second Chroma
+collection, ``chapter_chunks``. Chunk ids are ``{versioned_id}_p{i}``, and
+each chunk records its version's id plus its character offsets in the
+chapter text. Passage search therefore returns the exact matching paragraph,
+where it sits in the chapter, and where the query terms occur inside it.
+Chunk embeddings come from the paragraph embedding cache, so indexing a new
+version only embeds paragraphs that changed. Indexed versions are also
+recorded in a small SQLite table, so startup only compares two counts.
+
+With a ``text_source`` (the delta version store), chunks keep only their
+offsets; passage text is sliced out of the reconstructed version when a
+search returns it, so paragraph text is not stored a second time.
+"""
+import logging
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from embedding_pipeline import get_embedding_pipeline, paragraph_spans
+from semantic_search import relevance_from_distance
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLLECTION_NAME = "chapter_chunks"
+CHUNK_INDEX_STATE_PATH = Path("./chroma_store") / "chunk_index.sqlite3"
+DEFAULT_BATCH_SIZE = 5000
+
+# Chapter metadata copied onto each chunk so passage searches can use the same filters
+INHERITED_METADATA_KEYS = ["stage", "version", "book_title", "chapter_title"]
+
+
+def chunk_id(versioned_id: str, paragraph: int) -> str:
+    return f"{versioned_id}_p{paragraph}"
+
+
+def term_highlights(query: str, passage: str) -> List[Tuple[int, int]]:
+    """(start, end) offsets in passage of whole-word, case-insensitive matches of the query terms."""
+    terms = sorted({t for t in re.findall(r"\w+", query.lower()) if len(t) > 1}, key=len, reverse=True)
+    if not terms:
+        return []
+    pattern = re.compile(r"\b(?:" + "|".join(map(re.escape, terms)) + r")\b", re.IGNORECASE)
+    return [match.span() for match in pattern.finditer(passage)]
+
+
+class ChunkIndex:
+    """Maintains and searches the paragraph chunk collection."""
+
+    def __init__(self, collection, batch_size: int = DEFAULT_BATCH_SIZE, state_path: Path = CHUNK_INDEX_STATE_PATH,
+                 text_source: Optional[Callable[[List[str]], Dict[str, str]]] = None):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.text_source = text_source
+        metadata = getattr(collection, "metadata", None) or {}
+        self.space = metadata.get("hnsw:space", "l2")
+        self.state_path = Path(state_path)
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS indexed_versions (versioned_id TEXT PRIMARY KEY) WITHOUT ROWID")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.state_path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _record(self, versioned_ids: Iterable[str]):
+        conn = self._connect()
+        with conn:
+            conn.executemany("INSERT OR IGNORE INTO indexed_versions (versioned_id) VALUES (?)",
+                             ((versioned_id,) for versioned_id in versioned_ids))
+
+    def indexed_count(self) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM indexed_versions").fetchone()[0]
+
+    def add_versions(self, versions: Iterable[Tuple[str, str, Dict]]):
+        """Index (versioned_id, content, metadata) triples, one chunk per paragraph."""
+        ids, documents, metadatas, indexed = [], [], [], []
+        for versioned_id, content, metadata in versions:
+            indexed.append(versioned_id)
+            for i, (start, end) in enumerate(paragraph_spans(content)):
+                ids.append(chunk_id(versioned_id, i))
+                documents.append(content[start:end])
+                metadatas.append({
+                    **{key: metadata[key] for key in INHERITED_METADATA_KEYS if key in metadata},
+                    "versioned_id": versioned_id,
+                    "paragraph": i,
+                    "start": start,
+                    "end": end,
+                })
+        if ids:
+            embeddings = get_embedding_pipeline().embed_paragraphs(documents).tolist()
+            for start in range(0, len(ids), self.batch_size):
+                end = start + self.batch_size
+                self.collection.add(
+                    ids=ids[start:end],
+                    documents=None if self.text_source else documents[start:end],
+                    embeddings=embeddings[start:end],
+                    metadatas=metadatas[start:end],
+                )
+        self._record(indexed)
+
+    def indexed_versions(self) -> set:
+        """versioned_ids that already have chunks."""
+        indexed = {row[0] for row in self._connect().execute("SELECT versioned_id FROM indexed_versions")}
+        if not indexed and self.collection.count():
+            # Chunks written before the table existed: recover them from the collection once
+            result = self.collection.get(where={"paragraph": 0}, include=["metadatas"])
+            indexed = {metadata["versioned_id"] for metadata in result["metadatas"]}
+            self._record(indexed)
+        return indexed
+
+    def sync(self, chapters):
+        """Index any versions of the chapters collection that have no chunks yet."""
+        if self.indexed_count() == chapters.count():
+            return
+        indexed = self.indexed_versions()
+        missing = [doc_id for doc_id in chapters.get(include=[])["ids"] if doc_id not in indexed]
+        if not missing:
+            return
+        logger.info(f"Indexing paragraphs of {len(missing)} chapter versions")
+        for start in range(0, len(missing), 500):
+            batch = chapters.get(ids=missing[start:start + 500], include=["documents", "metadatas"])
+            self.add_versions(zip(batch["ids"], batch["documents"], batch["metadatas"]))
+
+    def _fill_passages(self, passages: List[Optional[str]], metadatas: List[Dict]) -> List[str]:
+        """Slice passages stored as offsets only out of their version's text."""
+        missing = {metadata["versioned_id"] for passage, metadata in zip(passages, metadatas) if passage is None}
+        if not missing or not self.text_source:
+            return [passage or "" for passage in passages]
+        texts = self.text_source(list(missing))
+        return [
+            passage if passage is not None
+            else texts.get(metadata["versioned_id"], "")[metadata["start"]:metadata["end"]]
+            for passage, metadata in zip(passages, metadatas)
+        ]
+
+    def search(self, query: str, n_results: int = 10, where: Optional[Dict] = None) -> List[Dict]:
+        """Best-matching passages, each with its chapter offsets and query-term highlights."""
+        available = self.collection.count()
+        if not available:
+            return []
+        result = self.collection.query(
+            query_texts=[query],
+            n_results=min(n_results, available),
+            where=where,
+            include=["documents", "metadatas", "distances"],
+        )
+        passages = self._fill_passages(result["documents"][0], result["metadatas"][0])
+        return [
+            {
+                "id": doc_id,
+                "versioned_id": metadata["versioned_id"],
+                "metadata": metadata,
+                "content": passage,
+                "start": metadata["start"],
+                "end": metadata["end"],
+                "highlights": term_highlights(query, passage),
+                "relevance_score": relevance_from_distance(distance, self.space),
+            }
+            for doc_id, passage, metadata, distance in zip(
+                result["ids"][0], passages, result["metadatas"][0], result["distances"][0]
+            )
+        ]
+
+    def best_passages(self, query: str, versioned_ids: List[str], per_version: int = 3) -> Dict[str, Dict]:
+        """The best-matching passage of each of the given versions."""
+        if not versioned_ids:
+            return {}
+        hits = self.search(query, len(versioned_ids) * per_version,
+                           where={"versioned_id": {"$in": list(versioned_ids)}})
+        best: Dict[str, Dict] = {}
+        for hit in hits:
+            best.setdefault(hit["versioned_id"], hit)
+        return best
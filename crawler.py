@@ -0,0 +1,170 @@
+"""Whole-book crawler: discover chapters from a Wikisource index page and scrape them.
+
+Usage:
+    python crawler.py https://en.wikisource.org/wiki/The_Gates_of_Morning
+    python crawler.py --fixtures          # crawl the local fixture mirror
+
+Chapter links are the subpages of the index page, in page order, deduplicated
+by URL. Section pages that only list other subpages (e.g. ``Book_1`` next to
+``Book_1/Chapter_1``) are skipped. Chapters are scraped concurrently with a
+per-host cap on parallel requests and a minimum interval between request
+starts. Each one is saved as ``raw`` under a base_id derived from its URL,
+unless the page is unchanged since the last stored raw version.
+"""
+import argparse
+import asyncio
+import hashlib
+import logging
+import re
+from contextlib import asynccontextmanager
+from typing import Dict, List
+from urllib.parse import unquote, urljoin, urlparse
+
+from bs4 import BeautifulSoup
+
+from ScreenShot_scrapper import extract_chapter_info, fetch_html, scrape_raw_if_changed
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONCURRENCY = 4
+DEFAULT_PER_HOST = 2
+DEFAULT_MIN_INTERVAL = 0.5  # seconds between request starts to one host
+
+
+def base_id_from_url(url: str) -> str:
+    """Derive a stable base_id from a Wikisource chapter URL."""
+    path = unquote(urlparse(url).path)
+    if path.startswith("/wiki/"):
+        path = path[len("/wiki/"):]
+    slug = re.sub(r"[^0-9A-Za-z]+", "_", path).strip("_").lower()
+    if not slug:
+        slug = "chapter_" + hashlib.sha1(url.encode("utf-8")).hexdigest()[:12]
+    return slug
+
+
+def discover_chapter_links(index_html: str, index_url: str) -> List[str]:
+    """Ordered, deduplicated chapter URLs linked from a book index page."""
+    index = urlparse(index_url)
+    prefix = unquote(index.path).rstrip("/") + "/"
+
+    links: Dict[str, str] = {}  # unquoted path -> URL, in page order
+    soup = BeautifulSoup(index_html, "html.parser")
+    for anchor in soup.find_all("a", href=True):
+        parsed = urlparse(urljoin(index_url, anchor["href"]))
+        path = unquote(parsed.path)
+        if parsed.netloc != index.netloc or parsed.query or not path.startswith(prefix):
+            continue
+        links.setdefault(path, parsed._replace(fragment="").geturl())
+
+    # Keep leaf pages only: "Book_1" is a section when "Book_1/..." is also linked
+    return [url for path, url in links.items()
+            if not any(other.startswith(path + "/") for other in links)]
+
+
+class HostLimiter:
+    """Per-host cap on concurrent requests plus a minimum gap between request starts."""
+
+    def __init__(self, max_concurrent: int = DEFAULT_PER_HOST, min_interval: float = DEFAULT_MIN_INTERVAL):
+        self.max_concurrent = max_concurrent
+        self.min_interval = min_interval
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._next_start: Dict[str, float] = {}
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        host = urlparse(url).netloc
+        semaphore = self._semaphores.setdefault(host, asyncio.Semaphore(self.max_concurrent))
+        lock = self._locks.setdefault(host, asyncio.Lock())
+        async with semaphore:
+            async with lock:
+                loop = asyncio.get_running_loop()
+                wait = self._next_start.get(host, 0.0) - loop.time()
+                if wait > 0:
+                    await asyncio.sleep(wait)
+                self._next_start[host] = loop.time() + self.min_interval
+            yield
+
+
+async def crawl_book_async(index_url: str, concurrency: int = DEFAULT_CONCURRENCY,
+                           per_host: int = DEFAULT_PER_HOST, min_interval: float = DEFAULT_MIN_INTERVAL,
+                           save: bool = True, screenshot: bool = False) -> List[Dict]:
+    """Discover and scrape every chapter of a book; returns one result per chapter, in book order."""
+    loop = asyncio.get_running_loop()
+    limiter = HostLimiter(per_host, min_interval)
+    workers = asyncio.Semaphore(concurrency)
+
+    async with limiter.slot(index_url):
+        index_html = await loop.run_in_executor(None, fetch_html, index_url)
+    urls = discover_chapter_links(index_html, index_url)
+    logger.info(f"Found {len(urls)} chapters on {index_url}")
+
+    async def crawl(url: str) -> Dict:
+        result = {"url": url, "base_id": base_id_from_url(url), "saved": False, "changed": True, "error": ""}
+        try:
+            async with workers:
+                async with limiter.slot(url):
+                    if save:
+                        outcome = await loop.run_in_executor(
+                            None, scrape_raw_if_changed, url, result["base_id"], None, screenshot
+                        )
+                    else:
+                        data = await loop.run_in_executor(None, extract_chapter_info, url, None, screenshot)
+                        outcome = {"data": data, "changed": True, "saved": False}
+            data = outcome["data"]
+            if not data or data["content"] == "N/A":
+                raise ValueError("no chapter content found")
+            if save and outcome["changed"] and not outcome["saved"]:
+                raise RuntimeError("failed to save raw version")
+            result.update(saved=outcome["saved"], changed=outcome["changed"], chapter_title=data["chapter_title"])
+        except Exception as e:
+            logger.error(f"Failed to crawl {url}: {e}")
+            result["error"] = str(e)
+        return result
+
+    return await asyncio.gather(*(crawl(url) for url in urls))
+
+
+def crawl_book(index_url: str, **kwargs) -> List[Dict]:
+    """Blocking wrapper around crawl_book_async."""
+    return asyncio.run(crawl_book_async(index_url, **kwargs))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Scrape every chapter of a Wikisource book")
+    parser.add_argument("index_url", nargs="?", help="Book index page URL")
+    parser.add_argument("--fixtures", action="store_true", help="Crawl the local fixture mirror instead")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY, help="Chapters scraped in parallel")
+    parser.add_argument("--per-host", type=int, default=DEFAULT_PER_HOST, help="Parallel requests per host")
+    parser.add_argument("--min-interval", type=float, default=DEFAULT_MIN_INTERVAL,
+                        help="Seconds between request starts to one host")
+    parser.add_argument("--dry-run", action="store_true", help="Scrape without saving to ChromaDB")
+    parser.add_argument("--screenshots", action="store_true", help="Capture page screenshots in the background")
+    args = parser.parse_args(argv)
+    if not args.index_url and not args.fixtures:
+        parser.error("index_url is required unless --fixtures is given")
+
+    options = dict(concurrency=args.concurrency, per_host=args.per_host, min_interval=args.min_interval,
+                   save=not args.dry_run, screenshot=args.screenshots)
+    if args.fixtures:
+        from fixture_server import serve_fixtures
+
+        with serve_fixtures() as base_url:
+            results = crawl_book(f"{base_url}/wiki/The_Gates_of_Morning", **options)
+    else:
+        results = crawl_book(args.index_url, **options)
+
+    failed = [r for r in results if r["error"]]
+    for r in results:
+        if r["error"]:
+            status = "❌ " + r["error"]
+        else:
+            status = ("✅ " if r["changed"] else "⏸️ unchanged: ") + r.get("chapter_title", "")
+        print(f"{r['base_id']}: {status}")
+    print(f"Crawled {len(results)} chapters, {len(failed)} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    raise SystemExit(main())
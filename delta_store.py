@@ -0,0 +1,285 @@
+"""Delta-compressed store for chapter version texts.
+
+Most versions of a chapter share most of their text with an earlier one:
+reviewed and final are copies, and human edits touch a few paragraphs. So
+only every few versions is stored as a full snapshot. The others are
+stored as a line-level diff (difflib opcodes) against the recent version
+they differ from least. Everything is zlib-compressed in SQLite, and the
+version chain is reconstructed with one recursive query.
+
+``DeltaCollection`` wraps the Chroma collection. ``add`` moves documents
+into the store, so Chroma keeps only embeddings and metadata. ``get`` and
+``query`` put the reconstructed text back, so callers see full documents.
+Stored texts are immutable: ``delete`` and document updates raise.
+Versions saved before the store was enabled keep their Chroma documents.
+
+Enable with VERSION_STORE=delta; VERSION_SNAPSHOT_EVERY (default 8) bounds
+the delta chain length.
+"""
+import difflib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from version_index import split_versioned_id
+
+logger = logging.getLogger(__name__)
+
+DELTA_STORE_PATH = Path("./chroma_store") / "delta_store.sqlite3"
+SNAPSHOT_EVERY = int(os.getenv("VERSION_SNAPSHOT_EVERY", "8"))
+PARENT_CANDIDATES = 3
+# Recently stored texts kept in memory as delta parents for the next version
+RECENT_TEXTS = 128
+_SQLITE_MAX_PARAMS = 500
+
+
+def make_delta(parent: str, text: str) -> list:
+    """Line diff turning parent into text: [start, end] copies parent lines, a string is inserted."""
+    parent_lines = parent.splitlines(keepends=True)
+    lines = text.splitlines(keepends=True)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, parent_lines, lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append("".join(lines[j1:j2]))
+    return ops
+
+
+def apply_delta(parent: str, ops: list) -> str:
+    parent_lines = parent.splitlines(keepends=True)
+    return "".join("".join(parent_lines[op[0]:op[1]]) if isinstance(op, list) else op for op in ops)
+
+
+def _pack(value) -> bytes:
+    return zlib.compress(json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def _unpack(blob: bytes):
+    return json.loads(zlib.decompress(blob).decode("utf-8"))
+
+
+class DeltaStore:
+    """SQLite store of version texts as periodic snapshots plus deltas."""
+
+    def __init__(self, path: Path = DELTA_STORE_PATH, snapshot_every: int = SNAPSHOT_EVERY):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.snapshot_every = max(1, snapshot_every)
+        self._local = threading.local()
+        self._recent: "OrderedDict[str, str]" = OrderedDict()
+        self._recent_lock = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS texts ("
+                " versioned_id TEXT PRIMARY KEY,"
+                " base_id TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " parent_id TEXT,"
+                " depth INTEGER NOT NULL,"
+                " data BLOB NOT NULL,"
+                " raw_size INTEGER NOT NULL,"
+                " stored_size INTEGER NOT NULL"
+                ")"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS texts_base ON texts (base_id, version)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _remember(self, texts: Dict[str, str]):
+        with self._recent_lock:
+            for versioned_id, text in texts.items():
+                self._recent[versioned_id] = text
+                self._recent.move_to_end(versioned_id)
+            while len(self._recent) > RECENT_TEXTS:
+                self._recent.popitem(last=False)
+
+    def _recalled(self, versioned_ids: List[str]) -> Dict[str, str]:
+        with self._recent_lock:
+            return {versioned_id: self._recent[versioned_id] for versioned_id in versioned_ids
+                    if versioned_id in self._recent}
+
+    def _encode(self, conn: sqlite3.Connection, base_id: str, version: int, text: str,
+                known: Dict[str, str]) -> Tuple[Optional[str], int, bytes]:
+        """(parent_id, depth, data) for a new version: the smallest delta, or a snapshot.
+
+        Parent texts come from `known` (this batch) or the recently stored
+        texts; only the rest are reconstructed, in one batched read.
+        """
+        snapshot = _pack(text)
+        rows = conn.execute(
+            "SELECT versioned_id, depth FROM texts WHERE base_id = ? AND version < ? ORDER BY version DESC LIMIT ?",
+            (base_id, version, PARENT_CANDIDATES)
+        ).fetchall()
+        candidates = [(parent_id, depth) for parent_id, depth in rows if depth + 1 < self.snapshot_every]
+        parents = {parent_id: known[parent_id] for parent_id, _ in candidates if parent_id in known}
+        missing = [parent_id for parent_id, _ in candidates if parent_id not in parents]
+        parents.update(self._recalled(missing))
+        missing = [parent_id for parent_id in missing if parent_id not in parents]
+        if missing:
+            parents.update(self.get_many(missing))
+        best = (None, 0, snapshot)
+        for parent_id, depth in candidates:
+            data = _pack(make_delta(parents[parent_id], text))
+            if len(data) < len(best[2]):
+                best = (parent_id, depth + 1, data)
+        return best
+
+    def put_many(self, versions: Iterable[Tuple[str, int, str]], before_commit: Optional[Callable] = None):
+        """Store (versioned_id, version, text) triples, in version order per chapter.
+
+        Stored texts are never replaced, since later deltas may be based on
+        them; an id that is already stored raises sqlite3.IntegrityError.
+        before_commit runs inside the transaction, and if it raises, nothing
+        is stored.
+        """
+        conn = self._connect()
+        stored: Dict[str, str] = {}
+        with conn:
+            for versioned_id, version, text in sorted(versions, key=lambda v: v[1]):
+                base_id = split_versioned_id(versioned_id)
+                parent_id, depth, data = self._encode(conn, base_id, version, text, stored)
+                conn.execute(
+                    "INSERT INTO texts (versioned_id, base_id, version, parent_id, depth, data,"
+                    " raw_size, stored_size) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (versioned_id, base_id, version, parent_id, depth, data,
+                     len(text.encode("utf-8")), len(data))
+                )
+                stored[versioned_id] = text
+            if before_commit:
+                before_commit()
+        # Only committed texts are remembered; a rolled-back id may be reused for another text
+        self._remember(stored)
+
+    def get(self, versioned_id: str) -> Optional[str]:
+        """Reconstruct a version's text, or None if it is not in the store."""
+        return self.get_many([versioned_id]).get(versioned_id)
+
+    def get_many(self, versioned_ids: List[str]) -> Dict[str, str]:
+        """Texts of those ids that are in the store.
+
+        One recursive query per batch collects every version the requested
+        ones depend on, so shared ancestors are read and decoded only once.
+        """
+        conn = self._connect()
+        rows = []
+        for start in range(0, len(versioned_ids), _SQLITE_MAX_PARAMS):
+            chunk = versioned_ids[start:start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows += conn.execute(
+                "WITH RECURSIVE chain(versioned_id) AS ("
+                f" SELECT versioned_id FROM texts WHERE versioned_id IN ({placeholders})"
+                " UNION"
+                " SELECT t.parent_id FROM texts t JOIN chain c ON t.versioned_id = c.versioned_id"
+                " WHERE t.parent_id IS NOT NULL"
+                ") SELECT t.versioned_id, t.parent_id, t.depth, t.data FROM texts t"
+                " JOIN chain c ON t.versioned_id = c.versioned_id",
+                chunk
+            ).fetchall()
+
+        # A delta is always one level deeper than its parent
+        decoded: Dict[str, str] = {}
+        for versioned_id, parent_id, _, data in sorted(rows, key=lambda row: row[2]):
+            if versioned_id in decoded:
+                continue
+            decoded[versioned_id] = _unpack(data) if parent_id is None else apply_delta(decoded[parent_id], _unpack(data))
+        return {versioned_id: decoded[versioned_id] for versioned_id in versioned_ids if versioned_id in decoded}
+
+    def get_stats(self) -> Dict:
+        row = self._connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(parent_id IS NULL), 0), COALESCE(SUM(raw_size), 0),"
+            " COALESCE(SUM(stored_size), 0) FROM texts"
+        ).fetchone()
+        versions, snapshots, raw_bytes, stored_bytes = row
+        return {
+            "versions": versions,
+            "snapshots": snapshots,
+            "deltas": versions - snapshots,
+            "raw_bytes": raw_bytes,
+            "stored_bytes": stored_bytes,
+            "compression_ratio": raw_bytes / stored_bytes if stored_bytes else 0.0,
+        }
+
+
+class DeltaCollection:
+    """Chroma collection whose documents live in a DeltaStore."""
+
+    def __init__(self, collection, store: DeltaStore):
+        self._collection = collection
+        self.store = store
+
+    def __getattr__(self, name):
+        return getattr(self._collection, name)
+
+    def delete(self, *args, **kwargs):
+        raise NotImplementedError(
+            "Versions in the delta store cannot be deleted: later versions are deltas against them"
+        )
+
+    def update(self, ids, documents=None, **kwargs):
+        if documents is not None:
+            raise ValueError("Stored version texts are immutable; save a new version instead")
+        return self._collection.update(ids=ids, **kwargs)
+
+    def upsert(self, ids, documents=None, **kwargs):
+        if documents is not None:
+            raise ValueError("Stored version texts are immutable; add new versions with add()")
+        return self._collection.upsert(ids=ids, **kwargs)
+
+    def add(self, ids, documents=None, embeddings=None, metadatas=None, **kwargs):
+        if documents is None:
+            return self._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, **kwargs)
+        if embeddings is None:
+            raise ValueError("Documents kept in the delta store need precomputed embeddings")
+        versions = [int(metadata["version"]) for metadata in metadatas]
+
+        def add_to_collection():
+            # Chroma silently skips ids it already has, which would pair a stored text with another document
+            existing = self._collection.get(ids=list(ids), include=[])["ids"]
+            if existing:
+                raise ValueError(f"Versions already stored: {', '.join(existing)}")
+            self._collection.add(ids=ids, embeddings=embeddings, metadatas=metadatas, **kwargs)
+
+        # The texts commit only once Chroma has accepted the ids, so a failed add leaves no rows behind
+        self.store.put_many(zip(ids, versions, documents), before_commit=add_to_collection)
+
+    def _fill(self, ids: List[str], documents: List[Optional[str]]) -> List[Optional[str]]:
+        missing = [doc_id for doc_id, document in zip(ids, documents) if document is None]
+        if not missing:
+            return documents
+        texts = self.store.get_many(missing)
+        return [texts.get(doc_id) if document is None else document for doc_id, document in zip(ids, documents)]
+
+    def get(self, *args, **kwargs):
+        result = self._collection.get(*args, **kwargs)
+        if result.get("documents") is not None:
+            result["documents"] = self._fill(result["ids"], result["documents"])
+        return result
+
+    def peek(self, *args, **kwargs):
+        result = self._collection.peek(*args, **kwargs)
+        if result.get("documents") is not None:
+            result["documents"] = self._fill(result["ids"], result["documents"])
+        return result
+
+    def query(self, *args, **kwargs):
+        result = self._collection.query(*args, **kwargs)
+        if result.get("documents") is not None:
+            result["documents"] = [
+                self._fill(ids, documents) for ids, documents in zip(result["ids"], result["documents"])
+            ]
+        return result
@@ -3,7 +3,11 @@ import google.generativeai as genai
 import os
 from dotenv import load_dotenv
 import textwrap
-import time
+import asyncio
+from llm_client import agenerate, call_limited, estimate_tokens, stream_generate, open_gemini_stream
+from retry import retry_call
+from llm_cache import cached_call
+from Rewriter import split_into_chunks, DEFAULT_CHUNK_WORDS
 
 
 # Load environment variables
@@ -30,7 +34,10 @@ genai.configure(api_key=google_api_key)
 # versioned_id_reviewed = f"chapter1_ver{latest_version_reviewed}"
 # reviewed_data = fetch_chapter_by_version(versioned_id_reviewed, "reviewed")
 
-def editor(raw_data, reviewed_data):
+EDITOR_MODEL = 'gemini-1.5-flash'
+
+def build_editor_prompts(raw_data, reviewed_data):
+    """Return the (system, user) prompts for editing a reviewed chapter."""
     book_title = raw_data["metadata"].get("book_title", "Untitled")
     author = raw_data["metadata"].get("author", "Untitled")
     chapter_title = raw_data["metadata"].get("chapter_title", "Untitled")
@@ -80,25 +87,142 @@ def editor(raw_data, reviewed_data):
         Return ONLY the revised text, no additional commentary.
     """)
 
+    return EDITOR_SYSTEM_PROMPT, EDITOR_USER_PROMPT
+
+def editor(raw_data, reviewed_data, use_cache: bool = True):
+    EDITOR_SYSTEM_PROMPT, EDITOR_USER_PROMPT = build_editor_prompts(raw_data, reviewed_data)
+
     model = genai.GenerativeModel(
-        model_name='gemini-1.5-flash',
+        model_name=EDITOR_MODEL,
         system_instruction=EDITOR_SYSTEM_PROMPT
     )
 
-    try:
-        response = model.generate_content(EDITOR_USER_PROMPT)
+    def generate():
+        response = retry_call("gemini", call_limited, "gemini",
+                              estimate_tokens(EDITOR_SYSTEM_PROMPT, EDITOR_USER_PROMPT),
+                              model.generate_content, EDITOR_USER_PROMPT)
         if not response.text:
             raise RuntimeError("Gemini failed to generate content")
         return response.text
 
+    try:
+        return cached_call("gemini", EDITOR_MODEL, EDITOR_SYSTEM_PROMPT, EDITOR_USER_PROMPT,
+                           generate, use_cache=use_cache)
+
     except Exception as e:
         print(f"Error generating revision: {str(e)}")
-        if "quota" in str(e).lower():
-            print("Waiting 60 seconds before retrying...")
-            time.sleep(60)
-            return editor(raw_data, reviewed_data)
         raise
 
+def editor_stream(raw_data, reviewed_data, use_cache: bool = True):
+    """Yield the edited chapter text as it streams in; each item is the full text so far."""
+    system_prompt, user_prompt = build_editor_prompts(raw_data, reviewed_data)
+    yield from stream_generate(
+        "gemini", EDITOR_MODEL, system_prompt, user_prompt,
+        lambda: open_gemini_stream(EDITOR_MODEL, system_prompt, user_prompt),
+        use_cache
+    )
+
+async def editor_async(raw_data, reviewed_data, provider: str = "gemini", use_cache: bool = True):
+    """Async editor routed through the shared LLM client's concurrency limits."""
+    system_prompt, user_prompt = build_editor_prompts(raw_data, reviewed_data)
+    text = await agenerate(provider, EDITOR_MODEL, system_prompt, user_prompt, use_cache)
+    if not text:
+        raise RuntimeError(f"{provider} failed to generate content")
+    return text
+
+# Chunked editing for long chapters, split and merged the same way as the
+# chunked rewriter; each chunk is edited against the matching stretch of the raw text.
+def align_chunks(text: str, chunks):
+    """Split text into len(chunks) parts at the same relative word positions as chunks."""
+    paragraphs = [p.strip() for p in text.split("\n") if p.strip()]
+    total = sum(len(p.split()) for chunk in chunks for p in chunk) or 1
+    text_total = sum(len(p.split()) for p in paragraphs)
+    bounds, seen = [], 0
+    for chunk in chunks[:-1]:
+        seen += sum(len(p.split()) for p in chunk)
+        bounds.append(text_total * seen / total)
+
+    parts, position = [[] for _ in chunks], 0
+    for paragraph in paragraphs:
+        index = sum(1 for bound in bounds if position >= bound)
+        parts[index].append(paragraph)
+        position += len(paragraph.split())
+    return parts
+
+def build_editor_chunk_prompts(raw_data, reviewed_data, chunks, raw_chunks, index: int,
+                               overlap_paragraphs: int = 1):
+    """Return the (system, user) prompts for editing chunk `index` of a reviewed chapter.
+
+    Neighbouring paragraphs are included read-only so the edit stays
+    continuous across chunk boundaries.
+    """
+    chunk_text = "\n".join(chunks[index])
+    raw_text = "\n".join(raw_chunks[index])
+    system_prompt, _ = build_editor_prompts(
+        {"metadata": raw_data["metadata"], "content": raw_text},
+        {"metadata": reviewed_data["metadata"], "content": chunk_text}
+    )
+    before, after = "(start of chapter)", "(end of chapter)"
+    if overlap_paragraphs and index > 0:
+        before = "\n".join(chunks[index - 1][-overlap_paragraphs:])
+    if overlap_paragraphs and index + 1 < len(chunks):
+        after = "\n".join(chunks[index + 1][:overlap_paragraphs])
+
+    user_prompt = textwrap.dedent(f"""
+        ### Chapter Revision Task (Excerpt)
+        **Title**: {raw_data["metadata"].get("chapter_title", "Untitled")}
+        **Book**: {raw_data["metadata"].get("book_title", "Untitled")}
+        **Author**: {raw_data["metadata"].get("author", "Untitled")}
+        **Part**: {index + 1} of {len(chunks)}
+        **excerpt word count**: {len(chunk_text.split())}
+
+        ### Reviewer Feedback (for the whole chapter):
+        {reviewed_data["metadata"].get("reviewer_feedback", "None provided")}
+
+        ### Original Text of This Part (Reference):
+        {raw_text}
+
+        ### Preceding Context (do not edit):
+        {before}
+
+        ### Current Rewritten Excerpt (To Edit):
+        {chunk_text}
+
+        ### Following Context (do not edit):
+        {after}
+
+        Revise ONLY the excerpt, addressing the reviewer concerns that apply to it.
+        Return ONLY the revised excerpt, no additional commentary.
+    """)
+    return system_prompt, user_prompt
+
+async def editor_chunked_async(raw_data, reviewed_data, max_chunk_words: int = DEFAULT_CHUNK_WORDS,
+                               overlap_paragraphs: int = 1, provider: str = "gemini", use_cache: bool = True):
+    """Edit a long chapter chunk by chunk, with all chunks in flight concurrently."""
+    chunks = split_into_chunks(reviewed_data["content"], max_chunk_words)
+    if len(chunks) <= 1:
+        return await editor_async(raw_data, reviewed_data, provider, use_cache)
+    raw_chunks = align_chunks(raw_data["content"], chunks)
+
+    async def edit_chunk(index):
+        system_prompt, user_prompt = build_editor_chunk_prompts(
+            raw_data, reviewed_data, chunks, raw_chunks, index, overlap_paragraphs
+        )
+        text = await agenerate(provider, EDITOR_MODEL, system_prompt, user_prompt, use_cache)
+        if not text:
+            raise RuntimeError(f"{provider} failed to generate content for part {index + 1}")
+        return text.strip()
+
+    parts = await asyncio.gather(*(edit_chunk(i) for i in range(len(chunks))))
+    return "\n".join(parts)
+
+def editor_chunked(raw_data, reviewed_data, max_chunk_words: int = DEFAULT_CHUNK_WORDS,
+                   overlap_paragraphs: int = 1, use_cache: bool = True):
+    """Blocking wrapper around editor_chunked_async for sync callers."""
+    return asyncio.run(editor_chunked_async(
+        raw_data, reviewed_data, max_chunk_words, overlap_paragraphs, use_cache=use_cache
+    ))
+
 # Call editor function
 # edited_content = editor(raw_data, reviewed_data)
 
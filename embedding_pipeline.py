@@ -0,0 +1,222 @@
+"""Batched embedding stage for chapter versions, with a paragraph-level cache.
+
+Consecutive versions of a chapter share most of their paragraphs, so
+documents are embedded paragraph by paragraph. Each paragraph is keyed by
+the hash of its text, and only paragraphs never seen before go to the model,
+in batches. A document's embedding is the length-weighted mean of its
+paragraph embeddings, L2-normalized, computed for the whole batch at once
+with NumPy. This also means long chapters are represented beyond the
+model's 256-token window.
+
+Set EMBEDDING_CACHE_PATH to move the cache (default ./cache/embeddings.sqlite3).
+"""
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_PATH = Path(os.getenv("EMBEDDING_CACHE_PATH", "./cache/embeddings.sqlite3"))
+DEFAULT_MODEL_NAME = "all-MiniLM-L6-v2"
+DEFAULT_BATCH_SIZE = 64
+_SQLITE_MAX_PARAMS = 500
+
+
+def paragraph_spans(text: str) -> List[Tuple[int, int]]:
+    """(start, end) character offsets of each non-empty, stripped line of text."""
+    spans = []
+    position = 0
+    for line in text.split("\n"):
+        stripped = line.strip()
+        if stripped:
+            start = position + len(line) - len(line.lstrip())
+            spans.append((start, start + len(stripped)))
+        position += len(line) + 1
+    return spans
+
+
+def split_paragraphs(text: str) -> List[str]:
+    """Non-empty paragraphs of a chapter, one per line as the scraper stores them."""
+    return [text[start:end] for start, end in paragraph_spans(text)]
+
+
+def paragraph_hash(paragraph: str) -> str:
+    return hashlib.sha256(paragraph.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite store of paragraph embeddings keyed by (model, paragraph hash)."""
+
+    def __init__(self, path: Path = EMBEDDING_CACHE_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL,"
+                " hash TEXT NOT NULL,"
+                " vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, hash)"
+                ") WITHOUT ROWID"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, np.ndarray]:
+        conn = self._connect()
+        found = {}
+        for i in range(0, len(hashes), _SQLITE_MAX_PARAMS):
+            chunk = hashes[i:i + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = conn.execute(
+                f"SELECT hash, vector FROM embeddings WHERE model = ? AND hash IN ({placeholders})",
+                (model, *chunk)
+            )
+            for key, blob in rows:
+                found[key] = np.frombuffer(blob, dtype=np.float32)
+        return found
+
+    def put_many(self, model: str, vectors: Dict[str, np.ndarray]):
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, hash, vector) VALUES (?, ?, ?)",
+                ((model, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in vectors.items())
+            )
+
+    def count(self, model: str) -> int:
+        return self._connect().execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (model,)).fetchone()[0]
+
+
+class EmbeddingPipeline:
+    """Embeds batches of documents through the paragraph cache."""
+
+    def __init__(self, embedding_function: Optional[Callable] = None, model_name: str = DEFAULT_MODEL_NAME,
+                 batch_size: int = DEFAULT_BATCH_SIZE, cache: Optional[EmbeddingCache] = None):
+        self._embedding_function = embedding_function
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.cache = cache or EmbeddingCache()
+        self.stats = {"documents": 0, "paragraphs": 0, "embedded": 0, "cache_hits": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    @property
+    def embedding_function(self) -> Callable:
+        if self._embedding_function is None:
+            from semantic_search import local_embedding_function
+
+            self._embedding_function = local_embedding_function()
+        return self._embedding_function
+
+    def _embed_missing(self, texts: Dict[str, str]) -> Dict[str, np.ndarray]:
+        """Embed paragraphs (hash -> text) in batches and store them in the cache."""
+        keys = list(texts)
+        vectors = {}
+        for i in range(0, len(keys), self.batch_size):
+            batch = keys[i:i + self.batch_size]
+            embedded = np.asarray(self.embedding_function([texts[key] for key in batch]), dtype=np.float32)
+            new = dict(zip(batch, embedded))
+            self.cache.put_many(self.model_name, new)
+            vectors.update(new)
+        return vectors
+
+    def _lookup(self, texts: Dict[str, str]) -> Tuple[Dict[str, np.ndarray], int]:
+        """Vectors for paragraphs (hash -> text), embedding only cache misses; returns (vectors, hits)."""
+        vectors = self.cache.get_many(self.model_name, list(texts))
+        hits = len(vectors)
+        vectors.update(self._embed_missing({key: text for key, text in texts.items() if key not in vectors}))
+        return vectors, hits
+
+    def embed_paragraphs(self, paragraphs: List[str]) -> np.ndarray:
+        """One embedding per paragraph, shape (len(paragraphs), dim), served from the cache where possible."""
+        if not paragraphs:
+            return np.zeros((0, 0), dtype=np.float32)
+        keys = [paragraph_hash(p) for p in paragraphs]
+        vectors, _ = self._lookup(dict(zip(keys, paragraphs)))
+        return np.stack([vectors[key] for key in keys])
+
+    def embed_documents(self, documents: Iterable[str]) -> np.ndarray:
+        """One L2-normalized embedding per document, shape (len(documents), dim)."""
+        start = time.perf_counter()
+        doc_paragraphs = [split_paragraphs(doc) or [doc] for doc in documents]
+        if not doc_paragraphs:
+            return np.zeros((0, 0), dtype=np.float32)
+        doc_hashes = [[paragraph_hash(p) for p in paragraphs] for paragraphs in doc_paragraphs]
+
+        unique: Dict[str, str] = {}
+        for paragraphs, hashes in zip(doc_paragraphs, doc_hashes):
+            for paragraph, key in zip(paragraphs, hashes):
+                unique.setdefault(key, paragraph)
+
+        vectors, hits = self._lookup(unique)
+
+        # Weighted mean per document over a flat (all paragraphs, dim) matrix
+        row_of = {key: row for row, key in enumerate(unique)}
+        matrix = np.stack([vectors[key] for key in unique])
+        rows = np.fromiter((row_of[key] for hashes in doc_hashes for key in hashes), dtype=np.intp)
+        weights = np.fromiter((max(len(p.split()), 1) for paragraphs in doc_paragraphs for p in paragraphs),
+                              dtype=np.float32)
+        offsets = np.cumsum([0] + [len(hashes) for hashes in doc_hashes[:-1]])
+        pooled = np.add.reduceat(matrix[rows] * weights[:, None], offsets, axis=0)
+        pooled /= np.add.reduceat(weights, offsets)[:, None]
+        pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.stats["documents"] += len(doc_paragraphs)
+            self.stats["paragraphs"] += len(rows)
+            self.stats["embedded"] += len(unique) - hits
+            self.stats["cache_hits"] += hits
+            self.stats["seconds"] += elapsed
+        logger.info(f"Embedded {len(doc_paragraphs)} documents in {elapsed:.2f}s "
+                    f"({len(unique) - hits} new paragraphs, {hits} cached)")
+        return pooled
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        seconds = stats["seconds"]
+        stats["documents_per_second"] = stats["documents"] / seconds if seconds else 0.0
+        stats["paragraphs_per_second"] = stats["paragraphs"] / seconds if seconds else 0.0
+        lookups = stats["embedded"] + stats["cache_hits"]
+        stats["cache_hit_rate"] = stats["cache_hits"] / lookups if lookups else 0.0
+        stats["cached_paragraphs"] = self.cache.count(self.model_name)
+        return stats
+
+
+_pipeline: Optional[EmbeddingPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_embedding_pipeline() -> EmbeddingPipeline:
+    """Process-wide embedding pipeline, created on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = EmbeddingPipeline()
+        return _pipeline
+
+
+def embed_documents(documents: Iterable[str]) -> np.ndarray:
+    """Embed documents through the shared pipeline."""
+    return get_embedding_pipeline().embed_documents(documents)
+
+
+def get_embedding_stats() -> Dict:
+    """Ingest throughput and cache counters of the shared pipeline."""
+    return get_embedding_pipeline().get_stats()
@@ -0,0 +1,106 @@
+"""Local HTTP server for Wikisource-like HTML fixtures.
+
+Serves ``fixtures/wikisource`` so the scraper can be exercised offline:
+``/wiki/The_Gates_of_Morning/Book_1/Chapter_1`` maps to
+``fixtures/wikisource/wiki/The_Gates_of_Morning/Book_1/Chapter_1.html``.
+
+    with serve_fixtures() as base_url:
+        data = extract_chapter_info(f"{base_url}/wiki/The_Gates_of_Morning/Book_1/Chapter_1")
+
+Run ``python fixture_server.py`` to serve the fixtures on port 8000.
+"""
+import argparse
+import gzip
+import hashlib
+import io
+import threading
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import unquote, urlparse
+
+FIXTURES_DIR = Path(__file__).parent / "fixtures" / "wikisource"
+
+
+class FixtureRequestHandler(SimpleHTTPRequestHandler):
+    """Maps extensionless wiki paths to .html fixture files."""
+
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real site
+
+    def translate_path(self, path):
+        parsed = unquote(urlparse(path).path)
+        if not Path(parsed).suffix:
+            parsed += ".html"
+        return super().translate_path(parsed)
+
+    def send_head(self):
+        # Serve pages with ETag/Last-Modified validators, answer conditional
+        # requests with 304, and gzip for clients that accept it, as Wikisource does
+        path = Path(self.translate_path(self.path))
+        if not path.is_file():
+            return super().send_head()
+        raw = path.read_bytes()
+        etag = f'"{hashlib.sha1(raw).hexdigest()}"'
+        last_modified = self.date_time_string(int(path.stat().st_mtime))
+
+        if self._not_modified(etag, int(path.stat().st_mtime)):
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Last-Modified", last_modified)
+            self.end_headers()
+            return None
+
+        gzipped = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = gzip.compress(raw) if gzipped else raw
+        self.send_response(200)
+        self.send_header("Content-Type", self.guess_type(str(path)))
+        if gzipped:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.end_headers()
+        return io.BytesIO(body)
+
+    def _not_modified(self, etag, mtime):
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return mtime <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve_fixtures(root: Path = FIXTURES_DIR, host: str = "127.0.0.1", port: int = 0):
+    """Serve fixture pages in a background thread; yields the base URL."""
+    handler = partial(FixtureRequestHandler, directory=str(root))
+    server = ThreadingHTTPServer((host, port), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield f"http://{host}:{server.server_address[1]}"
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve Wikisource-like fixture pages")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    with serve_fixtures(port=args.port) as base_url:
+        print(f"Serving {FIXTURES_DIR} at {base_url}/wiki/ (Ctrl+C to stop)")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
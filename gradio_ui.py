@@ -1,35 +1,34 @@
 import gradio as gr
-from ScreenShot_scrapper import extract_chapter_info
+from ScreenShot_scrapper import scrape_raw_if_changed
 from save import (
-    save_chapter_auto_version, get_latest_version, fetch_chapter_by_version,
-    format_chapter_markdown, get_next_version, intelligent_search,
+    save_chapter_auto_version,
+    format_chapter_markdown,
     search_by_stage_progression, provide_search_feedback, get_search_analytics,
     save_rl_model, select_policy_stage, update_policy_stage as update_policy,
-    get_policy_stats, save_policy_model
+    get_policy_stats, get_ingest_stats, best_passages,
+    get_latest_across_stages, get_read_cache_stats, get_version_store_stats
 )
-from Rewriter import rewriter
+from Rewriter import rewriter_stream, build_rewritten_data, build_rewriter_prompts
 from Reviewer import reviwer
-from editor import editor
+from editor import editor_stream
+from llm_cache import get_cache_stats
+from llm_client import get_stream_metrics
+from crawler import base_id_from_url
+from session_store import SessionStore, DEFAULT_SESSION_ID
+from job_queue import get_job_queue
+from speculator import SPECULATION_ENABLED, get_speculator
+from llm_client import estimate_tokens
 import traceback
+import time
+import os
 
-# Global state management
-STATE = {
-    "current_stage": "init",
-    "raw_data": None,
-    "rewritten_data": None,
-    "reviewed_data": None,
-    "edited_data": None,
-    "special_instruction": "None",
-    "editing_content": False,
-    "editing_feedback": False,
-    "last_policy_suggestion": None,  
-    "policy_feedback": []
-}
-
-def reset_state():
-    """Reset the global state"""
-    global STATE
-    STATE = {
+DEFAULT_BASE_ID = "chapter1"
+UI_CONCURRENCY = int(os.getenv("UI_CONCURRENCY", "8"))
+
+def new_state():
+    """Fresh workflow state for one browser session"""
+    return {
+        "base_id": DEFAULT_BASE_ID,
         "current_stage": "init",
         "raw_data": None,
         "rewritten_data": None,
@@ -37,9 +36,30 @@ def reset_state():
         "edited_data": None,
         "special_instruction": "None",
         "editing_content": False,
-        "editing_feedback": False
+        "editing_feedback": False,
+        "last_policy_suggestion": None,
+        "policy_feedback": [],
+        "last_search_id": None,
+        "active_job": None,
+        "regenerate": False
     }
 
+# Workflow state per browser session, so concurrent editors don't share chapter data
+SESSIONS = SessionStore(new_state)
+
+def session_id(request: gr.Request):
+    return getattr(request, "session_hash", None) or DEFAULT_SESSION_ID
+
+def session_state(request: gr.Request):
+    """Workflow state of the session that sent the request"""
+    state = SESSIONS.get(session_id(request))
+    state["session_id"] = session_id(request)
+    return state
+
+def reset_state(request: gr.Request, **values):
+    """Start the session over with a fresh state"""
+    return SESSIONS.reset(session_id(request), session_id=session_id(request), **values)
+
 def safe_execute(func, *args, **kwargs):
     """Safely execute functions with error handling"""
     try:
@@ -49,7 +69,7 @@ def safe_execute(func, *args, **kwargs):
         print(f"Error details: {traceback.format_exc()}")
         return error_msg
 
-def fetch_chapter(url):
+def fetch_chapter(url, capture_screenshot=False, speculate=False, request: gr.Request = None):
     """Fetch chapter from Wikisource URL with RL search integration"""
     if not url or not url.strip():
         return create_error_response("❌ Please enter a URL!")
@@ -59,17 +79,17 @@ def fetch_chapter(url):
     
 
     try:
-        reset_state()
-        data = extract_chapter_info(url)
+        # Any speculation for the previous chapter is now useless
+        get_speculator().cancel(session_id(request))
+        state = reset_state(request, base_id=base_id_from_url(url))
+        # Save raw data, unless the page is unchanged since the last fetch
+        outcome = scrape_raw_if_changed(url, state["base_id"], screenshot=capture_screenshot)
+        data = outcome["data"]
         
         if not data or not data.get("content"):
             return create_error_response("❌ Failed to extract chapter content!")
-        
-        # Save raw data
-        save_chapter_auto_version({
-            **data,
-            "reviewer_feedback": ""
-        }, base_id="chapter1", stage="raw")
+        if outcome["changed"] and not outcome["saved"]:
+            return create_error_response("❌ Failed to save chapter!")
 
         # Get policy suggestion with context
         next_action = select_policy_stage({
@@ -77,27 +97,32 @@ def fetch_chapter(url):
             "url": url,
             "previous_actions": []
         })
-        STATE["last_policy_suggestion"] = next_action
+        state["last_policy_suggestion"] = next_action
         print(f"🤖 Policy suggests next stage: {next_action}")
 
         # Update state
-        STATE["raw_data"] = {
+        raw_versioned_id = outcome["versioned_id"]
+        state["raw_data"] = {
             "content": data["content"],
             "metadata": {
                 **data,
-                "version": get_latest_version("chapter1", "raw"),
+                "version": int(raw_versioned_id.rsplit("_ver", 1)[1]),
                 "stage": "raw",
-                "versioned_id": f"chapter1_ver{get_latest_version('chapter1', 'raw')}",
+                "versioned_id": raw_versioned_id,
                 "reviewer_feedback": ""
             }
         }
-        STATE["current_stage"] = "raw"
+        state["current_stage"] = "raw"
 
         suggestion_text = f"🤖 Suggested Next Step: {next_action.capitalize()}"
+        if speculate and start_speculation(state, next_action):
+            suggestion_text += " (⚡ already running in the background)"
+        if not outcome["changed"]:
+            suggestion_text = f"ℹ️ Source unchanged, reusing {state['raw_data']['metadata']['versioned_id']}\n" + suggestion_text
         button_states = get_button_states_for_action(next_action)
         
         return (
-            format_chapter_markdown(STATE["raw_data"]),
+            format_chapter_markdown(state["raw_data"]),
             gr.update(value=suggestion_text),
             *button_states
         )
@@ -105,6 +130,17 @@ def fetch_chapter(url):
     except Exception as e:
         return create_error_response(f"❌ Error fetching chapter: {str(e)}")
     
+def load_screenshot(request: gr.Request):
+    """Load the current chapter's page screenshot on demand"""
+    state = session_state(request)
+    raw_data = state.get("raw_data")
+    path = raw_data["metadata"].get("screenshot_path") if raw_data else None
+    if not path:
+        return gr.update(value=None, visible=False), "No screenshot was captured for this chapter."
+    if not os.path.exists(path):
+        return gr.update(value=None, visible=False), "⏳ Screenshot is still being captured, try again shortly."
+    return gr.update(value=path, visible=True), ""
+
 def get_button_states_for_action(action):
     """Return button visibility states based on suggested action"""
     base_states = [
@@ -136,19 +172,37 @@ def create_error_response(error_msg):
         gr.update(visible=False)  # special_panel
     )
 
-def smart_content_search(query):
+def highlight_passage(passage, highlights):
+    """Bold the highlighted spans of a passage for Markdown display"""
+    parts, last = [], 0
+    for start, end in highlights:
+        parts.append(passage[last:start])
+        parts.append(f"**{passage[start:end]}**")
+        last = end
+    parts.append(passage[last:])
+    return "".join(parts)
+
+NO_USEFUL_RESULT = "None of these"
+
+def smart_content_search(query, request: gr.Request):
     """Search content using RL algorithm"""
+    state = session_state(request)
+    no_feedback = gr.update(choices=[], value=None, visible=False)
     if not query or not query.strip():
-        return "Please enter a search query"
+        return "Please enter a search query", no_feedback, gr.update(visible=False)
     
     try:
         results = search_by_stage_progression(query)
         
         if not results:
-            return "No results found"
+            return "No results found", no_feedback, gr.update(visible=False)
         
+        results = results[:3]
+        state["last_search_id"] = results[0].get('search_id')
+        passages = best_passages(query, [r.get('id') for r in results if r.get('id')])
+
         formatted_results = "## 🔍 Smart Search Results\n\n"
-        for i, result in enumerate(results[:3], 1):
+        for i, result in enumerate(results, 1):
             metadata = result.get('metadata', {})
             relevance = result.get('relevance_score', 0)
             
@@ -156,17 +210,39 @@ def smart_content_search(query):
             formatted_results += f"**Title:** {metadata.get('chapter_title', 'N/A')}\n"
             formatted_results += f"**Stage:** {metadata.get('stage', 'N/A')} | **Version:** {metadata.get('version', 'N/A')}\n"
             
-            content_preview = result.get('content', '')[:200]
-            formatted_results += f"**Content Preview:** {content_preview}...\n\n"
+            passage = passages.get(result.get('id'))
+            if passage:
+                formatted_results += f"**Matching Passage** (paragraph {passage['metadata']['paragraph'] + 1}): "
+                formatted_results += f"{highlight_passage(passage['content'], passage['highlights'])}\n\n"
+            else:
+                content_preview = result.get('content', '')[:200]
+                formatted_results += f"**Content Preview:** {content_preview}...\n\n"
             formatted_results += "---\n\n"
         
-        provide_search_feedback(clicked_result=True, satisfaction_score=4)
-        return formatted_results
+        choices = [f"Result {i}" for i in range(1, len(results) + 1)] + [NO_USEFUL_RESULT]
+        return formatted_results, gr.update(choices=choices, value=None, visible=True), gr.update(visible=True)
         
     except Exception as e:
-        return f"❌ Search error: {str(e)}"
+        return f"❌ Search error: {str(e)}", no_feedback, gr.update(visible=False)
+
+def submit_search_feedback(choice, satisfaction, request: gr.Request):
+    """Reward the ranker for the result the user found most useful"""
+    state = session_state(request)
+    if not choice:
+        return "Pick the most useful result first"
+    if not state.get("last_search_id"):
+        return "Run a search first"
+    clicked = choice != NO_USEFUL_RESULT
+    rank = int(choice.split()[-1]) - 1 if clicked else 0
+    feedback = provide_search_feedback(clicked_result=clicked, satisfaction_score=int(satisfaction),
+                                       search_id=state["last_search_id"], result_rank=rank)
+    if feedback.get("reward") is None:
+        return "⚠️ Feedback not recorded (search expired)"
+    state["last_search_id"] = None
+    return f"✅ Feedback recorded (reward {feedback['reward']:.2f})"
 
-def show_analytics():
+def show_analytics(request: gr.Request):
+    state = session_state(request)
     try:
         stats = get_search_analytics()
         policy_info = get_policy_stats()
@@ -175,7 +251,7 @@ def show_analytics():
         
         # Policy Insights
         analytics += "### 🤖 Policy Insights\n"
-        analytics += f"**Last Suggestion:** {STATE.get('last_policy_suggestion', 'None')}\n"
+        analytics += f"**Last Suggestion:** {state.get('last_policy_suggestion', 'None')}\n"
         analytics += "**Action Preferences:**\n"
         for action, pref in policy_info["preferences"].items():
             prob = policy_info["probabilities"][action]
@@ -185,184 +261,191 @@ def show_analytics():
         if stats:
             analytics += "\n### 🔍 Search Analytics\n"
             analytics += f"**Total Searches:** {stats.get('total_searches', 0)}\n"
-            analytics += f"**Average Reward:** {stats.get('average_reward', 0):.3f}\n"
+            if 'average_reward' in stats:
+                analytics += f"**Average Reward:** {stats['average_reward']:.3f}\n"
+            if 'latency_ms_p50' in stats:
+                analytics += f"**Query Latency:** p50 {stats['latency_ms_p50']:.1f} ms, p95 {stats['latency_ms_p95']:.1f} ms\n"
             if 'action_distribution' in stats:
                 analytics += "**Action Usage:**\n"
                 for action, count in stats['action_distribution'].items():
                     analytics += f"- {action}: {count}\n"
+
+        stream_stats = get_stream_metrics()
+        if stream_stats.get("streams"):
+            analytics += "\n### ⚡ Streaming\n"
+            analytics += f"**Streams:** {stream_stats['streams']} | "
+            analytics += f"**Time to First Token:** p50 {stream_stats['ttft_p50']:.2f}s, p95 {stream_stats['ttft_p95']:.2f}s\n"
+
+        ingest_stats = get_ingest_stats()
+        if ingest_stats.get("documents"):
+            analytics += "\n### 🧮 Embedding Ingest\n"
+            analytics += f"**Throughput:** {ingest_stats['documents_per_second']:.1f} versions/s, "
+            analytics += f"{ingest_stats['paragraphs_per_second']:.0f} paragraphs/s\n"
+            analytics += f"**Paragraph Cache Hit Rate:** {ingest_stats['cache_hit_rate']:.0%} "
+            analytics += f"({ingest_stats['cached_paragraphs']} cached)\n"
+
+        analytics += "\n### 🗂️ Stage Job Queue\n"
+        for stage, depth in get_job_queue().depth().items():
+            analytics += f"- {JOB_LABELS[stage]}: {depth['queued']} waiting, {depth['running']}/{depth['workers']} running\n"
+
+        speculation_stats = get_speculator().get_stats()
+        if speculation_stats["started"]:
+            analytics += "\n### ⚡ Speculation\n"
+            analytics += f"**Started:** {speculation_stats['started']} | **Used:** {speculation_stats['hits']} | "
+            analytics += f"**Hit Rate:** {speculation_stats['hit_rate']:.0%} | **Cancelled:** {speculation_stats['cancelled']}\n"
+            analytics += f"**Tokens:** {speculation_stats['tokens_spent']} spent, {speculation_stats['tokens_used']} used "
+            analytics += f"({speculation_stats['token_efficiency']:.0%}); {speculation_stats['over_budget']} skipped over budget\n"
+
+        read_stats = get_read_cache_stats()
+        analytics += "\n### 📦 Version Store Reads\n"
+        analytics += f"**Version Cache Hit Rate:** {read_stats['version_hit_rate']:.0%} "
+        analytics += f"({read_stats['cached_versions']} versions cached) | "
+        analytics += f"**Pointer Cache Hits:** {read_stats['pointer_hits']}/{read_stats['pointer_hits'] + read_stats['pointer_misses']}\n"
+
+        store_stats = get_version_store_stats()
+        if store_stats.get("versions"):
+            analytics += f"**Delta Store:** {store_stats['versions']} versions "
+            analytics += f"({store_stats['snapshots']} snapshots), {store_stats['raw_bytes'] / 1024:.0f} KB of text "
+            analytics += f"in {store_stats['stored_bytes'] / 1024:.0f} KB ({store_stats['compression_ratio']:.1f}x)\n"
+
+        cache_stats = get_cache_stats()
+        analytics += "\n### 💾 LLM Response Cache\n"
+        analytics += f"**Hits:** {cache_stats['hits']} | **Misses:** {cache_stats['misses']} | "
+        analytics += f"**Hit Rate:** {cache_stats['hit_rate']:.0%}\n"
+        analytics += f"**Entries:** {cache_stats['entries']} ({cache_stats['bytes'] / 1024:.0f} KB)\n"
         
         return analytics
     except Exception as e:
         return f"❌ Analytics error: {str(e)}"
-def rewrite_chapter(use_special):
-    """Handle chapter rewriting"""
-    if STATE["raw_data"] is None:
-        latest = get_latest_version("chapter1", "raw")
-        if latest == 0:
-            return create_error_response("❌ No raw data found!")
-        STATE["raw_data"] = fetch_chapter_by_version(f"chapter1_ver{latest}", "raw")
-
-    if use_special:
-        return (
-            STATE["raw_data"] and format_chapter_markdown(STATE["raw_data"]) or "No data",
-            gr.update(value=""),
-            gr.update(visible=False),  # rewrite_btn
-            gr.update(visible=False),  # rewrite_special_btn
-            gr.update(visible=False),  # rewrite_again_btn
-            gr.update(visible=False),  # reviewer_btn
-            gr.update(visible=False),  # editor_btn
-            gr.update(visible=False),  # edit_btn
-            gr.update(visible=False),  # edit_feedback_btn
-            gr.update(visible=False),  # finalize_btn
-            gr.update(visible=False),  # status_output
-            gr.update(visible=True)    # special_panel
-        )
-    else:
-        try:
-            result = rewriter(STATE["raw_data"], "None")
-            rewritten_content = {
-                "content": result.get("content", result) if isinstance(result, dict) else result,
-                "metadata": {**STATE["raw_data"]["metadata"], "reviewer_feedback": ""}
-            }
-            
-            if isinstance(result, dict):
-                rewritten_content["metadata"].update(result)
-            
-            STATE["rewritten_data"] = rewritten_content
-            STATE["current_stage"] = "rewritten"
-            
-            save_chapter_auto_version({
-                **rewritten_content["metadata"], 
-                "content": rewritten_content["content"]
-            }, "chapter1", "rewritten")
-            reward = 1 if STATE["last_policy_suggestion"] == "rewritten" else 0.5
-            update_policy("rewritten", reward)
-
-            return (
-                format_chapter_markdown(rewritten_content),
-                gr.update(value=""),
-                gr.update(visible=False),  # rewrite_btn
-                gr.update(visible=False),  # rewrite_special_btn
-                gr.update(visible=True),   # rewrite_again_btn
-                gr.update(visible=True),   # reviewer_btn
-                gr.update(visible=False),  # editor_btn
-                gr.update(visible=True),   # edit_btn
-                gr.update(visible=False),  # edit_feedback_btn
-                gr.update(visible=True),   # finalize_btn
-                gr.update(visible=False),  # status_output
-                gr.update(visible=False)   # special_panel
-            )
-        except Exception as e:
-            update_policy("rewritten", -0.5)
-            return create_error_response(f"❌ Error during rewriting: {str(e)}")
+def streaming_response(chapter_data):
+    """Partial update while a stage is streaming: refresh the main window only"""
+    return (
+        format_chapter_markdown(chapter_data),
+        gr.update(),
+        *[gr.update()] * 9
+    )
 
-def save_special_instruction(instr):
-    """Save special instruction and rewrite"""
-    STATE["special_instruction"] = instr or "None"
-    
+JOB_LABELS = {"rewritten": "Rewrite", "reviewed": "Review", "edited": "Edit"}
+
+def load_raw_data(state):
+    """The session's raw chapter, loaded from storage if not in memory"""
+    if state["raw_data"] is None:
+        state["raw_data"] = get_latest_across_stages(state["base_id"], ["raw"]) or None
+    return state["raw_data"]
+
+def saved_version(state, data, stage):
+    """Save a stage version for the session's chapter and return its versioned id"""
+    versioned_id = save_chapter_auto_version(data, state["base_id"], stage)
+    if not versioned_id:
+        raise RuntimeError(f"Failed to save {stage} version")
+    return versioned_id
+
+def speculative_rewrite(speculation, raw_data, use_cache=True):
+    """Rewrite without saving, stopping early if the speculation is cancelled"""
+    text = ""
+    for text in rewriter_stream(raw_data, "None", use_cache=use_cache):
+        if speculation.cancelled.is_set():
+            return None
+        speculation.partial = text
+    return text
+
+def start_speculation(state, next_action):
+    """Start the suggested stage in the background; only the rewrite can run before any click"""
+    if next_action != "rewritten":
+        return False
+    raw_data = state["raw_data"]
+    tokens = estimate_tokens(*build_rewriter_prompts(raw_data), raw_data["content"])
+    return get_speculator().start(state["session_id"], "rewritten", raw_data["metadata"]["versioned_id"],
+                                  tokens, speculative_rewrite, raw_data, not state["regenerate"])
+
+def speculated_rewrite(job, state, partial_metadata):
+    """Text of a matching speculative rewrite, following it if it is still running"""
+    speculation = get_speculator().claim(state["session_id"], "rewritten",
+                                         state["raw_data"]["metadata"].get("versioned_id"))
+    if speculation is None:
+        return None
+    while not speculation.wait(0.5):
+        if speculation.partial:
+            job.report(speculation.partial, partial_metadata)
+    return speculation.result if speculation.status == "done" else None
+
+def rewrite_job(job, state, instructions):
+    """Rewrite the raw chapter in the background, streaming into the job"""
+    raw_data = state["raw_data"]
+    # After "Rewrite Again" the prompt is unchanged, so skip the response cache
+    use_cache = not state["regenerate"]
     try:
-        result = rewriter(STATE["raw_data"], instr or "None")
+        partial_metadata = {**raw_data["metadata"], "stage": "rewriting…", "reviewer_feedback": ""}
+        text = ""
+        if instructions == "None":
+            text = speculated_rewrite(job, state, partial_metadata) or ""
+        else:
+            get_speculator().cancel(state["session_id"])
+        speculated = bool(text)
+        if not speculated:
+            for text in rewriter_stream(raw_data, instructions, use_cache=use_cache):
+                job.report(text, partial_metadata)
+
+        # Persist only once the full rewrite has arrived
+        result = build_rewritten_data(raw_data, text)
         rewritten_content = {
-            "content": result.get("content", result) if isinstance(result, dict) else result,
-            "metadata": {**STATE["raw_data"]["metadata"], "reviewer_feedback": ""}
+            "content": result["content"],
+            "metadata": {**raw_data["metadata"], "reviewer_feedback": ""}
         }
-        
-        if isinstance(result, dict):
-            rewritten_content["metadata"].update(result)
-        
-        STATE["rewritten_data"] = rewritten_content
-        STATE["current_stage"] = "rewritten"
-        
-        save_chapter_auto_version({
-            **rewritten_content["metadata"], 
-            "content": rewritten_content["content"]
-        }, "chapter1", "rewritten")
+        rewritten_content["metadata"].update(result)
 
-        return (
-            format_chapter_markdown(rewritten_content),
-            gr.update(value=""),
-            gr.update(visible=False),  # rewrite_btn
-            gr.update(visible=False),  # rewrite_special_btn
-            gr.update(visible=True),   # rewrite_again_btn
-            gr.update(visible=True),   # reviewer_btn
-            gr.update(visible=False),  # editor_btn
-            gr.update(visible=True),   # edit_btn
-            gr.update(visible=False),  # edit_feedback_btn
-            gr.update(visible=True),   # finalize_btn
-            gr.update(visible=False),  # status_output
-            gr.update(visible=False)   # special_panel
-        )
-    except Exception as e:
-        return create_error_response(f"❌ Error during special rewrite: {str(e)}")
-
-def rewrite_again():
-    """Reset to raw stage for rewriting"""
-    if STATE["raw_data"] is None:
-        latest = get_latest_version("chapter1", "raw")
-        if latest == 0:
-            return create_error_response("❌ No raw data found!")
-        STATE["raw_data"] = fetch_chapter_by_version(f"chapter1_ver{latest}", "raw")
-
-    STATE["current_stage"] = "raw"
-    return (
-        format_chapter_markdown(STATE["raw_data"]),
-        gr.update(value=""),
-        gr.update(visible=True),   # rewrite_btn
-        gr.update(visible=True),   # rewrite_special_btn
-        gr.update(visible=False),  # rewrite_again_btn
-        gr.update(visible=False),  # reviewer_btn
-        gr.update(visible=False),  # editor_btn
-        gr.update(visible=False),  # edit_btn
-        gr.update(visible=False),  # edit_feedback_btn
-        gr.update(visible=False),  # finalize_btn
-        gr.update(visible=False),  # status_output
-        gr.update(visible=False)   # special_panel
-    )
+        versioned_id = saved_version(state, {
+            **rewritten_content["metadata"],
+            "content": rewritten_content["content"]
+        }, "rewritten")
+        state["rewritten_data"] = rewritten_content
+        state["current_stage"] = "rewritten"
+        state["regenerate"] = False
+    except Exception:
+        update_policy("rewritten", -0.5)
+        raise
+    reward = 1 if state["last_policy_suggestion"] == "rewritten" else 0.5
+    update_policy("rewritten", reward)
+    return {"versioned_id": versioned_id, "speculated": speculated}
 
-def review_chapter():
-    """Handle review stage"""
+def review_job(job, state):
+    """Review the latest rewritten/edited version in the background"""
     try:
         # Get raw data
-        latest_raw = get_latest_version("chapter1", "raw")
-        if latest_raw == 0:
-            return create_error_response("❌ No raw data found!")
-        
-        raw_data = fetch_chapter_by_version(f"chapter1_ver{latest_raw}", "raw")
-        if not STATE["raw_data"]:
-            STATE["raw_data"] = raw_data
+        raw_data = get_latest_across_stages(state["base_id"], ["raw"])
+        if not raw_data:
+            raise ValueError("No raw data found!")
+        if not state["raw_data"]:
+            state["raw_data"] = raw_data
 
         # Determine what to review
-        data_to_review = None
-        
-        if STATE["current_stage"] == "edited" and STATE["edited_data"]:
-            data_to_review = STATE["edited_data"]
-        elif STATE["current_stage"] == "rewritten" and STATE["rewritten_data"]:
-            data_to_review = STATE["rewritten_data"]
+        if state["current_stage"] == "edited" and state["edited_data"]:
+            data_to_review = state["edited_data"]
+        elif state["current_stage"] == "rewritten" and state["rewritten_data"]:
+            data_to_review = state["rewritten_data"]
         else:
-            stages_to_check = ["human_edited", "edited", "human_rewritten", "rewritten"]
-            latest_data = None
-            latest_version = 0
-            
-            for stage in stages_to_check:
-                version = get_latest_version("chapter1", stage)
-                if version > 0:
-                    temp_data = fetch_chapter_by_version(f"chapter1_ver{version}", stage)
-                    if temp_data and version > latest_version:
-                        latest_data = temp_data
-                        latest_version = version
-                        break
-            
-            if not latest_data:
-                return create_error_response("❌ No rewritten/edited data found to review!")
-            
-            data_to_review = latest_data
+            data_to_review = get_latest_across_stages(
+                state["base_id"], ["human_edited", "edited", "human_rewritten", "rewritten"]
+            )
+            if not data_to_review:
+                raise ValueError("No rewritten/edited data found to review!")
 
         # Generate feedback
+        job.report(data_to_review["content"], {**data_to_review["metadata"], "stage": "reviewing…"})
         feedback = reviwer(raw_data, data_to_review)
         
-        # Create reviewed data
-        next_version = get_next_version("chapter1")
-        STATE["reviewed_data"] = {
+        # Save reviewed version
+        versioned_id = saved_version(state, {
+            "book_title": data_to_review["metadata"]["book_title"],
+            "author": data_to_review["metadata"]["author"],
+            "chapter_info": data_to_review["metadata"]["chapter_info"],
+            "chapter_title": data_to_review["metadata"]["chapter_title"],
+            "content": data_to_review["content"],
+            "source_url": data_to_review["metadata"]["source_url"],
+            "reviewer_feedback": feedback
+        }, "reviewed")
+        version = int(versioned_id.rsplit("_ver", 1)[1])
+        state["reviewed_data"] = {
             "content": data_to_review["content"],
             "metadata": {
                 "book_title": data_to_review["metadata"]["book_title"],
@@ -371,124 +454,224 @@ def review_chapter():
                 "chapter_title": data_to_review["metadata"]["chapter_title"],
                 "source_url": data_to_review["metadata"]["source_url"],
                 "reviewer_feedback": feedback,
-                "version": next_version,
+                "version": version,
                 "stage": "reviewed",
-                "versioned_id": f"chapter1_ver{next_version}",
+                "versioned_id": versioned_id,
                 "reviewed_from_stage": data_to_review["metadata"].get("stage", "unknown")
             }
         }
-        STATE["current_stage"] = "reviewed"
-        
-        # Save reviewed version
-        save_chapter_auto_version({
-            "book_title": STATE["reviewed_data"]["metadata"]["book_title"],
-            "author": STATE["reviewed_data"]["metadata"]["author"],
-            "chapter_info": STATE["reviewed_data"]["metadata"]["chapter_info"],
-            "chapter_title": STATE["reviewed_data"]["metadata"]["chapter_title"],
-            "content": STATE["reviewed_data"]["content"],
-            "source_url": STATE["reviewed_data"]["metadata"]["source_url"],
-            "reviewer_feedback": feedback
-        }, base_id="chapter1", stage="reviewed")
-        reward = 1 if STATE["last_policy_suggestion"] == "edited" else 0.5
-        update_policy("edited", reward)
-        
+        state["current_stage"] = "reviewed"
+    except Exception:
+        update_policy("edited", -0.5)
+        raise
+    reward = 1 if state["last_policy_suggestion"] == "edited" else 0.5
+    update_policy("edited", reward)
+    return {"versioned_id": versioned_id}
+
+def edit_job(job, state):
+    """Apply the reviewer feedback with the AI editor in the background, streaming into the job"""
+    # Get raw data
+    raw_data = get_latest_across_stages(state["base_id"], ["raw"])
+    if not raw_data:
+        raise ValueError("No raw data found!")
+    if not state["raw_data"]:
+        state["raw_data"] = raw_data
+    
+    # Get reviewed data
+    if state["reviewed_data"] is None:
+        state["reviewed_data"] = get_latest_across_stages(state["base_id"], ["reviewed"]) or None
+        if state["reviewed_data"] is None:
+            raise ValueError("No reviewed data found!")
+    reviewed_data = state["reviewed_data"]
+
+    # Edit content
+    partial_metadata = {**reviewed_data["metadata"], "stage": "editing…"}
+    edited_content = ""
+    for edited_content in editor_stream(raw_data, reviewed_data):
+        job.report(edited_content, partial_metadata)
+    
+    # Save edited version
+    metadata = {
+        "book_title": reviewed_data["metadata"]["book_title"],
+        "author": reviewed_data["metadata"]["author"],
+        "chapter_info": reviewed_data["metadata"]["chapter_info"],
+        "chapter_title": reviewed_data["metadata"]["chapter_title"],
+        "source_url": reviewed_data["metadata"]["source_url"],
+        "reviewer_feedback": reviewed_data["metadata"]["reviewer_feedback"]
+    }
+    versioned_id = saved_version(state, {**metadata, "content": edited_content}, "edited")
+    state["edited_data"] = {
+        "content": edited_content,
+        "metadata": {
+            **metadata,
+            "version": int(versioned_id.rsplit("_ver", 1)[1]),
+            "stage": "edited",
+            "versioned_id": versioned_id
+        }
+    }
+    state["current_stage"] = "edited"
+    return {"versioned_id": versioned_id}
+
+def stage_done_response(state, stage):
+    """Main window and button states once a stage job has finished"""
+    if stage == "rewritten":
         return (
-            format_chapter_markdown(STATE["reviewed_data"]),
-            feedback,
+            format_chapter_markdown(state["rewritten_data"]),
+            gr.update(value=""),
             gr.update(visible=False),  # rewrite_btn
             gr.update(visible=False),  # rewrite_special_btn
             gr.update(visible=True),   # rewrite_again_btn
-            gr.update(visible=False),  # reviewer_btn
-            gr.update(visible=True),   # editor_btn
+            gr.update(visible=True),   # reviewer_btn
+            gr.update(visible=False),  # editor_btn
             gr.update(visible=True),   # edit_btn
-            gr.update(visible=True),   # edit_feedback_btn
+            gr.update(visible=False),  # edit_feedback_btn
             gr.update(visible=True),   # finalize_btn
             gr.update(visible=False),  # status_output
         )
-    except Exception as e:
-        update_policy("edited", -0.5)
-        return create_error_response(f"❌ Error during review: {str(e)}")
-
-def edit_with_feedback():
-    """Perform AI editing based on feedback"""
-    try:
-        # Get raw data
-        latest_raw = get_latest_version("chapter1", "raw")
-        if latest_raw == 0:
-            return create_error_response("❌ No raw data found!")
-        
-        raw_data = fetch_chapter_by_version(f"chapter1_ver{latest_raw}", "raw")
-        if not STATE["raw_data"]:
-            STATE["raw_data"] = raw_data
-        
-        # Get reviewed data
-        if STATE["reviewed_data"] is None:
-            latest_reviewed = get_latest_version("chapter1", "reviewed")
-            if latest_reviewed == 0:
-                return create_error_response("❌ No reviewed data found!")
-            reviewed_data = fetch_chapter_by_version(f"chapter1_ver{latest_reviewed}", "reviewed")
-            STATE["reviewed_data"] = reviewed_data
-
-        # Edit content
-        edited_content = editor(raw_data, STATE["reviewed_data"])
-        
-        # Create edited data
-        next_version = get_next_version("chapter1")
-        STATE["edited_data"] = {
-            "content": edited_content,
-            "metadata": {
-                "book_title": STATE["reviewed_data"]["metadata"]["book_title"],
-                "author": STATE["reviewed_data"]["metadata"]["author"],
-                "chapter_info": STATE["reviewed_data"]["metadata"]["chapter_info"],
-                "chapter_title": STATE["reviewed_data"]["metadata"]["chapter_title"],
-                "source_url": STATE["reviewed_data"]["metadata"]["source_url"],
-                "reviewer_feedback": STATE["reviewed_data"]["metadata"]["reviewer_feedback"],
-                "version": next_version,
-                "stage": "edited",
-                "versioned_id": f"chapter1_ver{next_version}"
-            }
-        }
-        STATE["current_stage"] = "edited"
-        
-        # Save edited version
-        save_chapter_auto_version({
-            "book_title": STATE["edited_data"]["metadata"]["book_title"],
-            "author": STATE["edited_data"]["metadata"]["author"],
-            "chapter_info": STATE["edited_data"]["metadata"]["chapter_info"],
-            "chapter_title": STATE["edited_data"]["metadata"]["chapter_title"],
-            "content": edited_content,
-            "source_url": STATE["edited_data"]["metadata"]["source_url"],
-            "reviewer_feedback": STATE["edited_data"]["metadata"]["reviewer_feedback"]
-        }, base_id="chapter1", stage="edited")
-        
+    if stage == "reviewed":
         return (
-            format_chapter_markdown(STATE["edited_data"]),
-            STATE["edited_data"]["metadata"]["reviewer_feedback"],
+            format_chapter_markdown(state["reviewed_data"]),
+            gr.update(value=state["reviewed_data"]["metadata"]["reviewer_feedback"], visible=True),
             gr.update(visible=False),  # rewrite_btn
             gr.update(visible=False),  # rewrite_special_btn
             gr.update(visible=True),   # rewrite_again_btn
-            gr.update(visible=True),   # reviewer_btn
-            gr.update(visible=False),  # editor_btn
+            gr.update(visible=False),  # reviewer_btn
+            gr.update(visible=True),   # editor_btn
             gr.update(visible=True),   # edit_btn
             gr.update(visible=True),   # edit_feedback_btn
             gr.update(visible=True),   # finalize_btn
             gr.update(visible=False),  # status_output
         )
-    except Exception as e:
-        return create_error_response(f"❌ Error during editing: {str(e)}")
+    return (
+        format_chapter_markdown(state["edited_data"]),
+        state["edited_data"]["metadata"]["reviewer_feedback"],
+        gr.update(visible=False),  # rewrite_btn
+        gr.update(visible=False),  # rewrite_special_btn
+        gr.update(visible=True),   # rewrite_again_btn
+        gr.update(visible=True),   # reviewer_btn
+        gr.update(visible=False),  # editor_btn
+        gr.update(visible=True),   # edit_btn
+        gr.update(visible=True),   # edit_feedback_btn
+        gr.update(visible=True),   # finalize_btn
+        gr.update(visible=False),  # status_output
+    )
+
+def format_queue_depth(stage):
+    depth = get_job_queue().depth()[stage]
+    return f"queue: {depth['queued']} waiting, {depth['running']}/{depth['workers']} running"
+
+def job_response(state):
+    """UI update for the session's current job; polling stops once it has finished"""
+    job = get_job_queue().get(state["active_job"]) if state.get("active_job") else None
+    unchanged = (gr.update(),) * 11
+    if job is None:
+        return (*unchanged, gr.update(), gr.Timer(active=False))
+
+    label = JOB_LABELS[job["stage"]]
+    if job["status"] == "queued":
+        status = f"⏳ {label} job `{job['id']}` queued, position {job['position']} ({format_queue_depth(job['stage'])})"
+        return (*unchanged, status, gr.Timer(active=True))
+    if job["status"] == "running":
+        view = streaming_response(job["partial"]) if job["partial"] else unchanged
+        status = (f"⚙️ {label} job `{job['id']}` running for {time.time() - job['started_at']:.0f}s "
+                  f"({format_queue_depth(job['stage'])})")
+        return (*view, status, gr.Timer(active=True))
+
+    state["active_job"] = None
+    if job["status"] == "failed":
+        view = create_error_response(f"❌ Error during {label.lower()}: {job['error']}")[:11]
+        return (*view, f"❌ {label} job `{job['id']}` failed", gr.Timer(active=False))
+    status = f"✅ {label} job `{job['id']}` saved {job['result']['versioned_id']} in {job['finished_at'] - job['started_at']:.0f}s"
+    if job["result"].get("speculated"):
+        status += " (⚡ precomputed)"
+    return (*stage_done_response(state, job["stage"]), status, gr.Timer(active=False))
+
+def start_stage_job(state, stage, worker, *args):
+    """Queue a stage job for the session unless one is already in progress"""
+    active = get_job_queue().get(state["active_job"]) if state.get("active_job") else None
+    if not active or active["status"] not in ("queued", "running"):
+        state["active_job"] = get_job_queue().submit(stage, state["base_id"], worker, state, *args)
+    return job_response(state)
+
+def poll_job(request: gr.Request):
+    """Timer tick: report progress of the session's job"""
+    return job_response(session_state(request))
+
+def check_job(job_id):
+    """Status of any job by id, e.g. one submitted before the page was reloaded"""
+    job = get_job_queue().get((job_id or "").strip())
+    if job is None:
+        return "❌ Unknown job id (finished jobs are kept for an hour)"
+    label = JOB_LABELS[job["stage"]]
+    if job["status"] == "done":
+        return f"✅ {label} of {job['base_id']} finished and saved as {job['result']['versioned_id']}"
+    if job["status"] == "failed":
+        return f"❌ {label} of {job['base_id']} failed: {job['error']}"
+    return f"⏳ {label} of {job['base_id']} is {job['status']} ({format_queue_depth(job['stage'])})"
 
-def edit_content():
+def rewrite_chapter(request: gr.Request):
+    """Queue a rewrite of the session's raw chapter"""
+    state = session_state(request)
+    if load_raw_data(state) is None:
+        return (*create_error_response("❌ No raw data found!")[:11], gr.update(), gr.Timer(active=False))
+    return start_stage_job(state, "rewritten", rewrite_job, "None")
+
+def save_special_instruction(instr, request: gr.Request):
+    """Save special instruction and queue a rewrite with it"""
+    state = session_state(request)
+    state["special_instruction"] = instr or "None"
+    if load_raw_data(state) is None:
+        return (*create_error_response("❌ No raw data found!")[:11], gr.update(), gr.Timer(active=False))
+    return start_stage_job(state, "rewritten", rewrite_job, state["special_instruction"])
+
+def rewrite_again(request: gr.Request):
+    """Reset to raw stage for rewriting; the next rewrite asks the model for a fresh text"""
+    state = session_state(request)
+    if load_raw_data(state) is None:
+        return create_error_response("❌ No raw data found!")
+
+    # A speculative rewrite started earlier may hold the cached text
+    get_speculator().cancel(state["session_id"])
+    state["current_stage"] = "raw"
+    state["regenerate"] = True
+    return (
+        format_chapter_markdown(state["raw_data"]),
+        gr.update(value=""),
+        gr.update(visible=True),   # rewrite_btn
+        gr.update(visible=True),   # rewrite_special_btn
+        gr.update(visible=False),  # rewrite_again_btn
+        gr.update(visible=False),  # reviewer_btn
+        gr.update(visible=False),  # editor_btn
+        gr.update(visible=False),  # edit_btn
+        gr.update(visible=False),  # edit_feedback_btn
+        gr.update(visible=False),  # finalize_btn
+        gr.update(visible=False),  # status_output
+        gr.update(visible=False)   # special_panel
+    )
+
+def review_chapter(request: gr.Request):
+    """Queue a review of the latest rewritten/edited version"""
+    get_speculator().cancel(session_id(request))
+    return start_stage_job(session_state(request), "reviewed", review_job)
+
+def edit_with_feedback(request: gr.Request):
+    """Queue an AI edit based on the reviewer feedback"""
+    get_speculator().cancel(session_id(request))
+    return start_stage_job(session_state(request), "edited", edit_job)
+
+def edit_content(request: gr.Request):
     """Edit current content manually"""
-    if STATE["current_stage"] == "edited" and STATE["edited_data"]:
-        content = STATE["edited_data"]["content"]
-    elif STATE["current_stage"] == "reviewed" and STATE["reviewed_data"]:
-        content = STATE["reviewed_data"]["content"]
-    elif STATE["current_stage"] == "rewritten" and STATE["rewritten_data"]:
-        content = STATE["rewritten_data"]["content"]
+    state = session_state(request)
+    if state["current_stage"] == "edited" and state["edited_data"]:
+        content = state["edited_data"]["content"]
+    elif state["current_stage"] == "reviewed" and state["reviewed_data"]:
+        content = state["reviewed_data"]["content"]
+    elif state["current_stage"] == "rewritten" and state["rewritten_data"]:
+        content = state["rewritten_data"]["content"]
     else:
         content = ""
     
-    STATE["editing_content"] = True
+    state["editing_content"] = True
     return (
         content,
         gr.update(interactive=False),  # All buttons disabled during editing
@@ -501,18 +684,18 @@ def edit_content():
         gr.update(interactive=False)
     )
 
-def edit_feedback():
+def edit_feedback(request: gr.Request):
     """Edit reviewer feedback"""
-    if STATE["reviewed_data"] is None:
-        latest = get_latest_version("chapter1", "reviewed")
-        if latest == 0:
+    state = session_state(request)
+    if state["reviewed_data"] is None:
+        reviewed_data = get_latest_across_stages(state["base_id"], ["reviewed"])
+        if not reviewed_data:
             return ("❌ No reviewed data found!",) + tuple(gr.update() for _ in range(8))
-        reviewed_data = fetch_chapter_by_version(f"chapter1_ver{latest}", "reviewed")
-        STATE["reviewed_data"] = reviewed_data
+        state["reviewed_data"] = reviewed_data
     
-    STATE["editing_feedback"] = True
+    state["editing_feedback"] = True
     return (
-        STATE["reviewed_data"]["metadata"]["reviewer_feedback"],
+        state["reviewed_data"]["metadata"]["reviewer_feedback"],
         gr.update(interactive=False),  # All buttons disabled during editing
         gr.update(interactive=False),
         gr.update(interactive=False),
@@ -523,37 +706,37 @@ def edit_feedback():
         gr.update(interactive=False)
     )
 
-def save_edited_content(edited_content):
+def save_edited_content(edited_content, state):
     """Save manually edited content"""
-    STATE["editing_content"] = False
+    state["editing_content"] = False
     
     try:
-        if STATE["current_stage"] == "edited" and STATE["edited_data"]:
-            STATE["edited_data"]["content"] = edited_content
+        if state["current_stage"] == "edited" and state["edited_data"]:
+            state["edited_data"]["content"] = edited_content
             save_data = {
-                **STATE["edited_data"]["metadata"],
+                **state["edited_data"]["metadata"],
                 "content": edited_content
             }
-            save_chapter_auto_version(save_data, "chapter1", "human_edited")
-            return create_save_response(STATE["edited_data"])
+            saved_version(state, save_data, "human_edited")
+            return create_save_response(state["edited_data"])
             
-        elif STATE["current_stage"] == "reviewed" and STATE["reviewed_data"]:
-            STATE["reviewed_data"]["content"] = edited_content
+        elif state["current_stage"] == "reviewed" and state["reviewed_data"]:
+            state["reviewed_data"]["content"] = edited_content
             save_data = {
-                **STATE["reviewed_data"]["metadata"],
+                **state["reviewed_data"]["metadata"],
                 "content": edited_content
             }
-            save_chapter_auto_version(save_data, "chapter1", "human_edited")
-            return create_save_response(STATE["reviewed_data"])
+            saved_version(state, save_data, "human_edited")
+            return create_save_response(state["reviewed_data"])
             
-        elif STATE["current_stage"] == "rewritten" and STATE["rewritten_data"]:
-            STATE["rewritten_data"]["content"] = edited_content
+        elif state["current_stage"] == "rewritten" and state["rewritten_data"]:
+            state["rewritten_data"]["content"] = edited_content
             save_data = {
-                **STATE["rewritten_data"]["metadata"],
+                **state["rewritten_data"]["metadata"],
                 "content": edited_content
             }
-            save_chapter_auto_version(save_data, "chapter1", "human_edited")
-            return create_save_response(STATE["rewritten_data"])
+            saved_version(state, save_data, "human_edited")
+            return create_save_response(state["rewritten_data"])
             
     except Exception as e:
         return create_error_save_response(f"❌ Error saving edited content: {str(e)}")
@@ -588,27 +771,28 @@ def create_error_save_response(error_msg):
         gr.update(interactive=True)
     )
 
-def save_edited_feedback(edited_feedback):
+def save_edited_feedback(edited_feedback, state):
     """Save edited feedback"""
-    STATE["editing_feedback"] = False
-    STATE["reviewed_data"]["metadata"]["reviewer_feedback"] = edited_feedback
+    state["editing_feedback"] = False
+    state["reviewed_data"]["metadata"]["reviewer_feedback"] = edited_feedback
     
     try:
         save_data = {
-            **STATE["reviewed_data"]["metadata"],
-            "content": STATE["reviewed_data"]["content"],
+            **state["reviewed_data"]["metadata"],
+            "content": state["reviewed_data"]["content"],
             "reviewer_feedback": edited_feedback
         }
-        save_chapter_auto_version(save_data, "chapter1", "human_reviewed")
+        saved_version(state, save_data, "human_reviewed")
         
-        return create_save_response(STATE["reviewed_data"])
+        return create_save_response(state["reviewed_data"])
     except Exception as e:
         return create_error_save_response(f"❌ Error saving edited feedback: {str(e)}")
 
-def cancel_edit():
+def cancel_edit(request: gr.Request):
     """Cancel editing and re-enable buttons"""
-    STATE["editing_content"] = False
-    STATE["editing_feedback"] = False
+    state = session_state(request)
+    state["editing_content"] = False
+    state["editing_feedback"] = False
     
     return (
         gr.update(visible=False),     # edit_panel
@@ -624,15 +808,16 @@ def cancel_edit():
         gr.update(interactive=True)
     )
 
-def finalize_chapter():
+def finalize_chapter(request: gr.Request):
     """Save final version"""
+    state = session_state(request)
     try:
-        if STATE["current_stage"] == "edited" and STATE["edited_data"]:
-            data_to_save = STATE["edited_data"]
-        elif STATE["current_stage"] == "reviewed" and STATE["reviewed_data"]:
-            data_to_save = STATE["reviewed_data"]
-        elif STATE["current_stage"] == "rewritten" and STATE["rewritten_data"]:
-            data_to_save = STATE["rewritten_data"]
+        if state["current_stage"] == "edited" and state["edited_data"]:
+            data_to_save = state["edited_data"]
+        elif state["current_stage"] == "reviewed" and state["reviewed_data"]:
+            data_to_save = state["reviewed_data"]
+        elif state["current_stage"] == "rewritten" and state["rewritten_data"]:
+            data_to_save = state["rewritten_data"]
         else:
             return "❌ No data found to finalize!"
 
@@ -640,7 +825,7 @@ def finalize_chapter():
             **data_to_save["metadata"],
             "content": data_to_save["content"]
         }
-        save_chapter_auto_version(save_data, "chapter1", "final")
+        saved_version(state, save_data, "final")
         return "🎉 Final version saved successfully! Ready for publication."
     except Exception as e:
         return f"❌ Error finalizing chapter: {str(e)}"
@@ -660,6 +845,10 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     with gr.Row():
         url_input = gr.Textbox(label="Enter Wikisource URL", placeholder="https://en.wikisource.org/wiki/...")
         fetch_btn = gr.Button("🔍 Fetch Chapter", variant="primary")
+    with gr.Row():
+        screenshot_checkbox = gr.Checkbox(label="📸 Capture page screenshot", value=False)
+        speculate_checkbox = gr.Checkbox(label="⚡ Start the suggested step in the background",
+                                         value=SPECULATION_ENABLED)
 
     with gr.Row():
         with gr.Column(scale=3):
@@ -675,6 +864,11 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
 
 
 
+    with gr.Accordion("📸 Page Screenshot", open=False):
+        load_screenshot_btn = gr.Button("Load Screenshot")
+        screenshot_status = gr.Markdown()
+        screenshot_image = gr.Image(type="filepath", visible=False, show_label=False)
+
     # Special instructions panel
     with gr.Row(visible=False) as special_panel:
         with gr.Column():
@@ -683,6 +877,15 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
                                          placeholder="e.g., 'Emphasize atmospheric descriptions', 'Make dialogue more formal', etc.")
             special_instr_btn = gr.Button("🔄 Rewrite with Instructions", variant="primary")
 
+    # Background stage jobs: polled while one is queued or running
+    job_status = gr.Markdown()
+    job_timer = gr.Timer(1.0, active=False)
+    with gr.Accordion("🗂️ Look Up a Job", open=False):
+        with gr.Row():
+            job_id_input = gr.Textbox(label="Job ID", placeholder="e.g. 3f2a9c1b7d4e")
+            check_job_btn = gr.Button("Check Job")
+        job_lookup_status = gr.Markdown()
+
     # Control buttons
     with gr.Row():
         rewrite_btn = gr.Button("🔄 Rewrite", visible=False)
@@ -702,6 +905,12 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
             search_btn = gr.Button("🔍 Smart Search", variant="primary")
         
         search_results = gr.Markdown(label="Search Results", value="Enter a query to search...")
+
+        with gr.Row(visible=False) as search_feedback_row:
+            useful_result = gr.Radio(label="Most useful result", choices=[])
+            search_satisfaction = gr.Slider(1, 5, value=3, step=1, label="Satisfaction")
+            search_feedback_btn = gr.Button("👍 Send Feedback")
+        search_feedback_status = gr.Markdown()
         
         with gr.Row():
             analytics_btn = gr.Button("📊 Show Analytics")
@@ -715,15 +924,29 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     # Event handlers
     fetch_btn.click(
         fetch_chapter,
-        inputs=[url_input],
+        inputs=[url_input, screenshot_checkbox, speculate_checkbox],
         outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
                 reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output]
     )
     
+    load_screenshot_btn.click(
+        load_screenshot,
+        outputs=[screenshot_image, screenshot_status]
+    )
+
+    def save_edit(content, request: gr.Request):
+        state = session_state(request)
+        if state["editing_content"]:
+            return save_edited_content(content, state)
+        return save_edited_feedback(content, state)
+
+    job_outputs = [main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
+                   reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output,
+                   job_status, job_timer]
+
     rewrite_btn.click(
-        lambda: rewrite_chapter(False),
-        outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
-                reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output]
+        rewrite_chapter,
+        outputs=job_outputs
     )
     
     rewrite_special_btn.click(
@@ -734,8 +957,7 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     special_instr_btn.click(
         save_special_instruction,
         inputs=[special_instr_box],
-        outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
-                reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output]
+        outputs=job_outputs
     ).then(
         lambda: gr.update(visible=False),
         outputs=[special_panel]
@@ -749,17 +971,23 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     
     reviewer_btn.click(
         review_chapter,
-        outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
-                reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output]
-    ).then(
-        lambda: gr.update(visible=True),
-        outputs=[feedback_output]
+        outputs=job_outputs
     )
     
     editor_btn.click(
         edit_with_feedback,
-        outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
-                reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn, status_output]
+        outputs=job_outputs
+    )
+
+    job_timer.tick(
+        poll_job,
+        outputs=job_outputs
+    )
+
+    check_job_btn.click(
+        check_job,
+        inputs=[job_id_input],
+        outputs=[job_lookup_status]
     )
     
     edit_btn.click(
@@ -781,10 +1009,7 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     )
     
     save_edit_btn.click(
-        lambda content: (
-            save_edited_content(content) if STATE["editing_content"] 
-            else save_edited_feedback(content)
-        ),
+        save_edit,
         inputs=[edit_box],
         outputs=[main_window, feedback_output, rewrite_btn, rewrite_special_btn, rewrite_again_btn,
                 reviewer_btn, editor_btn, edit_btn, edit_feedback_btn, finalize_btn]
@@ -811,7 +1036,13 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     search_btn.click(
         smart_content_search,
         inputs=[search_input],
-        outputs=[search_results]
+        outputs=[search_results, useful_result, search_feedback_row]
+    )
+
+    search_feedback_btn.click(
+        submit_search_feedback,
+        inputs=[useful_result, search_satisfaction],
+        outputs=[search_feedback_status]
     )
     
     analytics_btn.click(
@@ -831,4 +1062,5 @@ with gr.Blocks(title="Chapter Processing Pipeline") as ui:
     )
 
 if __name__ == "__main__":
+    ui.queue(default_concurrency_limit=UI_CONCURRENCY)
     ui.launch(share=True, inbrowser=True)
\ No newline at end of file
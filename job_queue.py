@@ -0,0 +1,163 @@
+"""Background job queue for long-running pipeline stages.
+
+LLM stages take anywhere from seconds to minutes, so the UI submits them
+here instead of running them inside the event handler. Each stage has its
+own bounded worker pool, so a burst of rewrites cannot starve reviews. A
+job reports partial text while it runs and saves its own result, so the
+result reaches ChromaDB even if the browser that submitted it goes away.
+Callers poll a job by id.
+
+Pool sizes come from JOB_WORKERS_<STAGE> (e.g. JOB_WORKERS_REWRITTEN=4),
+defaulting to JOB_WORKERS (2). Finished jobs are kept for
+JOB_RETENTION_SECONDS (default 3600).
+"""
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STAGES = ["rewritten", "reviewed", "edited"]
+DEFAULT_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+
+
+def stage_workers(stage: str) -> int:
+    return int(os.getenv(f"JOB_WORKERS_{stage.upper()}", str(DEFAULT_WORKERS)))
+
+
+class Job:
+    """One submitted stage run and its progress."""
+
+    def __init__(self, stage: str, base_id: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.stage = stage
+        self.base_id = base_id
+        self.status = "queued"
+        self.partial: Optional[Dict] = None
+        self.result = None
+        self.error = ""
+        self.submitted_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+
+    def report(self, content: str, metadata: Optional[Dict] = None):
+        """Publish the text produced so far."""
+        previous = self.partial["metadata"] if self.partial else {}
+        self.partial = {"content": content, "metadata": metadata if metadata is not None else previous}
+
+    def snapshot(self) -> Dict:
+        return {
+            "id": self.id,
+            "stage": self.stage,
+            "base_id": self.base_id,
+            "status": self.status,
+            "partial": self.partial,
+            "result": self.result,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """Per-stage bounded worker pools with job tracking."""
+
+    def __init__(self, stages: List[str] = JOB_STAGES, workers: Optional[Dict[str, int]] = None,
+                 retention: float = JOB_RETENTION_SECONDS):
+        workers = workers or {}
+        self.workers = {stage: workers.get(stage, stage_workers(stage)) for stage in stages}
+        self.retention = retention
+        self._pools = {
+            stage: ThreadPoolExecutor(max_workers=count, thread_name_prefix=f"job-{stage}")
+            for stage, count in self.workers.items()
+        }
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def _run(self, job: Job, func: Callable, args, kwargs):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = func(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            logger.error(f"Job {job.id} ({job.stage} {job.base_id}) failed: {e}")
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished_at = time.time()
+            logger.info(f"Job {job.id} ({job.stage} {job.base_id}) {job.status} "
+                        f"in {job.finished_at - job.started_at:.1f}s")
+
+    def _prune(self, now: float):
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def submit(self, stage: str, base_id: str, func: Callable, *args, **kwargs) -> str:
+        """Queue func(job, *args, **kwargs) on the stage's pool and return the job id."""
+        if stage not in self._pools:
+            raise ValueError(f"No job pool for stage: {stage}")
+        job = Job(stage, base_id)
+        with self._lock:
+            self._prune(time.time())
+            self._jobs[job.id] = job
+        self._pools[stage].submit(self._run, job, func, args, kwargs)
+        return job.id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Snapshot of a job, with its position among queued jobs of its stage (1 = next)."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            snapshot = job.snapshot()
+            if job.status == "queued":
+                snapshot["position"] = 1 + sum(
+                    1 for other in self._jobs.values()
+                    if other.stage == job.stage and other.status == "queued" and other.submitted_at < job.submitted_at
+                )
+        return snapshot
+
+    def jobs_for(self, base_id: str) -> List[Dict]:
+        """Snapshots of a chapter's jobs, newest first."""
+        with self._lock:
+            jobs = [job.snapshot() for job in self._jobs.values() if job.base_id == base_id]
+        return sorted(jobs, key=lambda job: job["submitted_at"], reverse=True)
+
+    def depth(self) -> Dict[str, Dict[str, int]]:
+        """Queued and running job counts per stage."""
+        with self._lock:
+            statuses = [(job.stage, job.status) for job in self._jobs.values()]
+        return {
+            stage: {
+                "queued": sum(1 for s, status in statuses if s == stage and status == "queued"),
+                "running": sum(1 for s, status in statuses if s == stage and status == "running"),
+                "workers": count,
+            }
+            for stage, count in self.workers.items()
+        }
+
+    def shutdown(self, wait: bool = True):
+        for pool in self._pools.values():
+            pool.shutdown(wait=wait)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Process-wide job queue, created on first use."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+        return _queue
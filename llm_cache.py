@@ -0,0 +1,160 @@
+"""Content-addressed on-disk cache for LLM responses.
+
+Responses are keyed by a hash of the provider, model name, system prompt,
+user prompt and generation parameters, so re-running a stage on identical
+input (crash resume, repeated batch runs, rewriting the same chapter again)
+returns the stored text instead of calling the provider. The cache is size-bounded and
+evicts least-recently-used entries.
+
+Set LLM_CACHE=off to disable it globally, or pass use_cache=False to a stage
+function for a fresh, non-deterministic rerun.
+"""
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+LLM_CACHE_PATH = Path(os.getenv("LLM_CACHE_PATH", "./cache/llm_responses.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(provider: str, model: str, system_prompt: str, user_prompt: str,
+              params: Optional[Dict] = None) -> str:
+    """Stable hash of everything that determines a response."""
+    payload = json.dumps(
+        {"provider": provider, "model": model, "system": system_prompt,
+         "user": user_prompt, "params": params or {}},
+        sort_keys=True, ensure_ascii=False, default=str
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """SQLite-backed LRU cache of response texts bounded by total size."""
+
+    def __init__(self, path: Path = LLM_CACHE_PATH, max_bytes: int = LLM_CACHE_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.enabled = os.getenv("LLM_CACHE", "on").lower() not in ("off", "0", "false")
+        self.stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " last_access REAL NOT NULL"
+                ")"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS responses_lru ON responses (last_access)")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, key: str, amount: int = 1):
+        with self._lock:
+            self.stats[key] += amount
+
+    def get(self, key: str) -> Optional[str]:
+        conn = self._connect()
+        row = conn.execute("SELECT value FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        with conn:
+            conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+        self._count("hits")
+        return row[0]
+
+    def put(self, key: str, value: str):
+        size = len(value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, size, time.time())
+            )
+            self._evict(conn)
+        self._count("writes")
+
+    def _evict(self, conn: sqlite3.Connection):
+        """Drop least-recently-used entries until the cache fits in max_bytes."""
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        while total > self.max_bytes:
+            key, size = conn.execute(
+                "SELECT key, size FROM responses ORDER BY last_access LIMIT 1"
+            ).fetchone()
+            conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self._count("evictions")
+
+    def clear(self):
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM responses")
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        row = self._connect().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        stats["entries"], stats["bytes"] = row
+        stats["enabled"] = self.enabled
+        return stats
+
+
+response_cache = ResponseCache()
+
+
+def cached_call(provider: str, model: str, system_prompt: str, user_prompt: str,
+                generate: Callable[[], str], params: Optional[Dict] = None, use_cache: bool = True) -> str:
+    """Return a cached response, or call generate() and cache its text."""
+    if not (use_cache and response_cache.enabled):
+        return generate()
+    key = cache_key(provider, model, system_prompt, user_prompt, params)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    text = generate()
+    if text:
+        response_cache.put(key, text)
+    return text
+
+
+async def cached_call_async(provider: str, model: str, system_prompt: str, user_prompt: str,
+                            generate: Callable, params: Optional[Dict] = None, use_cache: bool = True) -> str:
+    """Async form of cached_call; generate is a coroutine function."""
+    if not (use_cache and response_cache.enabled):
+        return await generate()
+    key = cache_key(provider, model, system_prompt, user_prompt, params)
+    cached = response_cache.get(key)
+    if cached is not None:
+        return cached
+    text = await generate()
+    if text:
+        response_cache.put(key, text)
+    return text
+
+
+def get_cache_stats() -> Dict:
+    """Hit/miss counters and size of the response cache."""
+    return response_cache.get_stats()
@@ -0,0 +1,365 @@
+"""Shared asyncio client layer for the LLM providers used by the pipeline.
+
+Every provider gets a concurrency limit and a tokens-per-minute budget,
+shared by every thread, event loop and call style in the process, so many
+chapters can overlap their LLM latency without tripping provider rate
+limits. Providers are plain async callables:
+
+    async def call(model, system_prompt, user_prompt, **params) -> str
+
+The ``fake`` provider simulates latency and rate-limit errors so the layer
+can be exercised offline.
+"""
+import asyncio
+import logging
+import os
+import random
+import time
+import threading
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Iterator, Optional
+
+from llm_cache import cached_call_async, cache_key, response_cache
+from retry import retry_call, retry_call_async, retry_after_seconds, status_code
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitError(Exception):
+    """Provider rejected a request because of rate limits or quota."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def estimate_tokens(*texts: str) -> int:
+    """Rough token estimate (~4 characters per token)."""
+    return max(1, sum(len(t or "") for t in texts) // 4)
+
+
+class TokenBudget:
+    """Token bucket refilled continuously at tokens_per_minute; callers hold the limiter's lock."""
+
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.available = float(tokens_per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.capacity / 60.0)
+        self.updated = now
+
+    def take(self, tokens: int) -> float:
+        """Spend `tokens` and return 0, or return the seconds until they will be available.
+
+        Oversized requests wait for a full bucket.
+        """
+        needed = min(float(tokens), self.capacity)
+        self._refill()
+        if self.available >= needed:
+            self.available -= needed
+            return 0.0
+        return (needed - self.available) * 60.0 / self.capacity
+
+
+class ProviderLimiter:
+    """Process-wide concurrency slots and token budget for one provider.
+
+    Thread-safe and not bound to any event loop, so blocking calls, streams
+    and coroutines on any loop (e.g. one ``asyncio.run`` per chapter) all
+    share the same limits.
+    """
+
+    POLL_SECONDS = 0.05
+
+    def __init__(self, max_concurrency: int, tokens_per_minute: Optional[int] = None):
+        self.max_concurrency = max_concurrency
+        self.budget = TokenBudget(tokens_per_minute) if tokens_per_minute else None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, tokens: int) -> float:
+        """Take a slot and the tokens and return 0, or return how long to wait before trying again."""
+        with self._lock:
+            if self.in_flight >= self.max_concurrency:
+                return self.POLL_SECONDS
+            wait = self.budget.take(tokens) if self.budget else 0.0
+            if wait:
+                return min(wait, 1.0)
+            self.in_flight += 1
+            return 0.0
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, tokens: int):
+        """Hold a slot for a blocking call, waiting in this thread."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            time.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+    @asynccontextmanager
+    async def slot_async(self, tokens: int):
+        """Hold a slot for a coroutine, yielding to the event loop while waiting."""
+        while True:
+            wait = self._try_acquire(tokens)
+            if not wait:
+                break
+            await asyncio.sleep(wait)
+        try:
+            yield
+        finally:
+            self._release()
+
+
+class Provider:
+    """A registered provider with its limits."""
+
+    def __init__(self, name: str, call: Callable, max_concurrency: int = 4,
+                 tokens_per_minute: Optional[int] = None):
+        self.name = name
+        self.call = call
+        self.max_concurrency = max_concurrency
+        self.tokens_per_minute = tokens_per_minute
+        self.limiter = ProviderLimiter(max_concurrency, tokens_per_minute)
+
+
+class LLMClient:
+    """Routes generation requests to providers under their concurrency and token limits."""
+
+    def __init__(self):
+        self.providers: Dict[str, Provider] = {}
+        self.stats = {"requests": 0, "tokens": 0, "rate_limited": 0}
+        self._stats_lock = threading.Lock()
+
+    def register_provider(self, name: str, call: Callable, max_concurrency: int = 4,
+                          tokens_per_minute: Optional[int] = None):
+        self.providers[name] = Provider(name, call, max_concurrency, tokens_per_minute)
+
+    def get_provider(self, name: str) -> Provider:
+        if name not in self.providers:
+            raise ValueError(f"Unknown LLM provider: {name}. Registered: {sorted(self.providers)}")
+        return self.providers[name]
+
+    async def generate(self, provider: str, model: str, system_prompt: str, user_prompt: str,
+                       use_cache: bool = True, **params) -> str:
+        """Generate text with the given provider, retrying transient failures.
+
+        Identical requests are answered from the response cache. Each attempt
+        re-acquires a concurrency slot and token budget, so a request waiting
+        out a backoff does not hold a slot.
+        """
+        async def call_provider():
+            return await retry_call_async(
+                provider, self._attempt, provider, model, system_prompt, user_prompt, **params
+            )
+
+        return await cached_call_async(
+            provider, model, system_prompt, user_prompt, call_provider, params, use_cache
+        )
+
+    async def _attempt(self, provider: str, model: str, system_prompt: str, user_prompt: str,
+                       **params) -> str:
+        p = self.get_provider(provider)
+        tokens = estimate_tokens(system_prompt, user_prompt)
+        async with p.limiter.slot_async(tokens):
+            self._count(requests=1, tokens=tokens)
+            try:
+                return await p.call(model, system_prompt, user_prompt, **params)
+            except RateLimitError:
+                self._count(rate_limited=1)
+                raise
+
+    def _count(self, **amounts):
+        with self._stats_lock:
+            for key, amount in amounts.items():
+                self.stats[key] += amount
+
+    def call_limited(self, provider: str, tokens: int, func: Callable, *args, **kwargs):
+        """Run a blocking provider call under the provider's process-wide limits."""
+        with self.get_provider(provider).limiter.slot(tokens):
+            self._count(requests=1, tokens=tokens)
+            return func(*args, **kwargs)
+
+
+async def gemini_call(model: str, system_prompt: str, user_prompt: str, **params) -> str:
+    import google.generativeai as genai
+
+    gemini_model = genai.GenerativeModel(model_name=model, system_instruction=system_prompt)
+    try:
+        response = await gemini_model.generate_content_async(
+            user_prompt, generation_config=params or None
+        )
+    except Exception as e:
+        if status_code(e) == 429 or "ResourceExhausted" in type(e).__name__ or "quota" in str(e).lower():
+            raise RateLimitError(str(e), retry_after=retry_after_seconds(e)) from e
+        raise
+    if not response.text:
+        raise RuntimeError("Gemini failed to generate content")
+    return response.text
+
+
+_openai_client = None
+
+
+async def openai_call(model: str, system_prompt: str, user_prompt: str, **params) -> str:
+    global _openai_client
+    from openai import AsyncOpenAI, RateLimitError as OpenAIRateLimitError
+
+    if _openai_client is None:
+        # Retries are handled by retry_call_async; the SDK's own would stack with them
+        _openai_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+    try:
+        response = await _openai_client.chat.completions.create(
+            model=model,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_prompt}
+            ],
+            **params
+        )
+    except OpenAIRateLimitError as e:
+        raise RateLimitError(str(e), retry_after=retry_after_seconds(e)) from e
+    return response.choices[0].message.content
+
+
+class FakeProvider:
+    """Offline provider that simulates latency and rate-limit errors."""
+
+    def __init__(self, latency: float = 0.05, rate_limit_rate: float = 0.0,
+                 retry_after: float = 0.1, seed: Optional[int] = None):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    async def __call__(self, model: str, system_prompt: str, user_prompt: str, **params) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.random.random() < self.rate_limit_rate:
+            raise RateLimitError("fake provider: rate limit exceeded", retry_after=self.retry_after)
+        return f"[{model}] {user_prompt.strip()}"
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+client = LLMClient()
+client.register_provider(
+    "gemini", gemini_call,
+    max_concurrency=_env_int("GEMINI_MAX_CONCURRENCY", 4),
+    tokens_per_minute=_env_int("GEMINI_TOKENS_PER_MINUTE", 1_000_000)
+)
+client.register_provider(
+    "openai", openai_call,
+    max_concurrency=_env_int("OPENAI_MAX_CONCURRENCY", 4),
+    tokens_per_minute=_env_int("OPENAI_TOKENS_PER_MINUTE", 200_000)
+)
+client.register_provider("fake", FakeProvider(), max_concurrency=8)
+
+
+async def agenerate(provider: str, model: str, system_prompt: str, user_prompt: str,
+                    use_cache: bool = True, **params) -> str:
+    """Generate text through the shared client."""
+    return await client.generate(provider, model, system_prompt, user_prompt, use_cache, **params)
+
+
+def call_limited(provider: str, tokens: int, func: Callable, *args, **kwargs):
+    """Run a blocking provider call under the shared client's limits; wrap it in retry_call per attempt."""
+    return client.call_limited(provider, tokens, func, *args, **kwargs)
+
+
+# Streaming (sync generators, used by the UI to render partial output)
+STREAM_TTFT_WINDOW = 1000
+_stream_lock = threading.Lock()
+_stream_stats = {"streams": 0, "cache_hits": 0, "ttft_seconds": []}
+
+
+def _record_ttft(seconds: float):
+    with _stream_lock:
+        _stream_stats["streams"] += 1
+        _stream_stats["ttft_seconds"].append(seconds)
+        del _stream_stats["ttft_seconds"][:-STREAM_TTFT_WINDOW]
+
+
+def get_stream_metrics() -> Dict:
+    """Time-to-first-token statistics over recent streamed generations."""
+    with _stream_lock:
+        last = _stream_stats["ttft_seconds"][-1] if _stream_stats["ttft_seconds"] else None
+        samples = sorted(_stream_stats["ttft_seconds"])
+        metrics = {"streams": _stream_stats["streams"], "cache_hits": _stream_stats["cache_hits"]}
+    if samples:
+        metrics["ttft_last"] = last
+        metrics["ttft_p50"] = samples[len(samples) // 2]
+        metrics["ttft_p95"] = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return metrics
+
+
+def open_gemini_stream(model: str, system_prompt: str, user_prompt: str) -> Iterator[str]:
+    """Start a streaming Gemini generation and return an iterator of text pieces."""
+    import google.generativeai as genai
+
+    gemini_model = genai.GenerativeModel(model_name=model, system_instruction=system_prompt)
+    response = gemini_model.generate_content(user_prompt, stream=True)
+
+    def pieces():
+        for chunk in response:
+            try:
+                yield chunk.text
+            except ValueError:
+                # Chunks without text parts (e.g. safety metadata) have no .text
+                continue
+
+    return pieces()
+
+
+def stream_generate(provider: str, model: str, system_prompt: str, user_prompt: str,
+                    open_stream: Callable[[], Iterator[str]], use_cache: bool = True) -> Iterator[str]:
+    """Yield the accumulated response text as the provider streams it.
+
+    A cached response is yielded whole. Opening the stream is retried like a
+    normal call; the complete text is cached once the stream finishes.
+    """
+    key = None
+    if use_cache and response_cache.enabled:
+        key = cache_key(provider, model, system_prompt, user_prompt)
+        cached = response_cache.get(key)
+        if cached is not None:
+            with _stream_lock:
+                _stream_stats["cache_hits"] += 1
+            yield cached
+            return
+
+    start = time.perf_counter()
+    text = ""
+    # The slot is held until the stream ends or the consumer closes it
+    tokens = estimate_tokens(system_prompt, user_prompt)
+    with client.get_provider(provider).limiter.slot(tokens):
+        client._count(requests=1, tokens=tokens)
+        for piece in retry_call(provider, open_stream):
+            if not piece:
+                continue
+            if not text:
+                ttft = time.perf_counter() - start
+                _record_ttft(ttft)
+                logger.info(f"{provider}/{model} time to first token: {ttft:.2f}s")
+            text += piece
+            yield text
+
+    if not text:
+        raise RuntimeError(f"{provider} failed to generate content")
+    if key:
+        response_cache.put(key, text)
@@ -0,0 +1,259 @@
+"""Shared retry subsystem for LLM provider calls.
+
+Transient failures (rate limits, quota, timeouts, 5xx) are retried with
+jittered exponential backoff that honors Retry-After hints. Attempts are
+capped per call, and a retry budget shared by all concurrent calls stops
+retries from multiplying load during an outage. A per-provider circuit
+breaker fails fast after repeated failures until a cool-down passes.
+"""
+import asyncio
+import logging
+import random
+import re
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+RETRYABLE_ERROR_NAMES = ("RateLimit", "ResourceExhausted", "ServiceUnavailable",
+                         "Timeout", "DeadlineExceeded", "APIConnection", "InternalServerError")
+RETRYABLE_MESSAGES = ("quota", "rate limit", "temporarily unavailable", "timed out")
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised without calling the provider while its circuit breaker is open."""
+
+
+class RetryBudgetExhausted(RuntimeError):
+    """Raised when the shared retry budget has no retries left."""
+
+
+def status_code(exc: Exception) -> Optional[int]:
+    """HTTP status carried by a provider error (OpenAI, google-api-core, requests), if any."""
+    for status in (getattr(exc, "status_code", None), getattr(exc, "code", None),
+                   getattr(getattr(exc, "response", None), "status_code", None)):
+        if isinstance(status, int):
+            return status
+    return None
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Whether an error is transient and worth retrying, judged by status code, type and wording."""
+    if status_code(exc) in RETRYABLE_STATUS_CODES:
+        return True
+    if any(name in type(exc).__name__ for name in RETRYABLE_ERROR_NAMES):
+        return True
+    message = str(exc).lower()
+    return any(text in message for text in RETRYABLE_MESSAGES)
+
+
+def retry_after_seconds(exc: Exception) -> Optional[float]:
+    """Server-suggested wait from an error, if it carries one."""
+    retry_after = getattr(exc, "retry_after", None)
+    if retry_after is not None:
+        return float(retry_after)
+
+    response = getattr(exc, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after") or headers.get("Retry-After")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    # Gemini reports the hint in the message body: "retry_delay { seconds: 36 }"
+    match = re.search(r"retry_delay\s*\{\s*seconds:\s*(\d+)", str(exc))
+    if match:
+        return float(match.group(1))
+    return None
+
+
+class RetryPolicy:
+    """Per-call attempt cap and jittered exponential backoff."""
+
+    def __init__(self, max_attempts: int = 5, base_delay: float = 2.0,
+                 max_delay: float = 60.0, max_retry_after: float = 120.0):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def delay(self, attempt: int, exc: Exception) -> float:
+        """Seconds to wait before retry number `attempt` (1-based)."""
+        backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1)))
+        hint = retry_after_seconds(exc)
+        if hint is not None:
+            return min(max(hint, backoff), self.max_retry_after)
+        return backoff
+
+
+class RetryBudget:
+    """Token bucket limiting retries to a fraction of overall calls.
+
+    Every call deposits `ratio` tokens and every retry withdraws one, so
+    under sustained failure retries settle at about `ratio` of traffic.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_tokens: float = 10.0, max_tokens: float = 100.0):
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = min_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self):
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class CircuitBreaker:
+    """Opens after consecutive transient failures; lets one probe through after a cool-down."""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        with self.lock:
+            state = self.state
+            if state == "half_open":
+                # Re-arm the timer so only one probe goes through per cool-down
+                self.opened_at = time.monotonic()
+            return state != "open"
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class Retrier:
+    """Runs provider calls under the retry policy, shared budget and circuit breakers."""
+
+    def __init__(self, policy: RetryPolicy = None, budget: RetryBudget = None):
+        self.policy = policy or RetryPolicy()
+        self.budget = budget or RetryBudget()
+        self.breakers: Dict[str, CircuitBreaker] = {}
+        self.metrics: Dict[str, Dict] = {}
+        self.lock = threading.Lock()
+
+    def breaker(self, provider: str) -> CircuitBreaker:
+        with self.lock:
+            return self.breakers.setdefault(provider, CircuitBreaker())
+
+    def _count(self, provider: str, key: str, amount: float = 1):
+        with self.lock:
+            stats = self.metrics.setdefault(provider, {
+                "calls": 0, "attempts": 0, "retries": 0, "failures": 0,
+                "wait_seconds": 0.0, "budget_exhausted": 0, "circuit_open": 0
+            })
+            stats[key] += amount
+
+    def _before_attempt(self, provider: str, attempt: int):
+        breaker = self.breaker(provider)
+        if not breaker.allow():
+            self._count(provider, "circuit_open")
+            self._count(provider, "failures")
+            raise CircuitOpenError(f"{provider} circuit is open after repeated failures")
+        if attempt == 1:
+            self._count(provider, "calls")
+            self.budget.deposit()
+        self._count(provider, "attempts")
+
+    def _after_failure(self, provider: str, attempt: int, exc: Exception) -> float:
+        """Record a failed attempt and return the delay before retrying, or re-raise."""
+        if not is_retryable(exc):
+            self._count(provider, "failures")
+            raise exc
+        self.breaker(provider).record_failure()
+        if attempt >= self.policy.max_attempts:
+            self._count(provider, "failures")
+            raise exc
+        if not self.budget.withdraw():
+            self._count(provider, "budget_exhausted")
+            self._count(provider, "failures")
+            raise RetryBudgetExhausted(f"Retry budget exhausted while calling {provider}") from exc
+
+        delay = self.policy.delay(attempt, exc)
+        self._count(provider, "retries")
+        self._count(provider, "wait_seconds", delay)
+        logger.warning(f"{provider} call failed ({exc}); retry {attempt}/{self.policy.max_attempts - 1} in {delay:.1f}s")
+        return delay
+
+    def call(self, provider: str, func: Callable, *args, **kwargs):
+        """Call func with retries, blocking the thread during backoff."""
+        attempt = 1
+        while True:
+            self._before_attempt(provider, attempt)
+            try:
+                result = func(*args, **kwargs)
+                self.breaker(provider).record_success()
+                return result
+            except Exception as e:
+                time.sleep(self._after_failure(provider, attempt, e))
+                attempt += 1
+
+    async def acall(self, provider: str, func: Callable, *args, **kwargs):
+        """Await func(*args, **kwargs) with retries, yielding to the event loop during backoff."""
+        attempt = 1
+        while True:
+            self._before_attempt(provider, attempt)
+            try:
+                result = await func(*args, **kwargs)
+                self.breaker(provider).record_success()
+                return result
+            except Exception as e:
+                await asyncio.sleep(self._after_failure(provider, attempt, e))
+                attempt += 1
+
+    def get_metrics(self) -> Dict[str, Dict]:
+        with self.lock:
+            snapshot = {provider: dict(stats) for provider, stats in self.metrics.items()}
+        for provider, stats in snapshot.items():
+            stats["circuit_state"] = self.breaker(provider).state
+        return snapshot
+
+
+retrier = Retrier()
+
+
+def retry_call(provider: str, func: Callable, *args, **kwargs):
+    """Call func through the shared retrier."""
+    return retrier.call(provider, func, *args, **kwargs)
+
+
+async def retry_call_async(provider: str, func: Callable, *args, **kwargs):
+    """Await func through the shared retrier."""
+    return await retrier.acall(provider, func, *args, **kwargs)
+
+
+def get_retry_metrics() -> Dict[str, Dict]:
+    """Per-provider call, retry and wait-time counters."""
+    return retrier.get_metrics()
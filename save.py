@@ -1,6 +1,9 @@
 import chromadb
 import logging
-from typing import Dict, List, Optional, Union
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 from pathlib import Path
 
 # Import policy-related functions from rl_search
@@ -10,78 +13,387 @@ from rl_search import (
     get_policy_insights as get_policy_stats,
     save_policy_weights as save_policy_model
 )
+from version_index import VersionIndex
+from semantic_search import HybridSearch, build_where, local_embedding_function
+from bm25_index import BM25Index
+from search_ranker import LinUCBRanker
+from embedding_pipeline import embed_documents, get_embedding_stats
+from chunk_index import ChunkIndex, CHUNK_COLLECTION_NAME
+from delta_store import DeltaStore, DeltaCollection
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize ChromaDB client
+# Initialize ChromaDB client. Chroma's PersistentClient supports a single
+# writer process per store; saves from many threads of that process are safe
 chroma_client = chromadb.PersistentClient(path="./chroma_store")
-collection = chroma_client.get_or_create_collection("books_collection")
+collection = chroma_client.get_or_create_collection(
+    "books_collection", embedding_function=local_embedding_function()
+)
+
+# VERSION_STORE=delta keeps version texts as snapshots + diffs outside Chroma
+VERSION_STORE = os.getenv("VERSION_STORE", "full").lower()
+delta_store = DeltaStore() if VERSION_STORE == "delta" else None
+if delta_store:
+    collection = DeltaCollection(collection, delta_store)
+
+# Fallback when the client cannot report Chroma's max batch size
+DEFAULT_MAX_BATCH_SIZE = 5000
+
+# Version index kept next to the Chroma store; rebuilt when it is out of sync
+version_index = VersionIndex()
+
+def _sync_version_index():
+    """Rebuild the version index if it does not match the collection.
+
+    The counts also differ while another process is between ``collection.add``
+    and ``version_index.record``, so they are compared again under the
+    exclusive index lock, which waits for in-flight saves to finish.
+    """
+    try:
+        if version_index.document_count() == collection.count():
+            return
+        with version_index.exclusive():
+            if version_index.document_count() != collection.count():
+                results = collection.get(include=["metadatas"])
+                version_index.rebuild(results["metadatas"])
+    except Exception as e:
+        logger.error(f"Failed to sync version index: {e}")
+
+_sync_version_index()
+
+# Paragraph chunks of every version, for passage-level search
+chunk_collection = chroma_client.get_or_create_collection(
+    CHUNK_COLLECTION_NAME, embedding_function=local_embedding_function()
+)
+
+# Lexical index for names and exact phrases, fused with vector results
+bm25_index = BM25Index()
+
+def _index_versions(versions):
+    """Add newly saved versions to the paragraph and lexical indexes; failures are repaired by the next sync."""
+    versions = list(versions)
+    try:
+        chunk_index.add_versions(versions)
+    except Exception as e:
+        logger.error(f"Failed to index paragraph chunks: {e}")
+    try:
+        bm25_index.add_many(versions)
+    except Exception as e:
+        logger.error(f"Failed to update lexical index: {e}")
 
-# Placeholder for RL agent (if needed)
 class RLSearchAgent:
-    """Placeholder RL search agent implementation"""
+    """Hybrid vector + BM25 retrieval re-ranked by a LinUCB bandit learned from feedback"""
+    def __init__(self, collection, lexical_index):
+        self.search = HybridSearch(collection, lexical_index)
+        self.ranker = LinUCBRanker()
+
     def intelligent_search(self, query: str, context: Dict = None, user_feedback: Dict = None) -> List:
-        logger.warning("RL search agent not fully implemented - using placeholder")
-        return []
+        """Context may narrow results by stage, book, min_version/max_version and n_results."""
+        context = context or {}
+        if user_feedback:
+            self.record_feedback(**user_feedback)
+        n_results = context.get("n_results", 10)
+        where = build_where(context.get("stage"), context.get("book"),
+                            context.get("min_version"), context.get("max_version"))
+        # Over-fetch so the ranker can promote results retrieval placed lower
+        return self.ranker.rank(query, self.search.search(query, n_results * 2, where))[:n_results]
     
     def stage_progression_search(self, query: str) -> List:
-        return []
+        return self.ranker.rank(query, self.search.stage_progression_search(query))
+
+    def get_latest_version_search(self, base_id: str) -> List:
+        version = version_index.latest_any(base_id)
+        if not version:
+            return []
+        chapter = fetch_chapter_by_version(f"{base_id}_ver{version}")
+        if not chapter:
+            return []
+        return [{"id": f"{base_id}_ver{version}", **chapter, "relevance_score": 1.0}]
+
+    def record_feedback(self, clicked_result: bool = False, satisfaction_score: int = 3,
+                        search_id: str = None, result_rank: int = 0) -> Optional[float]:
+        return self.ranker.feedback(clicked_result, satisfaction_score, search_id, result_rank)
     
     def get_search_stats(self) -> Dict:
-        return {}
+        return {**self.search.get_stats(), **self.ranker.get_stats()}
     
     def save_q_table(self):
-        logger.info("RL search model save called (placeholder)")
+        self.ranker.save()
+
+rl_agent = RLSearchAgent(collection, bm25_index)
+
+# Read-through cache: stored versions are immutable, so they are kept in an
+# LRU; latest-stage pointers are cached per thread and dropped when this
+# thread saves or when another connection commits to the version index
+VERSION_CACHE_SIZE = int(os.getenv("VERSION_CACHE_SIZE", "256"))
+_version_cache: "OrderedDict[str, Tuple[str, dict]]" = OrderedDict()
+# Also guards _read_stats, which every request thread updates
+_version_cache_lock = threading.Lock()
+_pointer_cache = threading.local()
+_read_stats = {"version_hits": 0, "version_misses": 0, "pointer_hits": 0, "pointer_misses": 0}
+
+def _cache_version(versioned_id: str, content: str, metadata: dict):
+    with _version_cache_lock:
+        _version_cache[versioned_id] = (content, dict(metadata))
+        _version_cache.move_to_end(versioned_id)
+        while len(_version_cache) > VERSION_CACHE_SIZE:
+            _version_cache.popitem(last=False)
+
+def _cached_version(versioned_id: str) -> Optional[dict]:
+    with _version_cache_lock:
+        entry = _version_cache.get(versioned_id)
+        if entry is None:
+            _read_stats["version_misses"] += 1
+            return None
+        _version_cache.move_to_end(versioned_id)
+        _read_stats["version_hits"] += 1
+    content, metadata = entry
+    # Callers edit the returned dicts, so never hand out the cached ones
+    return {"content": content, "metadata": dict(metadata)}
+
+def _stage_pointers(base_id: str) -> Dict[str, int]:
+    """Latest version of every stage of base_id, read through the per-thread pointer cache."""
+    data_version = version_index.data_version()
+    if getattr(_pointer_cache, "data_version", None) != data_version:
+        _pointer_cache.data_version = data_version
+        _pointer_cache.entries = {}
+    entries = _pointer_cache.entries
+    hit = base_id in entries
+    if not hit:
+        entries[base_id] = version_index.stage_versions(base_id)
+    # The pointer cache is per thread but the counters are shared
+    with _version_cache_lock:
+        _read_stats["pointer_hits" if hit else "pointer_misses"] += 1
+    return dict(entries[base_id])
+
+def _invalidate_pointers(base_ids):
+    # Commits from this thread's own connection do not change its data_version
+    entries = getattr(_pointer_cache, "entries", {})
+    for base_id in base_ids:
+        entries.pop(base_id, None)
+
+def get_version_store_stats() -> dict:
+    """Size and compression of the delta version store; empty when it is disabled."""
+    try:
+        return delta_store.get_stats() if delta_store else {}
+    except Exception as e:
+        logger.error(f"Error getting version store stats: {e}")
+        return {}
 
-rl_agent = RLSearchAgent()
+def get_read_cache_stats() -> dict:
+    """Hit counts of the version and latest-pointer caches."""
+    with _version_cache_lock:
+        stats = dict(_read_stats)
+        stats["cached_versions"] = len(_version_cache)
+    lookups = stats["version_hits"] + stats["version_misses"]
+    stats["version_hit_rate"] = stats["version_hits"] / lookups if lookups else 0.0
+    return stats
 
 def get_next_version(base_id: str) -> int:
     """Auto-increment version number for a given base_id."""
-    results = collection.get(include=["metadatas"])
+    return version_index.next_version(base_id)
 
-    # Filter versions manually
-    versions = [
-        meta["version"]
-        for meta in results["metadatas"]
-        if meta.get("versioned_id", "").startswith(base_id)
-    ]
+# How document embeddings are computed (see embedding_pipeline); versions
+# stored under another scheme are re-embedded once by migrate_embeddings
+EMBEDDING_SCHEME = "paragraph-mean-v1"
+EMBEDDING_SCHEME_MARKER = Path("./chroma_store") / "embedding_scheme"
+MIGRATION_PAGE_SIZE = 500
+
+# Carried into the metadata only when present; Chroma rejects None values
+OPTIONAL_METADATA_KEYS = ["screenshot_path"]
+# Describe the scraped source page, so they are only kept on raw versions
+RAW_METADATA_KEYS = ["content_hash", "etag", "last_modified"]
 
-    return max(versions, default=0) + 1
+def _build_metadata(data: dict, versioned_id: str, version: int, stage: str) -> dict:
+    """Build the Chroma metadata stored alongside a chapter version."""
+    keys = OPTIONAL_METADATA_KEYS + (RAW_METADATA_KEYS if stage == "raw" else [])
+    optional = {key: data[key] for key in keys if data.get(key)}
+    return {
+        "book_title": data["book_title"],
+        "author": data["author"],
+        "chapter_info": data["chapter_info"],
+        "chapter_title": data["chapter_title"],
+        "source_url": data["source_url"],
+        "version": version,
+        "stage": stage,
+        "versioned_id": versioned_id,
+        "reviewer_feedback": data.get("reviewer_feedback", ""),
+        "embedding_scheme": EMBEDDING_SCHEME,
+        **optional
+    }
 
-def save_chapter_auto_version(data: dict, base_id: str, stage: str) -> bool:
-    """Save chapter with auto-incremented version and metadata."""
+def save_chapter_auto_version(data: dict, base_id: str, stage: str) -> Optional[str]:
+    """Save chapter with auto-incremented version and metadata; returns its versioned_id, or None on failure."""
     try:
-        version = get_next_version(base_id)
-        versioned_id = f"{base_id}_ver{version}"
         content = data["content"]
+        # Embed before taking the lock; only new paragraphs reach the model
+        embeddings = embed_documents([content]).tolist()
+        with version_index.lock(base_id):
+            version = get_next_version(base_id)
+            versioned_id = f"{base_id}_ver{version}"
+            metadata = _build_metadata(data, versioned_id, version, stage)
 
-        metadata = {
-            "book_title": data["book_title"],
-            "author": data["author"],
-            "chapter_info": data["chapter_info"],
-            "chapter_title": data["chapter_title"],
-            "source_url": data["source_url"],
-            "version": version,
-            "stage": stage,
-            "versioned_id": versioned_id,
-            "reviewer_feedback": data.get("reviewer_feedback", "")
-        }
-
-        collection.add(
-            documents=[content],
-            ids=[versioned_id],
-            metadatas=[metadata]
-        )
+            collection.add(
+                documents=[content],
+                embeddings=embeddings,
+                ids=[versioned_id],
+                metadatas=[metadata]
+            )
+            version_index.record(base_id, stage, version)
+        _invalidate_pointers([base_id])
+        _cache_version(versioned_id, content, metadata)
+        _index_versions([(versioned_id, content, metadata)])
         logger.info(f"Saved {versioned_id} to ChromaDB (stage: {stage})")
-        return True
+        return versioned_id
     except Exception as e:
         logger.error(f"Failed to save chapter: {e}")
-        return False
+        return None
+
+def migrate_embeddings() -> int:
+    """Re-embed versions stored under an older embedding scheme; returns how many were updated.
+
+    Before the paragraph pipeline, documents were embedded whole, and those
+    vectors are not comparable with the pooled ones.
+    """
+    updated = 0
+    offset = 0
+    while True:
+        page = collection.get(include=["metadatas"], limit=MIGRATION_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            return updated
+        offset += len(page["ids"])
+        stale = {doc_id: metadata for doc_id, metadata in zip(page["ids"], page["metadatas"])
+                 if metadata.get("embedding_scheme") != EMBEDDING_SCHEME}
+        if not stale:
+            continue
+        documents = collection.get(ids=list(stale), include=["documents"])
+        ids = documents["ids"]
+        collection.update(
+            ids=ids,
+            embeddings=embed_documents(documents["documents"]).tolist(),
+            metadatas=[{**stale[doc_id], "embedding_scheme": EMBEDDING_SCHEME} for doc_id in ids]
+        )
+        updated += len(ids)
+        logger.info(f"Re-embedded {updated} versions stored under an older embedding scheme")
+
+def _migrate_embeddings_once():
+    """Run migrate_embeddings the first time this store is opened with the current scheme."""
+    try:
+        if EMBEDDING_SCHEME_MARKER.exists() and EMBEDDING_SCHEME_MARKER.read_text().strip() == EMBEDDING_SCHEME:
+            return
+        migrate_embeddings()
+        EMBEDDING_SCHEME_MARKER.write_text(EMBEDDING_SCHEME)
+    except Exception as e:
+        logger.error(f"Failed to migrate embeddings: {e}")
+
+_migrate_embeddings_once()
+
+def get_max_batch_size() -> int:
+    """Largest number of documents Chroma accepts in a single add call."""
+    try:
+        if hasattr(chroma_client, "get_max_batch_size"):
+            return chroma_client.get_max_batch_size()
+        return chroma_client.max_batch_size
+    except Exception:
+        return DEFAULT_MAX_BATCH_SIZE
+
+def _version_texts(versioned_ids: List[str]) -> Dict[str, str]:
+    """Full texts of the given versions, from the delta store or from Chroma for older versions."""
+    result = collection.get(ids=versioned_ids, include=["documents"])
+    return {doc_id: text for doc_id, text in zip(result["ids"], result["documents"]) if text is not None}
+
+# In delta mode chunks keep only offsets; passages are cut from the version text
+chunk_index = ChunkIndex(chunk_collection, get_max_batch_size(),
+                         text_source=_version_texts if delta_store else None)
+
+def _sync_search_indexes():
+    """Index any stored versions missing from the paragraph or lexical index."""
+    try:
+        chunk_index.sync(collection)
+    except Exception as e:
+        logger.error(f"Failed to sync paragraph index: {e}")
+    try:
+        bm25_index.sync(collection)
+    except Exception as e:
+        logger.error(f"Failed to sync lexical index: {e}")
+
+_sync_search_indexes()
+
+def save_chapters_batch(items: List[Tuple[dict, str, str]]) -> List[Dict]:
+    """Save many (data, base_id, stage) items with auto-incremented versions.
+
+    Versions are assigned for all items in one pass and written with chunked
+    ``collection.add`` calls. Returns one result dict per item, in input order,
+    with ``saved``, ``versioned_id``, ``version`` and ``error`` keys.
+    """
+    results = [
+        {"base_id": base_id, "stage": stage, "saved": False,
+         "versioned_id": None, "version": None, "error": ""}
+        for _, base_id, stage in items
+    ]
+    try:
+        # One batched embedding pass for every item, outside the locks
+        embeddings = embed_documents([data.get("content", "") for data, _, _ in items]).tolist() if items else []
+    except Exception as e:
+        logger.error(f"Failed to embed batch of {len(items)} chapters: {e}")
+        for result in results:
+            result["error"] = f"Embedding failed: {e}"
+        return results
+
+    with version_index.lock(*{base_id for _, base_id, _ in items}):
+        next_versions: Dict[str, int] = {}
+        pending = []
+
+        for i, (data, base_id, stage) in enumerate(items):
+            try:
+                if base_id not in next_versions:
+                    next_versions[base_id] = get_next_version(base_id)
+                version = next_versions[base_id]
+                versioned_id = f"{base_id}_ver{version}"
+                metadata = _build_metadata(data, versioned_id, version, stage)
+                pending.append((i, data["content"], versioned_id, metadata))
+                next_versions[base_id] = version + 1
+                results[i].update(versioned_id=versioned_id, version=version)
+            except Exception as e:
+                results[i]["error"] = f"Invalid chapter data: {e}"
+
+        batch_size = get_max_batch_size()
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            try:
+                collection.add(
+                    documents=[content for _, content, _, _ in chunk],
+                    embeddings=[embeddings[i] for i, _, _, _ in chunk],
+                    ids=[versioned_id for _, _, versioned_id, _ in chunk],
+                    metadatas=[metadata for _, _, _, metadata in chunk]
+                )
+            except Exception as e:
+                # Stop here: later chunks would leave a version gap behind this one
+                logger.error(f"Failed to save batch of {len(chunk)} chapters: {e}")
+                for i, _, _, _ in pending[start:]:
+                    results[i].update(versioned_id=None, version=None, error=str(e))
+                break
+
+            for i, _, _, _ in chunk:
+                results[i]["saved"] = True
+            version_index.record_many(
+                (results[i]["base_id"], results[i]["stage"], results[i]["version"])
+                for i, _, _, _ in chunk
+            )
+            _invalidate_pointers({results[i]["base_id"] for i, _, _, _ in chunk})
+            _index_versions((versioned_id, content, metadata) for _, content, versioned_id, metadata in chunk)
+
+    saved = sum(1 for r in results if r["saved"])
+    logger.info(f"Batch saved {saved}/{len(items)} chapters to ChromaDB")
+    return results
 
 def fetch_chapter_by_version(versioned_id: str, stage: str = None) -> dict:
-    """Fetch a specific chapter version from ChromaDB."""
+    """Fetch a specific chapter version from ChromaDB (versions are immutable, so reads are cached)."""
+    cached = _cached_version(versioned_id)
+    if cached:
+        return cached
     try:
         result = collection.get(ids=[versioned_id], include=["documents", "metadatas"])
         
@@ -90,10 +402,11 @@ def fetch_chapter_by_version(versioned_id: str, stage: str = None) -> dict:
             return {}
             
         metadata = result["metadatas"][0]
+        _cache_version(versioned_id, result["documents"][0], metadata)
         
         return {
             "content": result["documents"][0],
-            "metadata": metadata
+            "metadata": dict(metadata)
         }
     except Exception as e:
         logger.error(f"Error fetching chapter: {e}")
@@ -102,18 +415,32 @@ def fetch_chapter_by_version(versioned_id: str, stage: str = None) -> dict:
 def get_latest_version(base_id: str, stage: str) -> int:
     """Get the highest version number for a given base_id and stage"""
     try:
-        results = collection.get(include=["metadatas"])
-        versions = [
-            meta["version"]
-            for meta in results["metadatas"]
-            if meta.get("versioned_id", "").startswith(base_id)
-            and meta.get("stage") == stage
-        ]
-        return max(versions, default=0)
+        return _stage_pointers(base_id).get(stage, 0)
     except Exception as e:
         logger.error(f"Error getting latest version: {e}")
         return 0
 
+def get_stage_versions(base_id: str) -> Dict[str, int]:
+    """Get the latest version number of every stage stored for base_id"""
+    try:
+        return _stage_pointers(base_id)
+    except Exception as e:
+        logger.error(f"Error getting stage versions: {e}")
+        return {}
+
+def get_latest_across_stages(base_id: str, stages: List[str] = None) -> dict:
+    """The newest version of base_id among the given stages (all stages by default), or {}."""
+    try:
+        pointers = _stage_pointers(base_id)
+        candidates = {stage: version for stage, version in pointers.items() if stages is None or stage in stages}
+        if not candidates:
+            return {}
+        stage = max(candidates, key=candidates.get)
+        return fetch_chapter_by_version(f"{base_id}_ver{candidates[stage]}", stage)
+    except Exception as e:
+        logger.error(f"Error getting latest version across stages: {e}")
+        return {}
+
 def format_chapter_markdown(chapter_data: dict) -> str:
     """Format chapter data as markdown."""
     try:
@@ -147,7 +474,7 @@ def format_chapter_markdown(chapter_data: dict) -> str:
         logger.error(f"Error formatting markdown: {e}")
         return "Error formatting content"
 
-# Search-related functions (using placeholder RL agent)
+# Search-related functions
 def intelligent_search(query: str, context: dict = None, user_feedback: dict = None) -> list:
     """Intelligent content search with RL integration."""
     try:
@@ -167,18 +494,20 @@ def search_by_stage_progression(query: str) -> list:
 def search_latest_content(base_id: str = "chapter1") -> list:
     """Get the latest version of content."""
     try:
-        context = {"base_id": base_id}
         return rl_agent.get_latest_version_search(base_id)
     except Exception as e:
         logger.error(f"Latest content search failed: {e}")
         return []
 
-def provide_search_feedback(clicked_result: bool = False, satisfaction_score: int = 3) -> dict:
-    """Provide feedback to improve search results."""
+def provide_search_feedback(clicked_result: bool = False, satisfaction_score: int = 3,
+                            search_id: str = None, result_rank: int = 0) -> dict:
+    """Provide feedback on a ranked result (default: the top result of the last search)."""
     try:
+        reward = rl_agent.record_feedback(clicked_result, satisfaction_score, search_id, result_rank)
         return {
             "clicked_result": clicked_result,
-            "satisfaction_score": satisfaction_score
+            "satisfaction_score": satisfaction_score,
+            "reward": reward
         }
     except Exception as e:
         logger.error(f"Error providing search feedback: {e}")
@@ -192,6 +521,33 @@ def get_search_analytics() -> dict:
         logger.error(f"Error getting search analytics: {e}")
         return {}
 
+def search_passages(query: str, n_results: int = 10, context: dict = None) -> list:
+    """Best-matching paragraphs with their chapter offsets and query-term highlights."""
+    try:
+        context = context or {}
+        where = build_where(context.get("stage"), context.get("book"),
+                            context.get("min_version"), context.get("max_version"))
+        return chunk_index.search(query, n_results, where)
+    except Exception as e:
+        logger.error(f"Passage search failed: {e}")
+        return []
+
+def best_passages(query: str, versioned_ids: list) -> dict:
+    """Best-matching passage of each given version, keyed by versioned_id."""
+    try:
+        return chunk_index.best_passages(query, versioned_ids)
+    except Exception as e:
+        logger.error(f"Passage lookup failed: {e}")
+        return {}
+
+def get_ingest_stats() -> dict:
+    """Embedding throughput and paragraph-cache counters for saved versions."""
+    try:
+        return get_embedding_stats()
+    except Exception as e:
+        logger.error(f"Error getting ingest stats: {e}")
+        return {}
+
 def save_rl_model() -> bool:
     """Save the trained RL model."""
     try:
@@ -0,0 +1,170 @@
+"""LinUCB contextual-bandit re-ranker for search results.
+
+Each (query, result) pair is described by a small feature vector: retrieval
+scores, the result's stage and version, and the query's shape. One shared
+linear model scores every candidate as ``x.theta + alpha * sqrt(x A^-1 x)``.
+The first term exploits what feedback has taught it, and the second explores
+results it is still unsure about. Scoring all top-k candidates is a few
+matrix products. A^-1 is kept up to date with Sherman-Morrison updates, so
+no matrix is inverted per query or per feedback.
+
+Feedback (was a result clicked, how satisfied was the user) updates the
+model for the result it refers to. State is persisted atomically
+(temp file + os.replace) so a crash never leaves a half-written model.
+"""
+import json
+import logging
+import os
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from semantic_search import STAGE_PROGRESSION
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RANKER_PATH = Path(os.getenv("SEARCH_RANKER_PATH", "search_ranker.npz"))
+FEATURES = ["bias", "relevance", "vector_score", "bm25_score", "stage_progress", "is_final",
+            "relative_version", "lexical_only", "short_query"]
+MAX_PENDING_SEARCHES = 256
+SAVE_EVERY = 10
+
+
+def feedback_reward(clicked_result: bool, satisfaction_score: float) -> float:
+    """Reward in [0, 1]: half from the click, half from a 1-5 satisfaction score."""
+    satisfaction = (min(max(float(satisfaction_score), 1.0), 5.0) - 1.0) / 4.0
+    return 0.5 * float(bool(clicked_result)) + 0.5 * satisfaction
+
+
+def result_features(query: str, results: List[Dict]) -> np.ndarray:
+    """Feature matrix, one row per result, columns as in FEATURES."""
+    features = np.zeros((len(results), len(FEATURES)), dtype=np.float64)
+    if not results:
+        return features
+    metadata = [r.get("metadata", {}) for r in results]
+    bm25 = np.array([r.get("bm25_score", 0.0) for r in results])
+    versions = np.array([float(m.get("version", 0) or 0) for m in metadata])
+    features[:, 0] = 1.0
+    features[:, 1] = [r.get("relevance_score", 0.0) for r in results]
+    features[:, 2] = [r.get("vector_score", r.get("relevance_score", 0.0)) for r in results]
+    features[:, 3] = bm25 / bm25.max() if bm25.max() > 0 else 0.0
+    features[:, 4] = [STAGE_PROGRESSION.get(m.get("stage"), 0) / 4.0 for m in metadata]
+    features[:, 5] = [m.get("stage") == "final" for m in metadata]
+    features[:, 6] = versions / versions.max() if versions.max() > 0 else 0.0
+    features[:, 7] = (features[:, 2] == 0) & (bm25 > 0)
+    features[:, 8] = 1.0 / max(len(re.findall(r"\w+", query)), 1)
+    return features
+
+
+class LinUCBRanker:
+    """Shared-model LinUCB re-ranker with persisted state and feedback statistics."""
+
+    def __init__(self, path: Path = SEARCH_RANKER_PATH, alpha: float = 0.2, ridge: float = 1.0):
+        self.path = Path(path)
+        self.alpha = alpha
+        dim = len(FEATURES)
+        self.A_inv = np.eye(dim) / ridge
+        # Prior: before any feedback, rank by the retrieval relevance score
+        self.b = np.zeros(dim)
+        self.b[FEATURES.index("relevance")] = ridge
+        self.theta = self.A_inv @ self.b
+        self.stats = {"total_searches": 0, "feedback_count": 0, "total_reward": 0.0, "action_distribution": {}}
+        self._pending: "OrderedDict[str, Dict]" = OrderedDict()
+        self._updates_since_save = 0
+        self._lock = threading.Lock()
+        self.load()
+
+    def rank(self, query: str, results: List[Dict]) -> List[Dict]:
+        """Re-rank results by UCB score; each result gets "ucb_score", "search_id" and "rank"."""
+        if not results:
+            return []
+        features = result_features(query, results)
+        with self._lock:
+            exploit = features @ self.theta
+            explore = np.sqrt(np.einsum("ij,jk,ik->i", features, self.A_inv, features))
+            scores = exploit + self.alpha * explore
+            order = np.argsort(-scores, kind="stable")
+
+            search_id = uuid.uuid4().hex
+            self._pending[search_id] = {"features": features[order]}
+            while len(self._pending) > MAX_PENDING_SEARCHES:
+                self._pending.popitem(last=False)
+            top_stage = results[order[0]].get("metadata", {}).get("stage", "unknown")
+            self.stats["total_searches"] += 1
+            distribution = self.stats["action_distribution"]
+            distribution[top_stage] = distribution.get(top_stage, 0) + 1
+
+        return [
+            {**results[i], "ucb_score": float(scores[i]), "search_id": search_id, "rank": rank}
+            for rank, i in enumerate(order)
+        ]
+
+    def feedback(self, clicked_result: bool, satisfaction_score: float, search_id: Optional[str] = None,
+                 result_rank: int = 0) -> Optional[float]:
+        """Update the model for one ranked result; search_id defaults to the most recent search."""
+        reward = feedback_reward(clicked_result, satisfaction_score)
+        with self._lock:
+            if not self._pending:
+                return None
+            search_id = search_id or next(reversed(self._pending))
+            pending = self._pending.get(search_id)
+            if pending is None or not 0 <= result_rank < len(pending["features"]):
+                return None
+            x = pending["features"][result_rank]
+
+            # Sherman-Morrison: (A + x x^T)^-1 from A^-1
+            A_inv_x = self.A_inv @ x
+            self.A_inv -= np.outer(A_inv_x, A_inv_x) / (1.0 + x @ A_inv_x)
+            self.b += reward * x
+            self.theta = self.A_inv @ self.b
+
+            self.stats["feedback_count"] += 1
+            self.stats["total_reward"] += reward
+            self._updates_since_save += 1
+            should_save = self._updates_since_save >= SAVE_EVERY
+        if should_save:
+            self.save()
+        return reward
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = {**self.stats, "action_distribution": dict(self.stats["action_distribution"])}
+            stats["weights"] = dict(zip(FEATURES, self.theta.round(4).tolist()))
+        count = stats["feedback_count"]
+        stats["average_reward"] = stats["total_reward"] / count if count else 0.0
+        return stats
+
+    def save(self):
+        """Write the model to a temp file and atomically replace the saved one."""
+        with self._lock:
+            arrays = {"A_inv": self.A_inv.copy(), "b": self.b.copy(),
+                      "stats": np.array(json.dumps(self.stats))}
+            self._updates_since_save = 0
+        tmp_path = self.path.with_name(f"{self.path.name}.{os.getpid()}.tmp")
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        logger.info(f"Search ranker saved to {self.path}")
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as saved:
+                if saved["A_inv"].shape != self.A_inv.shape:
+                    logger.warning(f"Ignoring {self.path}: saved for a different feature set")
+                    return
+                self.A_inv = saved["A_inv"]
+                self.b = saved["b"]
+                self.stats.update(json.loads(str(saved["stats"])))
+            self.theta = self.A_inv @ self.b
+            logger.info(f"Search ranker loaded from {self.path}")
+        except Exception as e:
+            logger.error(f"Failed to load search ranker: {e}")
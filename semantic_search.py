@@ -0,0 +1,204 @@
+"""Semantic search over stored chapter versions.
+
+Queries go through ``collection.query`` and are embedded with Chroma's
+default embedding function, all-MiniLM-L6-v2 run locally through ONNX
+Runtime on CPU. No API key or network is needed once the model is cached.
+Results can be filtered by stage, book and version range, and come back as
+``{"id", "metadata", "content", "relevance_score"}`` dicts, best first.
+
+``HybridSearch`` additionally ranks with a lexical BM25 index and merges
+both rankings with reciprocal rank fusion, so exact names and phrases
+are found even when their embeddings are not close to the query's.
+"""
+import logging
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Union
+
+from version_index import split_versioned_id
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_N_RESULTS = 10
+RRF_K = 60
+
+# Workflow order used to rank versions of the same chapter; human edits
+# count as the stage they replace
+STAGE_PROGRESSION = {
+    "raw": 0,
+    "rewritten": 1, "human_rewritten": 1,
+    "reviewed": 2, "human_reviewed": 2,
+    "edited": 3, "human_edited": 3,
+    "final": 4,
+}
+
+
+def local_embedding_function():
+    """Chroma's default embedding function: MiniLM-L6-v2 on CPU via ONNX Runtime."""
+    from chromadb.utils import embedding_functions
+
+    return embedding_functions.DefaultEmbeddingFunction()
+
+
+def build_where(stage: Union[str, Sequence[str], None] = None, book: Optional[str] = None,
+                min_version: Optional[int] = None, max_version: Optional[int] = None) -> Optional[Dict]:
+    """Chroma metadata filter for the given stage(s), book title and version range."""
+    conditions = []
+    if isinstance(stage, str):
+        conditions.append({"stage": stage})
+    elif stage:
+        conditions.append({"stage": {"$in": list(stage)}})
+    if book:
+        conditions.append({"book_title": book})
+    if min_version is not None:
+        conditions.append({"version": {"$gte": int(min_version)}})
+    if max_version is not None:
+        conditions.append({"version": {"$lte": int(max_version)}})
+
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def relevance_from_distance(distance: float, space: str = "l2") -> float:
+    """Map a Chroma distance to a 0-1 relevance score (cosine similarity for normalized embeddings)."""
+    if space == "l2":
+        # Chroma reports squared L2; for unit vectors that is 2 - 2*cos
+        similarity = 1.0 - distance / 2.0
+    else:
+        # "cosine" and "ip" distances are 1 - similarity
+        similarity = 1.0 - distance
+    return max(0.0, min(1.0, similarity))
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = RRF_K) -> Dict[str, float]:
+    """Fused score per id: the sum over rankings of 1 / (k + rank)."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, 1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return scores
+
+
+class SemanticSearch:
+    """Vector search over a Chroma collection of chapter versions."""
+
+    def __init__(self, collection):
+        self.collection = collection
+        metadata = getattr(collection, "metadata", None) or {}
+        self.space = metadata.get("hnsw:space", "l2")
+        self.stats = {"total_searches": 0, "empty_results": 0}
+        self._latencies: List[float] = []
+        self._lock = threading.Lock()
+
+    def _record(self, elapsed: float, found: int):
+        with self._lock:
+            self.stats["total_searches"] += 1
+            if not found:
+                self.stats["empty_results"] += 1
+            self._latencies.append(elapsed)
+            del self._latencies[:-1000]
+
+    def search(self, query: str = None, n_results: int = DEFAULT_N_RESULTS, where: Optional[Dict] = None,
+               query_embedding: Optional[Sequence[float]] = None) -> List[Dict]:
+        """Best-matching chapter versions for a query text (or a precomputed query embedding)."""
+        start = time.perf_counter()
+        available = self.collection.count()
+        if not available:
+            return []
+        params = {
+            "n_results": min(n_results, available),
+            "where": where,
+            "include": ["documents", "metadatas", "distances"],
+        }
+        if query_embedding is not None:
+            params["query_embeddings"] = [list(query_embedding)]
+        else:
+            params["query_texts"] = [query]
+        result = self.collection.query(**params)
+
+        hits = [
+            {
+                "id": doc_id,
+                "metadata": metadata or {},
+                "content": document or "",
+                "relevance_score": relevance_from_distance(distance, self.space),
+            }
+            for doc_id, document, metadata, distance in zip(
+                result["ids"][0], result["documents"][0], result["metadatas"][0], result["distances"][0]
+            )
+        ]
+        self._record(time.perf_counter() - start, len(hits))
+        return hits
+
+    def stage_progression_search(self, query: str, n_results: int = DEFAULT_N_RESULTS,
+                                 where: Optional[Dict] = None) -> List[Dict]:
+        """Matching chapters, each represented by its furthest-progressed matching version."""
+        best: Dict[str, Dict] = {}
+        relevance: Dict[str, float] = {}
+        for hit in self.search(query, n_results * 4, where):
+            base_id = split_versioned_id(hit["id"])
+            rank = (STAGE_PROGRESSION.get(hit["metadata"].get("stage"), -1), hit["metadata"].get("version", 0))
+            current = best.get(base_id)
+            if current is None or rank > (STAGE_PROGRESSION.get(current["metadata"].get("stage"), -1),
+                                          current["metadata"].get("version", 0)):
+                best[base_id] = hit
+            relevance[base_id] = max(relevance.get(base_id, 0.0), hit["relevance_score"])
+
+        ordered = sorted(best, key=relevance.get, reverse=True)[:n_results]
+        return [{**best[base_id], "relevance_score": relevance[base_id]} for base_id in ordered]
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            latencies = sorted(self._latencies)
+        if latencies:
+            stats["latency_ms_p50"] = latencies[len(latencies) // 2] * 1000
+            stats["latency_ms_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+        return stats
+
+
+class HybridSearch(SemanticSearch):
+    """Vector search fused with a lexical index by reciprocal rank fusion."""
+
+    def __init__(self, collection, lexical_index, rrf_k: int = RRF_K, candidates: int = 2):
+        super().__init__(collection)
+        self.lexical_index = lexical_index
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+
+    def search(self, query: str = None, n_results: int = DEFAULT_N_RESULTS, where: Optional[Dict] = None,
+               query_embedding: Optional[Sequence[float]] = None) -> List[Dict]:
+        """Fused vector + BM25 results; relevance_score is the fused score scaled to 0-1."""
+        if not query:
+            return super().search(query, n_results, where, query_embedding)
+
+        pool = n_results * self.candidates
+        vector_hits = super().search(query, pool, where, query_embedding)
+        lexical_hits = self.lexical_index.search(query, pool, where)
+        fused = reciprocal_rank_fusion(
+            [[hit["id"] for hit in vector_hits], [hit["id"] for hit in lexical_hits]], self.rrf_k
+        )
+        top = sorted(fused, key=fused.get, reverse=True)[:n_results]
+
+        by_id = {hit["id"]: hit for hit in vector_hits}
+        lexical_only = [doc_id for doc_id in top if doc_id not in by_id]
+        if lexical_only:
+            stored = self.collection.get(ids=lexical_only, include=["documents", "metadatas"])
+            for doc_id, document, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"]):
+                by_id[doc_id] = {"id": doc_id, "metadata": metadata or {}, "content": document or "",
+                                 "relevance_score": 0.0}
+
+        bm25_scores = {hit["id"]: hit["bm25_score"] for hit in lexical_hits}
+        best_possible = 2.0 / (self.rrf_k + 1)
+        return [
+            {
+                **by_id[doc_id],
+                "vector_score": by_id[doc_id]["relevance_score"],
+                "bm25_score": bm25_scores.get(doc_id, 0.0),
+                "relevance_score": fused[doc_id] / best_possible,
+            }
+            for doc_id in top if doc_id in by_id
+        ]
@@ -0,0 +1,65 @@
+"""Per-browser-session workflow state for the Gradio UI.
+
+Each browser tab gets its own state dict, keyed by Gradio's session hash,
+so concurrent editors never see or overwrite each other's chapter data.
+Sessions idle for longer than SESSION_TTL_SECONDS are evicted, and at most
+SESSION_MAX_COUNT sessions are kept (least recently used go first).
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "3600"))
+SESSION_MAX_COUNT = int(os.getenv("SESSION_MAX_COUNT", "1000"))
+DEFAULT_SESSION_ID = "default"
+
+
+class SessionStore:
+    """Thread-safe TTL + LRU map from session id to a state dict."""
+
+    def __init__(self, factory: Callable[[], Dict], ttl: float = SESSION_TTL_SECONDS,
+                 max_sessions: int = SESSION_MAX_COUNT):
+        self.factory = factory
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now: float):
+        while self._sessions:
+            session_id, (last_seen, _) = next(iter(self._sessions.items()))
+            if now - last_seen <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            logger.info(f"Evicted UI session {session_id}")
+
+    def get(self, session_id: Optional[str]) -> Dict:
+        """State of a session, created fresh if it is new or has expired."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+            state = entry[1] if entry and now - entry[0] <= self.ttl else self.factory()
+            self._sessions[session_id] = (now, state)
+            self._evict(now)
+            return state
+
+    def reset(self, session_id: Optional[str], **values) -> Dict:
+        """Replace a session's state with a fresh one, keeping the given values."""
+        session_id = session_id or DEFAULT_SESSION_ID
+        state = {**self.factory(), **values}
+        now = time.monotonic()
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._sessions[session_id] = (now, state)
+            self._evict(now)
+        return state
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
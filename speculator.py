@@ -0,0 +1,156 @@
+"""Opt-in speculative pre-computation of the policy-suggested next stage.
+
+When the policy suggests a next stage, the UI can start that stage's LLM
+work right away, on a small dedicated pool, before the user clicks. The
+result is kept in memory and keyed by session, stage and input. If the
+user then clicks the suggested button, the stage reuses the finished
+result, or follows one that is still running, instead of calling the model
+again. Any other action cancels the speculation, and cancelled work stops
+at the next streamed chunk.
+
+Each session has a speculation token budget (SPECULATION_TOKEN_BUDGET,
+estimated tokens). Hit-rate metrics show how much of the speculative spend
+paid off. Enable by default with SPECULATION=on; the UI also has a toggle.
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+SPECULATION_ENABLED = os.getenv("SPECULATION", "off").lower() in ("on", "1", "true")
+SPECULATION_WORKERS = int(os.getenv("SPECULATION_WORKERS", "2"))
+SPECULATION_TOKEN_BUDGET = int(os.getenv("SPECULATION_TOKEN_BUDGET", "100000"))
+MAX_TRACKED_SESSIONS = 1000
+
+
+class Speculation:
+    """One speculative stage run; compute functions check `cancelled` between chunks."""
+
+    def __init__(self, session_id: str, stage: str, key: str, tokens: int):
+        self.session_id = session_id
+        self.stage = stage
+        self.key = key
+        self.tokens = tokens
+        self.status = "running"
+        self.partial: Optional[str] = None
+        self.result = None
+        self.cancelled = threading.Event()
+        self.finished = threading.Event()
+        self.started_at = time.time()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self.finished.wait(timeout)
+
+
+class Speculator:
+    """Runs, hands over and cancels per-session speculative stage runs."""
+
+    def __init__(self, workers: int = SPECULATION_WORKERS, token_budget: int = SPECULATION_TOKEN_BUDGET):
+        self.token_budget = token_budget
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="speculation")
+        self._active: Dict[str, Speculation] = {}
+        self._spent: "OrderedDict[str, int]" = OrderedDict()
+        self.stats = {"started": 0, "hits": 0, "misses": 0, "cancelled": 0, "failed": 0,
+                      "over_budget": 0, "tokens_spent": 0, "tokens_used": 0}
+        self._lock = threading.Lock()
+
+    def _run(self, speculation: Speculation, compute: Callable, args):
+        try:
+            speculation.result = compute(speculation, *args)
+            if speculation.cancelled.is_set():
+                speculation.status = "cancelled"
+            else:
+                speculation.status = "done"
+        except Exception as e:
+            logger.warning(f"Speculative {speculation.stage} for {speculation.key} failed: {e}")
+            speculation.status = "failed"
+            with self._lock:
+                self.stats["failed"] += 1
+        finally:
+            speculation.finished.set()
+
+    def _cancel_locked(self, session_id: str):
+        speculation = self._active.pop(session_id, None)
+        if speculation and not speculation.cancelled.is_set():
+            speculation.cancelled.set()
+            self.stats["cancelled"] += 1
+            logger.info(f"Cancelled speculative {speculation.stage} for {speculation.key}")
+
+    def start(self, session_id: str, stage: str, key: str, tokens: int, compute: Callable, *args) -> bool:
+        """Speculatively run compute(speculation, *args), unless it would exceed the session's budget."""
+        with self._lock:
+            current = self._active.get(session_id)
+            if current and current.stage == stage and current.key == key and current.status in ("running", "done"):
+                return True
+            self._cancel_locked(session_id)
+            spent = self._spent.pop(session_id, 0)
+            self._spent[session_id] = spent
+            while len(self._spent) > MAX_TRACKED_SESSIONS:
+                self._spent.popitem(last=False)
+            if spent + tokens > self.token_budget:
+                self.stats["over_budget"] += 1
+                logger.info(f"Skipping speculative {stage}: session budget of {self.token_budget} tokens used up")
+                return False
+            self._spent[session_id] = spent + tokens
+            speculation = Speculation(session_id, stage, key, tokens)
+            self._active[session_id] = speculation
+            self.stats["started"] += 1
+            self.stats["tokens_spent"] += tokens
+        self._pool.submit(self._run, speculation, compute, args)
+        logger.info(f"Speculatively running {stage} for {key} (~{tokens} tokens)")
+        return True
+
+    def claim(self, session_id: str, stage: str, key: str) -> Optional[Speculation]:
+        """Hand over the session's speculation if it matches; any other speculation is cancelled."""
+        with self._lock:
+            speculation = self._active.get(session_id)
+            if speculation is None:
+                return None
+            if speculation.stage != stage or speculation.key != key or speculation.status in ("failed", "cancelled"):
+                self._cancel_locked(session_id)
+                self.stats["misses"] += 1
+                return None
+            del self._active[session_id]
+            self.stats["hits"] += 1
+            self.stats["tokens_used"] += speculation.tokens
+            return speculation
+
+    def cancel(self, session_id: str):
+        """Cancel the session's speculation, e.g. when it moves on to another chapter."""
+        with self._lock:
+            if session_id in self._active:
+                self.stats["misses"] += 1
+            self._cancel_locked(session_id)
+
+    def spent(self, session_id: str) -> int:
+        with self._lock:
+            return self._spent.get(session_id, 0)
+
+    def get_stats(self) -> Dict:
+        with self._lock:
+            stats = dict(self.stats)
+            stats["active"] = sum(1 for s in self._active.values() if s.status == "running")
+        settled = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / settled if settled else 0.0
+        spent = stats["tokens_spent"]
+        stats["tokens_wasted"] = spent - stats["tokens_used"]
+        stats["token_efficiency"] = stats["tokens_used"] / spent if spent else 0.0
+        return stats
+
+
+_speculator: Optional[Speculator] = None
+_speculator_lock = threading.Lock()
+
+
+def get_speculator() -> Speculator:
+    """Process-wide speculator, created on first use."""
+    global _speculator
+    with _speculator_lock:
+        if _speculator is None:
+            _speculator = Speculator()
+        return _speculator
@@ -0,0 +1,210 @@
+import hashlib
+import sqlite3
+import threading
+import logging
+import time
+from contextlib import ExitStack, contextmanager
+from typing import Dict, Iterable
+from pathlib import Path
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+logger = logging.getLogger(__name__)
+
+VERSION_INDEX_PATH = Path("./chroma_store") / "version_index.sqlite3"
+
+
+def split_versioned_id(versioned_id: str) -> str:
+    """Return the base_id part of a '{base_id}_ver{n}' id."""
+    return versioned_id.rsplit("_ver", 1)[0]
+
+
+def _lock_file(fh, shared: bool = False):
+    """Block until an OS-level lock on fh is held (exclusive unless shared)."""
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        return
+    # msvcrt has no shared locks, so shared holders serialize on Windows
+    fh.seek(0)
+    while True:
+        try:
+            msvcrt.locking(fh.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            time.sleep(0.05)
+
+
+def _unlock_file(fh):
+    if fcntl is not None:
+        fcntl.flock(fh.fileno(), fcntl.LOCK_UN)
+        return
+    fh.seek(0)
+    msvcrt.locking(fh.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class VersionIndex:
+    """Latest stored version per (base_id, stage), persisted in SQLite.
+
+    The index mirrors the metadata in ``books_collection`` so that version
+    lookups are primary-key reads instead of full collection scans.
+    """
+
+    def __init__(self, path: Path = VERSION_INDEX_PATH):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock_dir = self.path.parent / "locks"
+        self.lock_dir.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        self._thread_locks: Dict[str, threading.Lock] = {}
+        self._thread_locks_guard = threading.Lock()
+        conn = self._connect()
+        with conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS versions ("
+                " base_id TEXT NOT NULL,"
+                " stage TEXT NOT NULL,"
+                " version INTEGER NOT NULL,"
+                " PRIMARY KEY (base_id, stage)"
+                ") WITHOUT ROWID"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS index_meta ("
+                " key TEXT PRIMARY KEY,"
+                " value INTEGER NOT NULL"
+                ")"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        """One connection per thread; sqlite3 connections are not shareable."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=60)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _file_lock(self, name: str, shared: bool = False):
+        with open(self.lock_dir / f"{name}.lock", "a+b") as fh:
+            _lock_file(fh, shared)
+            try:
+                yield
+            finally:
+                _unlock_file(fh)
+
+    @contextmanager
+    def lock(self, *base_ids: str):
+        """Exclusive version allocation for the given base_ids across threads and processes.
+
+        Hold this while reading the next version, writing the document and
+        recording it, so concurrent writers never pick the same version and
+        a failed write leaves no gap. Several base_ids are locked in sorted
+        order, so concurrent batches cannot deadlock. Writers also share the
+        index-wide lock that ``exclusive`` takes for maintenance.
+        """
+        with ExitStack() as stack:
+            stack.enter_context(self._file_lock("index", shared=True))
+            for base_id in sorted(set(base_ids)):
+                with self._thread_locks_guard:
+                    thread_lock = self._thread_locks.setdefault(base_id, threading.Lock())
+                stack.enter_context(thread_lock)
+                stack.enter_context(self._file_lock(hashlib.sha1(base_id.encode("utf-8")).hexdigest()))
+            yield
+
+    @contextmanager
+    def exclusive(self):
+        """Wait until no writer is between allocating and recording a version, and keep new ones out."""
+        with self._file_lock("index"):
+            yield
+
+    def latest(self, base_id: str, stage: str) -> int:
+        """Highest version stored for base_id at the given stage, 0 if none."""
+        row = self._connect().execute(
+            "SELECT version FROM versions WHERE base_id = ? AND stage = ?",
+            (base_id, stage)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def latest_any(self, base_id: str) -> int:
+        """Highest version stored for base_id across all stages, 0 if none."""
+        row = self._connect().execute(
+            "SELECT MAX(version) FROM versions WHERE base_id = ?",
+            (base_id,)
+        ).fetchone()
+        return row[0] or 0
+
+    def stage_versions(self, base_id: str) -> Dict[str, int]:
+        """Latest version of every stage stored for base_id."""
+        rows = self._connect().execute(
+            "SELECT stage, version FROM versions WHERE base_id = ?",
+            (base_id,)
+        ).fetchall()
+        return dict(rows)
+
+    def data_version(self) -> int:
+        """Changes whenever another connection (thread or process) commits to the index."""
+        return self._connect().execute("PRAGMA data_version").fetchone()[0]
+
+    def next_version(self, base_id: str) -> int:
+        return self.latest_any(base_id) + 1
+
+    def record(self, base_id: str, stage: str, version: int):
+        """Register a newly stored version."""
+        conn = self._connect()
+        with conn:
+            self._record(conn, base_id, stage, version)
+
+    def record_many(self, records: Iterable[tuple]):
+        """Register several (base_id, stage, version) records in one transaction."""
+        conn = self._connect()
+        with conn:
+            for base_id, stage, version in records:
+                self._record(conn, base_id, stage, version)
+
+    def _record(self, conn: sqlite3.Connection, base_id: str, stage: str, version: int):
+        conn.execute(
+            "INSERT INTO versions (base_id, stage, version) VALUES (?, ?, ?) "
+            "ON CONFLICT (base_id, stage) DO UPDATE SET version = MAX(version, excluded.version)",
+            (base_id, stage, version)
+        )
+        conn.execute(
+            "INSERT INTO index_meta (key, value) VALUES ('document_count', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = value + 1"
+        )
+
+    def document_count(self) -> int:
+        """Number of stored documents the index has seen."""
+        row = self._connect().execute(
+            "SELECT value FROM index_meta WHERE key = 'document_count'"
+        ).fetchone()
+        return row[0] if row else 0
+
+    def rebuild(self, metadatas: Iterable[Dict]):
+        """Replace the index contents with the given collection metadata."""
+        latest: Dict[tuple, int] = {}
+        count = 0
+        for meta in metadatas:
+            count += 1
+            versioned_id = meta.get("versioned_id", "")
+            if not versioned_id or "version" not in meta:
+                continue
+            key = (split_versioned_id(versioned_id), meta.get("stage", ""))
+            latest[key] = max(latest.get(key, 0), int(meta["version"]))
+
+        conn = self._connect()
+        with conn:
+            conn.execute("DELETE FROM versions")
+            conn.executemany(
+                "INSERT INTO versions (base_id, stage, version) VALUES (?, ?, ?)",
+                [(base_id, stage, version) for (base_id, stage), version in latest.items()]
+            )
+            conn.execute(
+                "INSERT INTO index_meta (key, value) VALUES ('document_count', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (count,)
+            )
+        logger.info(f"Rebuilt version index from {count} documents")